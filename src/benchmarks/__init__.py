@@ -0,0 +1,20 @@
+""" Benchmarks for the API
+
+load.py drives the API with a mix of realistic scenarios at a set
+concurrency and reports the throughput and latency percentiles of
+each endpoint. The API is run against local stand-ins for the services
+it depends on, see docker-compose.bench.yml.
+
+Results are saved as JSON tagged with the git revision they were taken
+at, compare two results to find regressions, or benchmark two git
+revisions one after the other:
+
+    python -m benchmarks.load run --concurrency 32 --duration 60
+    python -m benchmarks.load compare base.json head.json
+    python -m benchmarks.load revisions main HEAD
+
+test_*.py are microbenchmarks of the functions on hot paths, run with
+pytest-benchmark against a saved baseline (see conftest.py):
+
+    pytest benchmarks --benchmark-compare
+"""
@@ -0,0 +1,44 @@
+""" Microbenchmarks of the primitives on hot paths
+
+Run with pytest-benchmark from src, results are compared with a
+baseline saved in benchmarks/baselines on the same kind of machine
+(pytest-benchmark keeps them by platform and interpreter):
+
+    pytest benchmarks --benchmark-save=baseline
+    pytest benchmarks --benchmark-compare
+
+Comparing fails the run if the median of a benchmark regressed by more
+than the tolerance, 10% unless given by --benchmark-tolerance or
+BENCHMARK_TOLERANCE, either a percentage or a number of seconds:
+
+    pytest benchmarks --benchmark-compare --benchmark-tolerance=5%
+
+Timings are only comparable on the same machine, save a baseline
+before a change and compare after it.
+"""
+import os
+
+from pytest_benchmark.utils import parse_compare_fail
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines")
+DEFAULT_STORAGE = "file://./.benchmarks"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark-tolerance",
+        default=os.environ.get("BENCHMARK_TOLERANCE", "10%"),
+        help="Regression of the median that fails a comparison e.g 10%%",
+    )
+
+
+def pytest_configure(config):
+    # Runs before pytest-benchmark sets up its session
+    if config.option.benchmark_storage == DEFAULT_STORAGE:
+        config.option.benchmark_storage = f"file://{BASELINES_PATH}"
+
+    if config.option.benchmark_compare and \
+            not config.option.benchmark_compare_fail:
+        config.option.benchmark_compare_fail = [parse_compare_fail(
+            f"median:{config.option.benchmark_tolerance}"
+        )]
@@ -0,0 +1,370 @@
+""" Load test of the API
+
+Virtual users, as many as the concurrency, each pick a scenario at
+random (see scenarios.py) and run it, then the next, until the
+duration is up. Requests made during the warm up (while connection
+pools fill and caches are populated) are not recorded.
+
+Start the stack, create an administrator and run:
+
+    docker compose -f docker-compose.bench.yml up --build --wait
+    docker compose -f docker-compose.bench.yml exec api \\
+        python -m benchmarks.load admin --email admin@example.com \\
+        --password secret
+    python -m benchmarks.load run --concurrency 32 --duration 60 \\
+        --admin-email admin@example.com --admin-password secret
+
+Weights of scenarios can be set, or a scenario left out with a weight
+of 0 e.g --scenario signup=0 --scenario me=20
+
+Compare two results, exits with 1 if an endpoint regressed by more
+than the tolerance:
+
+    python -m benchmarks.load compare base.json head.json --tolerance 0.1
+
+Or benchmark git revisions one after the other, each is checked out
+in a worktree and run on a fresh stack, the results are compared to
+those of the first:
+
+    python -m benchmarks.load revisions main HEAD
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+from .results import Recorder, compare, format_changes, git_revision, load,\
+    regressions, save
+from .scenarios import SCENARIOS, prepare
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results")
+COMPOSE_FILE = "docker-compose.bench.yml"
+
+ADMIN_EMAIL = "bench-admin@example.com"
+ADMIN_PASSWORD = "bench-admin-password-1234"
+
+
+async def run(
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    warmup: float = 5.0,
+    users: int = 50,
+    weights: Optional[dict[str, int]] = None,
+    admin_email: Optional[str] = None,
+    admin_password: Optional[str] = None,
+    timeout: float = 30.0,
+) -> dict:
+    """ Drive the API at base_url and return the results
+    """
+    revision, dirty = git_revision()
+    weights = {
+        name: scenario.weight for name, scenario in SCENARIOS.items()
+    } | (weights or {})
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+        ),
+    ) as client:
+        context = await prepare(client, users, admin_email, admin_password)
+
+        scenarios = [
+            SCENARIOS[name] for name, weight in weights.items()
+            if weight > 0 and (
+                context.admin_token or not SCENARIOS[name].needs_admin
+            )
+        ]
+        scenario_weights = [weights[scenario.name] for scenario in scenarios]
+
+        recorder = Recorder()
+        started = datetime.now(timezone.utc)
+        warm_at = time.perf_counter() + warmup
+        stop_at = warm_at + duration
+
+        async def virtual_user():
+            while (now := time.perf_counter()) < stop_at:
+                scenario = random.choices(scenarios, scenario_weights)[0]
+
+                try:
+                    response = await scenario.run(client, context)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+
+                if now >= warm_at:
+                    recorder.record(
+                        scenario.endpoint,
+                        time.perf_counter() - now,
+                        ok,
+                    )
+
+        await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+
+    return {
+        "revision": revision,
+        "dirty": dirty,
+        "started": started.isoformat(),
+        "duration": duration,
+        "concurrency": concurrency,
+        "weights": {
+            scenario.name: weight
+            for scenario, weight in zip(scenarios, scenario_weights)
+        },
+        "endpoints": recorder.summary(duration),
+    }
+
+
+async def create_admin(email: str, password: str) -> None:
+    """ Create an administrator, or make an existing account one
+
+    Run this where the database is reachable e.g the api container.
+    """
+    from labs.db import AsyncSessionFactory
+    from labs.models import User
+
+    async with AsyncSessionFactory() as session:
+        user = await User.get_by_email(session, email)
+
+        if user is None:
+            user = User(
+                email=email,
+                password=password,
+                first_name="Bench",
+                last_name="Admin",
+            )
+            session.add(user)
+        else:
+            user.password = password
+
+        user.is_admin = True
+        user.verified = True
+        await session.commit()
+
+
+def _print_results(results: dict) -> None:
+    print(
+        f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+
+    for endpoint, stats in results["endpoints"].items():
+        print(
+            f"{endpoint:<20} {stats['requests']:>9} {stats['errors']:>7} "
+            f"{stats['throughput']:>9.1f} {stats['p50'] * 1000:>8.1f} "
+            f"{stats['p95'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f}"
+        )
+
+
+def _compare(base_path: str, head_path: str, tolerance: float) -> int:
+    changes = compare(load(base_path), load(head_path))
+    print(format_changes(changes, tolerance))
+
+    return 1 if regressions(changes, tolerance) else 0
+
+
+def _revisions(revisions: list[str], args: argparse.Namespace) -> int:
+    """ Benchmark each revision on a fresh stack and compare to the first
+    """
+    root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    environment = os.environ | {
+        "PROJ_NAME": os.environ.get("PROJ_NAME", "labs"),
+        # The harness of this tree is used for every revision
+        "BENCH_PATH": os.path.dirname(os.path.abspath(__file__)),
+    }
+    os.makedirs(RESULTS_PATH, exist_ok=True)
+    paths = []
+
+    for revision in revisions:
+        workspace = tempfile.mkdtemp(prefix="bench-")
+        worktree = os.path.join(workspace, "tree")
+        compose = [
+            "docker", "compose",
+            "-f", os.path.join(root, COMPOSE_FILE),
+            "--project-directory", worktree,
+            "-p", os.path.basename(workspace).lower(),
+        ]
+
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, revision],
+            cwd=root,
+            check=True,
+        )
+
+        try:
+            subprocess.run(
+                [*compose, "up", "--build", "--wait", "-d"],
+                env=environment,
+                check=True,
+            )
+            subprocess.run(
+                [
+                    *compose, "exec", "-T", "api",
+                    "python", "-m", "benchmarks.load", "admin",
+                    "--email", ADMIN_EMAIL,
+                    "--password", ADMIN_PASSWORD,
+                ],
+                env=environment,
+                check=True,
+            )
+
+            results = asyncio.run(run(
+                args.base_url,
+                args.concurrency,
+                args.duration,
+                warmup=args.warmup,
+                users=args.users,
+                weights=args.weights,
+                admin_email=ADMIN_EMAIL,
+                admin_password=ADMIN_PASSWORD,
+            ))
+            results["revision"], results["dirty"] = git_revision(worktree)
+        finally:
+            subprocess.run([*compose, "down", "-v"], env=environment)
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree],
+                cwd=root,
+            )
+            shutil.rmtree(workspace, ignore_errors=True)
+
+        path = os.path.join(RESULTS_PATH, f"{results['revision'][:12]}.json")
+        save(results, path)
+        paths.append(path)
+
+        print(f"{revision} ({results['revision'][:12]})")
+        _print_results(results)
+
+    status = 0
+
+    for path in paths[1:]:
+        print(f"\n{paths[0]} -> {path}")
+        status |= _compare(paths[0], path, args.tolerance)
+
+    return status
+
+
+def _weight(value: str) -> tuple[str, int]:
+    name, _, weight = value.partition("=")
+
+    if name not in SCENARIOS or not weight.isdigit():
+        raise argparse.ArgumentTypeError(
+            f"expected one of {', '.join(SCENARIOS)}=<weight>"
+        )
+
+    return name, int(weight)
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load",
+        description="Load test the API",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load_options = argparse.ArgumentParser(add_help=False)
+    load_options.add_argument("--base-url", default="http://localhost:8000")
+    load_options.add_argument("--concurrency", type=int, default=16)
+    load_options.add_argument(
+        "--duration", type=float, default=30.0,
+        help="Seconds to record for, after the warm up",
+    )
+    load_options.add_argument("--warmup", type=float, default=5.0)
+    load_options.add_argument(
+        "--users", type=int, default=50,
+        help="Accounts to sign up before the run",
+    )
+    load_options.add_argument(
+        "--scenario", dest="weights", type=_weight, action="append",
+        metavar="NAME=WEIGHT",
+    )
+
+    compare_options = argparse.ArgumentParser(add_help=False)
+    compare_options.add_argument(
+        "--tolerance", type=float, default=0.1,
+        help="Change for the worse that is a regression, 0.1 is 10%%",
+    )
+
+    run_command = commands.add_parser("run", parents=[load_options])
+    run_command.add_argument("--admin-email")
+    run_command.add_argument("--admin-password")
+    run_command.add_argument(
+        "--output",
+        help="Path to save the results to, by default in results/",
+    )
+
+    compare_command = commands.add_parser("compare", parents=[compare_options])
+    compare_command.add_argument("base")
+    compare_command.add_argument("head")
+
+    revisions_command = commands.add_parser(
+        "revisions",
+        parents=[load_options, compare_options],
+    )
+    revisions_command.add_argument("revisions", nargs="+")
+
+    admin_command = commands.add_parser("admin")
+    admin_command.add_argument("--email", default=ADMIN_EMAIL)
+    admin_command.add_argument("--password", default=ADMIN_PASSWORD)
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parser().parse_args(argv)
+
+    if getattr(args, "weights", None) is not None:
+        args.weights = dict(args.weights)
+
+    if args.command == "admin":
+        asyncio.run(create_admin(args.email, args.password))
+        return 0
+
+    if args.command == "compare":
+        return _compare(args.base, args.head, args.tolerance)
+
+    if args.command == "revisions":
+        return _revisions(args.revisions, args)
+
+    results = asyncio.run(run(
+        args.base_url,
+        args.concurrency,
+        args.duration,
+        warmup=args.warmup,
+        users=args.users,
+        weights=args.weights,
+        admin_email=args.admin_email,
+        admin_password=args.admin_password,
+    ))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        output = os.path.join(RESULTS_PATH, f"{results['revision'][:12]}.json")
+
+    save(results, output)
+    _print_results(results)
+    print(f"\nSaved to {output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
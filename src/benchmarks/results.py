@@ -0,0 +1,165 @@
+""" Results of a load test and comparisons between them
+
+Latencies are kept for every request so the percentiles are exact,
+a run of a few minutes records a few hundred thousand floats.
+
+Results are saved as JSON with the revision they were taken at:
+
+    {
+        "revision": "8864750...",
+        "dirty": false,
+        "started": "2026-10-19T10:00:00+00:00",
+        "duration": 60.0,
+        "concurrency": 32,
+        "endpoints": {
+            "GET /me": {
+                "requests": 51234, "errors": 0, "throughput": 853.9,
+                "mean": 0.0123, "p50": 0.0101, "p95": 0.0302,
+                "p99": 0.0544, "max": 0.201
+            }
+        }
+    }
+
+Latencies are in seconds and throughput in requests per second.
+"""
+import json
+import math
+import subprocess
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+PERCENTILES = ("p50", "p95", "p99")
+
+
+def percentile(ordered: list[float], rank: float) -> float:
+    """ Nearest rank percentile of values sorted in ascending order
+    """
+    if not ordered:
+        return 0.0
+
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Recorder:
+    """ Latencies and errors of requests by endpoint
+    """
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, latency: float, ok: bool) -> None:
+        self.latencies[endpoint].append(latency)
+
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, duration: float) -> dict[str, dict]:
+        endpoints = {}
+
+        for endpoint, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            endpoints[endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors[endpoint],
+                "throughput": len(ordered) / duration,
+                "mean": sum(ordered) / len(ordered),
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1],
+            }
+
+        return endpoints
+
+
+def git_revision(path: Optional[str] = None) -> tuple[str, bool]:
+    """ The commit checked out at path and whether there are changes
+    """
+    def git(*args) -> str:
+        return subprocess.run(
+            ["git", *args],
+            cwd=path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    try:
+        return git("rev-parse", "HEAD"), bool(git("status", "--porcelain"))
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def save(results: dict, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+class Change(NamedTuple):
+    endpoint: str
+    metric: str
+    base: float
+    head: float
+
+    @property
+    def ratio(self) -> float:
+        return self.head / self.base - 1 if self.base else 0.0
+
+    @property
+    def is_regression(self) -> bool:
+        # Higher is better for throughput, lower for latencies
+        return self.ratio < 0 if self.metric == "throughput" else self.ratio > 0
+
+
+def compare(base: dict, head: dict) -> list[Change]:
+    """ Changes in throughput and latencies of endpoints in both results
+    """
+    changes = []
+
+    for endpoint, head_stats in head["endpoints"].items():
+        base_stats = base["endpoints"].get(endpoint)
+
+        if base_stats is None:
+            continue
+
+        for metric in ("throughput", *PERCENTILES):
+            changes.append(Change(
+                endpoint,
+                metric,
+                base_stats[metric],
+                head_stats[metric],
+            ))
+
+    return changes
+
+
+def regressions(changes: list[Change], tolerance: float) -> list[Change]:
+    """ Changes for the worse by more than the tolerance e.g 0.1 for 10%
+    """
+    return [
+        change for change in changes
+        if change.is_regression and abs(change.ratio) > tolerance
+    ]
+
+
+def format_changes(changes: list[Change], tolerance: float) -> str:
+    lines = [
+        f"{'endpoint':<20} {'metric':<10} {'base':>10} {'head':>10} {'change':>8}"
+    ]
+
+    for change in changes:
+        flag = " !" if change in regressions([change], tolerance) else ""
+        lines.append(
+            f"{change.endpoint:<20} {change.metric:<10} "
+            f"{change.base:>10.4f} {change.head:>10.4f} "
+            f"{change.ratio:>+8.1%}{flag}"
+        )
+
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+""" Scenarios that the load test drives the API with
+
+Each scenario makes one request as a client of the API would, and is
+picked at random in proportion to its weight, the default weights are
+a guess at the mix of a typical day. Latencies are reported by the
+endpoint (method and route) rather than the scenario.
+
+Scenarios that need a signed in user use one of the accounts created
+by prepare, the admin scenario needs an administrator (see the admin
+command of load.py) and is left out without one.
+"""
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import httpx
+
+PASSWORD = "bench-password-1234"
+
+
+@dataclass
+class Context:
+    """ Accounts shared by the virtual users of a run """
+    users: list[tuple[str, str]] = field(default_factory=list)  # email, token
+    admin_token: Optional[str] = None
+
+    def user(self) -> tuple[str, str]:
+        return random.choice(self.users)
+
+
+class Scenario(NamedTuple):
+    name: str
+    endpoint: str
+    weight: int
+    run: Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+    needs_admin: bool = False
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _email() -> str:
+    return f"bench-{uuid.uuid4().hex}@example.com"
+
+
+async def signup(client: httpx.AsyncClient, email: str) -> httpx.Response:
+    return await client.post("/signup", json={
+        "email": email,
+        "password": PASSWORD,
+        "firstName": "Bench",
+        "lastName": "Mark",
+    })
+
+
+async def login(
+    client: httpx.AsyncClient,
+    email: str,
+    password: str = PASSWORD,
+) -> httpx.Response:
+    return await client.post("/token", data={
+        "username": email,
+        "password": password,
+    })
+
+
+async def run_signup(client: httpx.AsyncClient, context: Context):
+    return await signup(client, _email())
+
+
+async def run_login(client: httpx.AsyncClient, context: Context):
+    email, _ = context.user()
+    return await login(client, email)
+
+
+async def run_me(client: httpx.AsyncClient, context: Context):
+    _, token = context.user()
+    return await client.get("/me", headers=_bearer(token))
+
+
+async def run_admin_users(client: httpx.AsyncClient, context: Context):
+    return await client.get(
+        "/users",
+        params={"offset": random.randrange(0, 1000, 100), "limit": 100},
+        headers=_bearer(context.admin_token),
+    )
+
+
+async def run_upload_intent(client: httpx.AsyncClient, context: Context):
+    _, token = context.user()
+    return await client.post(
+        "/upload",
+        json={
+            "fileName": f"{uuid.uuid4().hex}.jpg",
+            "fileSize": random.randint(1024, 10 * 1024 * 1024),
+            "mimeType": "image/jpeg",
+        },
+        headers=_bearer(token),
+    )
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("signup", "POST /signup", 1, run_signup),
+        Scenario("login", "POST /token", 2, run_login),
+        Scenario("me", "GET /me", 10, run_me),
+        Scenario(
+            "admin_users",
+            "GET /users",
+            2,
+            run_admin_users,
+            needs_admin=True,
+        ),
+        Scenario("upload_intent", "POST /upload", 4, run_upload_intent),
+    )
+}
+
+
+async def prepare(
+    client: httpx.AsyncClient,
+    users: int,
+    admin_email: Optional[str] = None,
+    admin_password: Optional[str] = None,
+    concurrency: int = 8,
+) -> Context:
+    """ Sign up and sign in the accounts the scenarios use
+    """
+    context = Context()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def account() -> tuple[str, str]:
+        email = _email()
+
+        async with semaphore:
+            (await signup(client, email)).raise_for_status()
+            response = await login(client, email)
+            response.raise_for_status()
+
+        return email, response.json()["access_token"]
+
+    context.users = await asyncio.gather(*(account() for _ in range(users)))
+
+    if admin_email:
+        response = await login(client, admin_email, admin_password)
+        response.raise_for_status()
+        context.admin_token = response.json()["access_token"]
+
+    return context
@@ -0,0 +1,148 @@
+""" Primitives that requests spend their CPU time in
+
+Each benchmark runs the function as it is called while serving a
+request, with inputs of a realistic size.
+"""
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from pydantic import TypeAdapter
+
+from labs.dto import UserResponse, user_rows
+from labs.dto.utils import to_lower_camel
+from labs.models import User
+from labs.models.s3 import assign_s3_key
+from labs.settings import settings
+from labs.utils.auth import create_access_token, hash_password,\
+    verify_password
+
+PASSWORD = "correct horse battery staple"
+
+# bcrypt takes hundreds of milliseconds by design, a few rounds are
+# enough to measure it
+BCRYPT_ROUNDS = 5
+
+
+@pytest.fixture(scope="module")
+def hashed_password():
+    return hash_password(PASSWORD)
+
+
+@pytest.fixture(scope="module")
+def users():
+    """ A page of users as loaded by the ORM """
+    now = datetime.now(timezone.utc)
+    users = []
+
+    for index in range(100):
+        user = User(
+            email=f"user{index}@example.com",
+            first_name="Bench",
+            last_name=f"Mark {index}",
+        )
+        user.id = uuid.uuid4()
+        user.mobile_number = None
+        user.verified = True
+        user.created_at = now
+        user.updated_at = now
+        users.append(user)
+
+    return users
+
+
+def test_hash_password(benchmark):
+    benchmark.pedantic(hash_password, args=(PASSWORD,), rounds=BCRYPT_ROUNDS)
+
+
+def test_verify_password(benchmark, hashed_password):
+    assert benchmark.pedantic(
+        verify_password,
+        args=(PASSWORD, hashed_password),
+        rounds=BCRYPT_ROUNDS,
+    )
+
+
+def test_create_access_token(benchmark):
+    benchmark(create_access_token, str(uuid.uuid4()), fresh=True)
+
+
+def test_decode_access_token(benchmark):
+    token = create_access_token(str(uuid.uuid4()))
+
+    payload = benchmark(
+        jwt.decode,
+        token,
+        settings.jwt.secret_key.get_secret_value(),
+        algorithms=[settings.jwt.algorithm],
+    )
+    assert "sub" in payload
+
+
+def test_to_lower_camel(benchmark):
+    fields = [
+        name
+        for model in (UserResponse,)
+        for name in model.model_fields
+    ] + ["presigned_upload_url", "upload_required", "file_name"]
+
+    def aliases():
+        return [to_lower_camel(name) for name in fields]
+
+    assert "firstName" in benchmark(aliases)
+
+
+def test_serialise_users(benchmark, users):
+    # As FastAPI validates and serialises the return of an endpoint
+    adapter = TypeAdapter(list[UserResponse])
+
+    def serialise():
+        return adapter.dump_json(
+            adapter.validate_python(users, from_attributes=True),
+            by_alias=True,
+        )
+
+    assert b"firstName" in benchmark(serialise)
+
+
+def test_serialise_user_rows(benchmark, users):
+    # As the users page serialises the rows it loads
+    rows = [
+        tuple(getattr(user, column) for column in user_rows.columns)
+        for user in users
+    ]
+
+    assert b"firstName" in benchmark(user_rows.dump_json, rows)
+
+
+def test_assign_s3_key(benchmark):
+    target = SimpleNamespace()
+    kwargs = {"file_name": "holiday photo.jpeg", "prefix": "avatars"}
+
+    benchmark(assign_s3_key, target, (), kwargs)
+    assert target.s3_key.endswith(".jpeg")
+
+
+def test_totp_now(benchmark, users):
+    user = users[0]
+
+    token = benchmark(
+        user.get_otp,
+        settings.verbosity.totp,
+        settings.lifetime.totp_token,
+    )
+    assert len(token) == settings.verbosity.totp
+
+
+def test_totp_verify(benchmark, users):
+    user = users[0]
+    token = user.get_otp(timeout=settings.lifetime.totp_token)
+
+    assert benchmark(
+        user.verify_otp,
+        token,
+        settings.lifetime.totp_token,
+        settings.lifetime.totp_drift_window,
+    )
@@ -17,9 +17,16 @@ from fastapi import FastAPI, Request, status, WebSocket
 from fastapi.routing import APIRoute
 
 from .settings import settings
+from .metrics import metrics_app
+from .tracing import configure_tracing, instrument_app, shutdown_tracing
+from .middleware import PrometheusMiddleware, QueryProfilerMiddleware,\
+    record_queries
+from .db import engine
 
 from .routers import router_root
 from .broker import broker
+from .utils import async_storage
+from .watchdog import loop_watchdog
 
 from .dto.ext import RootResponse
 
@@ -41,16 +48,29 @@ def generate_operation_id(route: APIRoute) -> str:
 
 @asynccontextmanager
 async def lifespan(_fastapi: FastAPI):
-    if broker.is_worker_process:
-        # TaskIQ configurartion so we can share FastAPI dependencies in tasks
+    # Workers start the broker themselves, the API has to start it
+    # so handlers can publish tasks
+    if not broker.is_worker_process:
         await broker.startup()
-    
+
+    # Reports calls that block the loop, see watchdog.py
+    if settings.watchdog.enabled:
+        loop_watchdog.start()
+
     yield
 
-    if broker.is_worker_process:
+    await loop_watchdog.stop()
+
+    if not broker.is_worker_process:
         # On shutdown, we need to shutdown the broker
         await broker.shutdown()
 
+    # Release the pooled connections to the object store
+    await async_storage.close()
+
+    if not broker.is_worker_process:
+        shutdown_tracing()
+
 
 """A FastAPI application that serves handlers
 """
@@ -80,6 +100,24 @@ async def websocket_endpoint(websocket: WebSocket):
 # Additional routers of the application described in the routers package
 app.include_router(router_root)
 
+# Prometheus metrics defined in metrics.py, requests are recorded
+# by the middleware (see middleware/prometheus.py)
+app.add_middleware(PrometheusMiddleware)
+app.mount("/metrics", metrics_app())
+
+# Statements run by each request, see middleware/queries.py
+if settings.profiler.sql_enabled:
+    record_queries(engine)
+    app.add_middleware(
+        QueryProfilerMiddleware,
+        repeat_threshold=settings.profiler.sql_repeat_threshold,
+    )
+
+# Spans of requests, statements and tasks, see tracing.py
+if settings.tracing.enabled:
+    configure_tracing()
+    instrument_app(app)
+
 
 # Default handler
 @app.get(
@@ -1,7 +1,9 @@
 """ TaskIQ broker configuration
 
 """
+import logging
 import os
+from typing import Optional
 
 from .settings import settings
 
@@ -13,6 +15,11 @@ from taskiq_redis import RedisAsyncResultBackend
 
 # RabbitMQ is recommended as the broker
 from taskiq_aio_pika import AioPikaBroker
+from taskiq_aio_pika.broker import parse_val
+from taskiq import BrokerMessage
+from aio_pika import DeliveryMode, ExchangeType, Message
+from opentelemetry import propagate
+from opentelemetry.trace import SpanKind
 
 # Task Scheduler for periodic tasks
 from taskiq.schedule_sources import LabelScheduleSource
@@ -25,13 +32,144 @@ from taskiq import SimpleRetryMiddleware
 import taskiq_fastapi
 
 from .settings import settings
+from .middleware import (
+    IdempotencyMiddleware,
+    InstrumentationMiddleware,
+    RecycleMiddleware,
+    TracingMiddleware,
+)
+from .middleware.idempotency import is_duplicate
+from .publisher import PublisherPool
+from .metrics import broker_kick_seconds
+from .tracing import configure_tracing, shutdown_tracing, tracer
+from .imaging import shutdown_image_executor
+from .watchdog import loop_watchdog
+
+logger = logging.getLogger(__name__)
+
+
+class AppBroker(AioPikaBroker):
+    """ AioPika broker with application specific behaviour
+
+    Messages that a middleware has marked as duplicates (see
+    middleware/idempotency.py) are not published, the caller
+    still receives a handle to the original task. Messages that
+    fail to publish release their idempotency key.
+
+    In API processes messages are published via a pool of channels
+    that confirm in batches (see publisher.py), workers and delayed
+    messages use the single channel provided by AioPikaBroker.
+    """
+
+    publisher_pool: Optional[PublisherPool] = None
+
+    async def startup(self) -> None:
+        if settings.tracing.enabled and self.is_worker_process:
+            configure_tracing(f"{settings.tracing.service_name}-worker")
+
+        await super().startup()
+
+        if settings.watchdog.enabled and self.is_worker_process:
+            loop_watchdog.start()
+
+        if settings.publisher.enabled and not self.is_worker_process:
+            self.publisher_pool = PublisherPool(
+                self.write_conn,
+                self._exchange_name,
+            )
+            await self.publisher_pool.start()
+
+    async def shutdown(self) -> None:
+        if self.publisher_pool:
+            await self.publisher_pool.stop()
+            self.publisher_pool = None
+
+        shutdown_image_executor()
+
+        if self.is_worker_process:
+            await loop_watchdog.stop()
+
+        await super().shutdown()
+
+        if self.is_worker_process:
+            shutdown_tracing()
+
+    async def kick(self, message: BrokerMessage) -> None:
+        if is_duplicate(message.labels):
+            return
+
+        pooled = (
+            self.publisher_pool is not None
+            and message.labels.get("delay") is None
+        )
+
+        with tracer.start_as_current_span(
+            f"send {message.task_name}",
+            context=propagate.extract(message.labels),
+            kind=SpanKind.PRODUCER,
+            attributes={
+                "messaging.system": "rabbitmq",
+                "messaging.message.id": message.task_id,
+                "taskiq.task_name": message.task_name,
+            },
+        ), broker_kick_seconds.labels(
+            "pooled" if pooled else "direct"
+        ).time():
+            try:
+                if pooled:
+                    await self._kick_pooled(message)
+                else:
+                    await super().kick(message)
+            except Exception:
+                await self._release(message)
+                raise
+
+    async def _release(self, message: BrokerMessage) -> None:
+        for middleware in self.middlewares:
+            if not isinstance(middleware, IdempotencyMiddleware):
+                continue
+
+            try:
+                await middleware.release(message)
+            except Exception:
+                # The key then expires at the end of the window
+                logger.exception(
+                    "Failed to release the idempotency key of task %s",
+                    message.task_id,
+                )
+
+    async def _kick_pooled(self, message: BrokerMessage) -> None:
+        # Mirrors how AioPikaBroker.kick builds the message
+        rmq_message = Message(
+            body=message.message,
+            headers={
+                "task_id": message.task_id,
+                "task_name": message.task_name,
+                **message.labels,
+            },
+            delivery_mode=DeliveryMode.PERSISTENT,
+            priority=parse_val(int, message.labels.get("priority")),
+        )
+
+        routing_key = message.task_name
+        # Because direct exchange uses exact routing key for routing
+        if self._exchange_type == ExchangeType.DIRECT:
+            routing_key = self._routing_key
+
+        await self.publisher_pool.publish(rmq_message, routing_key)
+
 
 redis_result_backend = RedisAsyncResultBackend(
     str(settings.redis.dsn)
 )
 
 broker = (
-    AioPikaBroker(str(settings.amqp.dsn),)
+    AppBroker(
+        str(settings.amqp.dsn),
+        queue_name=settings.amqp.queue_name,
+        # Messages RabbitMQ delivers to a worker before they are acked
+        qos=settings.worker.prefetch,
+    )
     .with_result_backend(redis_result_backend)
 )
 
@@ -46,11 +184,28 @@ broker = (
 # is configured to retry tasks 3 times before failing you can override this
 # https://bit.ly/3LLyH9M
 broker.add_middlewares(
+    # Carries the trace context from senders to workers and traces
+    # the tasks that are run, see middleware/tracing.py
+    TracingMiddleware(),
     SimpleRetryMiddleware(
         default_retry_count=settings.lifetime.queue_retry_count
-    )
+    ),
+    # Drops duplicate enqueues of tasks that are labelled with
+    # an idempotency_key, see middleware/idempotency.py
+    IdempotencyMiddleware(
+        str(settings.redis.dsn),
+        window=settings.lifetime.queue_idempotency_window,
+    ),
+    # Queue wait, run time, outcome and retries of tasks
+    InstrumentationMiddleware(),
 )
 
+# Workers recycle themselves if they go over the memory limit
+if settings.worker.max_rss_mb:
+    broker.add_middlewares(
+        RecycleMiddleware(settings.worker.max_rss_mb)
+    )
+
 scheduler = TaskiqScheduler(
     broker=broker,
     sources=[
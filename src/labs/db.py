@@ -7,6 +7,7 @@
 """
 
 from typing import AsyncGenerator
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine,\
     AsyncSession, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase,\
@@ -14,6 +15,8 @@ from sqlalchemy.orm import DeclarativeBase,\
 
 
 from .settings import settings
+from .metrics import db_pool_size, db_pool_checked_out, db_pool_overflow,\
+    db_pool_checkouts, db_pool_connects
 
 # SQLAlchemy engine that connects to Postgres
 engine = create_async_engine(
@@ -21,6 +24,37 @@ engine = create_async_engine(
     echo=True
 )
 
+
+# Pool statistics are recorded as connections move in and out of the
+# pool, rather than when metrics are collected, so they can be summed
+# across processes in multiprocess mode (see metrics.py)
+db_pool_size.set(engine.pool.size())
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _record_connect(dbapi_connection, connection_record):
+    db_pool_connects.inc()
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _record_checkout(dbapi_connection, connection_record, connection_proxy):
+    db_pool_checkouts.inc()
+    db_pool_checked_out.inc()
+    db_pool_overflow.set(max(engine.pool.overflow(), 0))
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _record_checkin(dbapi_connection, connection_record):
+    db_pool_checked_out.dec()
+    db_pool_overflow.set(max(engine.pool.overflow(), 0))
+
+
+@event.listens_for(engine.sync_engine, "detach")
+def _record_detach(dbapi_connection, connection_record):
+    # Detached connections are no longer returned to the pool
+    db_pool_checked_out.dec()
+
+
 # Configure mapping from classes
 configure_mappers()
 
@@ -9,4 +9,5 @@ from .user import *
 from .auth import *
 from .ext import *
 from .upload import *
+from .admin import *
 
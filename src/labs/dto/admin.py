@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+
+
+class HeapAllocation(BaseModel):
+    """ Memory allocated by a line over the length of a profile
+
+    Sizes are in bytes, the diffs are the growth since the profile
+    started and are negative where memory was freed.
+    """
+    file: str
+    line: int
+    size: int
+    size_diff: int
+    count: int
+    count_diff: int
+
+
+class HeapProfileResponse(BaseModel):
+    """ Lines that allocated the most in a process, largest first """
+    pid: int
+    seconds: float
+    allocations: list[HeapAllocation]
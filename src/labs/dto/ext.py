@@ -1,12 +1,24 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class EchoResponse(BaseModel):
     """ A simple echo response """
     message: str
 
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ProbeResponse(BaseModel):
+    """ Outcome of checking a service, latency is in seconds """
+    ok: bool
+    latency: float
+    error: Optional[str] = None
+
+
 class HealthCheckResponse(BaseModel):
     """ Provides a health check response with a timestamp
 
@@ -17,7 +29,17 @@ class HealthCheckResponse(BaseModel):
     all_ok: bool = False
     db_ok: bool = False
     queue_ok: bool = False
-    timestamp: datetime = datetime.now()
+    redis_ok: bool = False
+    storage_ok: bool = False
+    checks: dict[str, ProbeResponse] = {}
+    timestamp: datetime = Field(default_factory=_now)
+
+
+class LivenessResponse(BaseModel):
+    """ The process is running and serving requests """
+    alive: bool = True
+    timestamp: datetime = Field(default_factory=_now)
+
 
 class RootResponse(BaseModel):
     """ Response sent by the root endpoint
@@ -1,9 +1,25 @@
+from typing import Optional
+from uuid import UUID
+
+from pydantic import Field
+
 from .utils import AppBaseModel
 
 class FileUploadResponse(
     AppBaseModel
 ):
-    presigned_upload_url: str
+    """ Where to upload the file to
+
+    upload_required is False where the same content has already been
+    uploaded, there is no link and nothing needs to be uploaded.
+
+    Where upload_headers are given the upload must send them, they are
+    signed into the link (e.g the checksum of content addressed files).
+    """
+    id: UUID
+    presigned_upload_url: Optional[str] = None
+    upload_headers: Optional[dict[str, str]] = None
+    upload_required: bool = True
     expires: int
 
 
@@ -12,4 +28,54 @@ class FileUploadRequest(
 ):
     file_name: str
     file_size: int
-    mime_type: str
\ No newline at end of file
+    mime_type: str
+    # Configured bucket to store the file in, e.g media (S3_BUCKETS)
+    purpose: Optional[str] = None
+    # Hex digest of the content, enables deduplication of uploads
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+
+
+class UploadPart(
+    AppBaseModel
+):
+    part_number: int
+    presigned_upload_url: str
+
+
+class UploadedPart(
+    AppBaseModel
+):
+    part_number: int
+    etag: str
+    size: Optional[int] = None
+
+
+class MultipartUploadResponse(
+    AppBaseModel
+):
+    """ Links to upload the parts that are yet to be uploaded
+
+    Parts already in the store are listed in uploaded_parts so an
+    interrupted upload can resume where it stopped.
+    """
+    id: UUID
+    part_size: int
+    part_count: int
+    parts: list[UploadPart]
+    uploaded_parts: list[UploadedPart] = []
+    expires: int
+
+
+class MultipartCompleteRequest(
+    AppBaseModel
+):
+    """ Parts to assemble, all uploaded parts are used if omitted
+    """
+    parts: Optional[list[UploadedPart]] = None
+
+
+class UploadStateResponse(
+    AppBaseModel
+):
+    id: UUID
+    upload_state: str
@@ -1,7 +1,7 @@
 from typing import Optional
 
 from .utils import AppBaseModel,\
-    IdentityMixin, DateTimeMixin
+    IdentityMixin, DateTimeMixin, RowSerializer
 
 class UserRequest(
     AppBaseModel
@@ -27,3 +27,6 @@ class UserResponse(
     first_name: Optional[str]
     last_name: Optional[str]
 
+
+# Pages of users are serialised from rows (see routers/users)
+user_rows = RowSerializer(UserResponse)
@@ -14,19 +14,35 @@ reference the configuration and can simply provide the template information
 Redmail docs are located at https://red-mail.readthedocs.io/
 """
 import os
+from opentelemetry.trace import SpanKind
 from redmail.email.sender import EmailSender
 
 from .settings import settings
+from .tracing import tracer
 
 # Custom factory to be able to set the sender globally
 class EmailSenderFactory(EmailSender):
+
+    def send(self, *args, **kwargs):
+        """ Sends are traced, connecting and sending can be slow
+        """
+        with tracer.start_as_current_span(
+            "smtp send",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "server.address": self.host,
+                "server.port": self.port,
+            },
+        ):
+            return super().send(*args, **kwargs)
+
     @property
     def sender(self):
-        return self.sender
+        return self._sender
     
     @sender.setter
     def sender(self, sender: str):
-        self.sender = sender
+        self._sender = sender
 
 
 sender = EmailSenderFactory(
@@ -0,0 +1,32 @@
+""" Gunicorn configuration for the API
+
+Used in production where the API runs as several worker processes,
+see docker-compose.prod.yml:
+    gunicorn --config=python:labs.gunicorn labs.api:app
+
+Metrics are recorded in multiprocess mode (see metrics.py), the
+directory is prepared before the workers are started and the samples
+of workers that exit are discarded from the gauges.
+"""
+import os
+import shutil
+from tempfile import gettempdir
+
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    metrics_path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(gettempdir(), f"{__package__}_api_metrics"),
+    )
+
+    # Files left behind by a previous run would be counted again
+    shutil.rmtree(metrics_path, ignore_errors=True)
+    os.makedirs(metrics_path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,160 @@
+""" Checks of the services the application depends on
+
+Readiness means every service the API needs to serve a request can
+be reached, a replica that is not ready is taken out of the load
+balancer until it recovers. Each service is probed concurrently with
+a timeout of its own, so a service that hangs can't hold up the
+report on the others.
+
+Results are cached for a short while and concurrent callers share a
+single round of probes, the cost of checking is constant no matter
+how often replicas are probed.
+
+Usage:
+    from labs.health import readiness
+
+    results = await readiness.check()
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from .broker import broker, redis_result_backend
+from .db import engine
+from .settings import settings
+from .utils import async_storage
+
+
+class ProbeResult(NamedTuple):
+    """ Outcome of probing a service
+    """
+    ok: bool
+    latency: float  # In seconds
+    error: Optional[str] = None
+
+
+Probe = Callable[[], Awaitable[None]]
+
+
+class HealthCheck:
+    """ Probes services concurrently and caches the results
+
+    A probe is a coroutine function that returns if the service is
+    available and raises otherwise.
+    """
+
+    def __init__(
+        self,
+        probes: dict[str, Probe],
+        timeout: float = 2.0,
+        cache_ttl: float = 5.0,
+    ) -> None:
+        self.probes = probes
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+
+        self._results: Optional[dict[str, ProbeResult]] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _probe(self, probe: Probe) -> ProbeResult:
+        started = time.perf_counter()
+
+        try:
+            await asyncio.wait_for(probe(), self.timeout)
+        except asyncio.TimeoutError:
+            return ProbeResult(
+                ok=False,
+                latency=time.perf_counter() - started,
+                error=f"Timed out after {self.timeout}s",
+            )
+        except Exception as e:
+            return ProbeResult(
+                ok=False,
+                latency=time.perf_counter() - started,
+                error=f"{type(e).__name__}: {e}",
+            )
+
+        return ProbeResult(ok=True, latency=time.perf_counter() - started)
+
+    def _fresh(self) -> bool:
+        return (
+            self._results is not None and
+            time.monotonic() - self._checked_at < self.cache_ttl
+        )
+
+    async def check(self) -> dict[str, ProbeResult]:
+        """ Result of each probe, from the cache if it's fresh
+        """
+        if self._fresh():
+            return self._results
+
+        # Callers that arrive while probes are running wait for them
+        # and use their results rather than probing again
+        async with self._lock:
+            if self._fresh():
+                return self._results
+
+            names = list(self.probes)
+            results = await asyncio.gather(*(
+                self._probe(self.probes[name]) for name in names
+            ))
+
+            self._results = dict(zip(names, results))
+            self._checked_at = time.monotonic()
+
+        return self._results
+
+
+async def probe_db() -> None:
+    """ A round trip to Postgres on a pooled connection
+    """
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def probe_queue() -> None:
+    """ The broker's connection to RabbitMQ is open
+
+    Connections are robust and reconnect by themselves, while they
+    are reconnecting tasks can't be published. The in memory broker
+    used by tests has no connection and is always available.
+    """
+    if not hasattr(broker, "write_conn"):
+        return
+
+    connection = broker.write_conn
+
+    if connection is None or connection.is_closed:
+        raise ConnectionError("Broker is not connected")
+
+    await connection.ready()
+
+
+async def probe_redis() -> None:
+    """ A PING on the pool of the result backend
+    """
+    from redis.asyncio import Redis
+
+    async with Redis(connection_pool=redis_result_backend.redis_pool) as redis:
+        await redis.ping()
+
+
+async def probe_storage() -> None:
+    """ The default bucket can be reached
+    """
+    await async_storage.head_bucket(settings.storage.bucket_name)
+
+
+readiness = HealthCheck(
+    {
+        "db": probe_db,
+        "queue": probe_queue,
+        "redis": probe_redis,
+        "storage": probe_storage,
+    },
+    timeout=settings.health.timeout,
+    cache_ttl=settings.health.cache_ttl,
+)
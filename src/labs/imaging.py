@@ -0,0 +1,144 @@
+""" Rendering of image derivatives
+
+Resizing and encoding images is CPU bound, done on the event loop it
+would stall every other task on the worker for the duration. Images
+are rendered in a pool of processes instead, the loop only waits for
+the result.
+
+This module is imported by the processes of the pool, it must only
+depend on Pillow and the standard library so the processes start
+quickly and don't connect to anything.
+
+Usage:
+    from labs.imaging import render
+
+    derivatives = await render(path, sizes=[128, 512])
+"""
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from PIL import Image, ImageOps
+
+
+class Derivative(NamedTuple):
+    """ An encoded rendition of an image
+    """
+    name: str
+    data: bytes
+    width: int
+    height: int
+
+
+# Created on first use, so processes that never render an image
+# (e.g the API) don't start a pool
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def image_executor(processes: int = 2) -> ProcessPoolExecutor:
+    """ The pool images are rendered in, shared by the process
+
+    Processes are spawned rather than forked, a forked process would
+    inherit the connections and threads of the worker.
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    return _executor
+
+
+def shutdown_image_executor() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def render_derivatives(
+    path: str,
+    sizes: list[int],
+    format: str = "WEBP",
+    quality: int = 80,
+    max_pixels: int = 100_000_000,
+) -> list[Derivative]:
+    """ Render an image at each size (longest side in pixels)
+
+    The image is only decoded once, JPEGs are decoded at the smallest
+    scale that is still larger than the largest size. Each size is
+    then rendered from the previous (larger) one, which is cheaper
+    than starting from the original every time. Sizes larger than the
+    image are skipped, images are never enlarged.
+
+    Raises a ValueError if the image has more than max_pixels, and
+    whatever Pillow raises for files it can't read.
+    """
+    derivatives = []
+
+    with Image.open(path) as image:
+        if image.width * image.height > max_pixels:
+            raise ValueError(
+                f"Image of {image.width}x{image.height} exceeds "
+                f"{max_pixels} pixels"
+            )
+
+        longest = max(image.size)
+        sizes = sorted((size for size in sizes if size <= longest), reverse=True)
+
+        if not sizes:
+            return derivatives
+
+        image.draft("RGB", (sizes[0], sizes[0]))
+
+        # Phones record the orientation rather than rotating the pixels
+        rendition = ImageOps.exif_transpose(image)
+
+        if rendition.mode not in ("RGB", "RGBA"):
+            rendition = rendition.convert(
+                "RGBA" if rendition.has_transparency_data else "RGB"
+            )
+
+        for size in sizes:
+            rendition.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            buffer = io.BytesIO()
+            rendition.save(buffer, format=format, quality=quality)
+
+            derivatives.append(Derivative(
+                name=str(size),
+                data=buffer.getvalue(),
+                width=rendition.width,
+                height=rendition.height,
+            ))
+
+    return derivatives
+
+
+async def render(
+    path: str,
+    sizes: list[int],
+    format: str = "WEBP",
+    quality: int = 80,
+    max_pixels: int = 100_000_000,
+    processes: int = 2,
+) -> list[Derivative]:
+    """ Render the derivatives of an image in the process pool
+    """
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        image_executor(processes),
+        render_derivatives,
+        path,
+        sizes,
+        format,
+        quality,
+        max_pixels,
+    )
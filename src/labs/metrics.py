@@ -0,0 +1,175 @@
+""" Prometheus metrics for the application
+
+Metrics are defined in one place so the API, workers and utilities
+share names and labels. The API exposes these at /metrics.
+
+Where the API runs as several processes (e.g gunicorn workers) set
+PROMETHEUS_MULTIPROC_DIR, each process then writes its samples to a
+file in the directory and /metrics reports the total of every process.
+Gauges declare how they are combined across processes.
+
+See the prometheus_client documentation for the metric types
+https://prometheus.github.io/client_python/
+"""
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram,\
+    REGISTRY, make_asgi_app
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# AMQP publishing from API processes, see publisher.py
+publish_total = Counter(
+    "labs_publish_total",
+    "Messages published to the broker",
+    ["outcome"],
+)
+
+publish_latency_seconds = Histogram(
+    "labs_publish_latency_seconds",
+    "Time from queuing a message to the broker confirming it",
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+publish_batch_size = Histogram(
+    "labs_publish_batch_size",
+    "Messages confirmed together in a batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+publish_buffered = Gauge(
+    "labs_publish_buffered",
+    "Messages waiting in the local buffer to be published",
+    multiprocess_mode="livesum",
+)
+
+# Time taken by the broker to send a task, including waiting for the
+# publisher pool to accept it, see broker.py
+broker_kick_seconds = Histogram(
+    "labs_broker_kick_seconds",
+    "Time taken to send a task to the broker",
+    ["path"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+
+# Requests served by the API, see middleware/prometheus.py. Routes are
+# labelled by their template (e.g /upload/{id}) rather than the path,
+# the _count of the histogram is the number of requests served
+http_request_duration_seconds = Histogram(
+    "labs_http_request_duration_seconds",
+    "Time taken to serve a request, until the response was sent",
+    ["method", "route", "status"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+http_response_size_bytes = Histogram(
+    "labs_http_response_size_bytes",
+    "Size of response bodies",
+    ["method", "route"],
+    buckets=(100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+
+http_requests_in_progress = Gauge(
+    "labs_http_requests_in_progress",
+    "Requests that are being served",
+    multiprocess_mode="livesum",
+)
+
+# Connection pool of the database engine, see db.py
+db_pool_size = Gauge(
+    "labs_db_pool_size",
+    "Connections the pool keeps open",
+    multiprocess_mode="livesum",
+)
+
+db_pool_checked_out = Gauge(
+    "labs_db_pool_checked_out",
+    "Connections in use",
+    multiprocess_mode="livesum",
+)
+
+db_pool_overflow = Gauge(
+    "labs_db_pool_overflow",
+    "Connections open beyond the size of the pool",
+    multiprocess_mode="livesum",
+)
+
+db_pool_checkouts = Counter(
+    "labs_db_pool_checkouts",
+    "Connections taken from the pool",
+)
+
+db_pool_connects = Counter(
+    "labs_db_pool_connects",
+    "New connections opened by the pool",
+)
+
+# TaskIQ tasks, see middleware/instrumentation.py
+task_queue_wait_seconds = Histogram(
+    "labs_task_queue_wait_seconds",
+    "Time a task waited in the queue before it started running",
+    ["task_name"],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+
+task_duration_seconds = Histogram(
+    "labs_task_duration_seconds",
+    "Time a task took to run",
+    ["task_name"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
+)
+
+task_total = Counter(
+    "labs_task_total",
+    "Tasks that finished running",
+    ["task_name", "outcome"],
+)
+
+task_retries = Histogram(
+    "labs_task_retries",
+    "Retries a task had before it finished running",
+    ["task_name"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 10),
+)
+
+# Garbage collection of objects in the store, see routers/upload/tasks.py
+gc_objects_removed = Counter(
+    "labs_gc_objects_removed",
+    "Objects removed from the store by the garbage collector",
+)
+
+gc_bytes_reclaimed = Counter(
+    "labs_gc_bytes_reclaimed",
+    "Bytes reclaimed in the store by the garbage collector",
+)
+
+gc_rows_deleted = Counter(
+    "labs_gc_rows_deleted",
+    "Metadata records deleted by the garbage collector",
+)
+
+# Responsiveness of the event loop of API and worker processes, see
+# watchdog.py
+event_loop_lag_seconds = Histogram(
+    "labs_event_loop_lag_seconds",
+    "How much later than scheduled the event loop ran a callback",
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+event_loop_stalls = Counter(
+    "labs_event_loop_stalls",
+    "Times the event loop was blocked for longer than the threshold",
+)
+
+
+def metrics_app():
+    """ ASGI app that serves the metrics in the text format
+
+    In multiprocess mode the samples of every process are collected
+    from PROMETHEUS_MULTIPROC_DIR, otherwise those of this process.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return make_asgi_app(REGISTRY)
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return make_asgi_app(registry)
@@ -0,0 +1,13 @@
+"""Middlewares for the broker and the application
+
+  Each submodule provides a middleware that is registered by the
+  broker (see broker.py) or the FastAPI application (see api.py).
+
+"""
+
+from .idempotency import IdempotencyMiddleware, IDEMPOTENCY_KEY_LABEL
+from .recycle import RecycleMiddleware
+from .instrumentation import InstrumentationMiddleware
+from .prometheus import PrometheusMiddleware
+from .tracing import TracingMiddleware
+from .queries import QueryProfilerMiddleware, record_queries
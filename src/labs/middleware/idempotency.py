@@ -0,0 +1,138 @@
+""" Task deduplication using caller provided idempotency keys
+
+If a client double submits a request (e.g /signup) the handler would
+queue the same task twice, for tasks like sending a verification email
+this regenerates the token and invalidates the first email.
+
+The caller provides an idempotency key as a label when queuing:
+
+    await send_account_verification_email.kicker().with_labels(
+        idempotency_key=f"{user.id}:verify"
+    ).kiq(str(user.id))
+
+The middleware claims the key (scoped by the task name) in Redis using
+SET NX with a TTL. If the key is already claimed the message is marked
+as a duplicate and handed the task id of the original, the broker then
+drops the message (see AppBroker in broker.py) and the caller receives
+a handle to the task that is already in flight.
+
+If the message then fails to publish the broker releases the key, so
+the caller can send it again rather than have it dropped for the rest
+of the window.
+
+Tasks queued without the label are not affected.
+"""
+from logging import getLogger
+
+from redis.asyncio import Redis
+from taskiq import TaskiqMessage, TaskiqMiddleware
+
+logger = getLogger(__name__)
+
+# Label the caller sets to opt into deduplication
+IDEMPOTENCY_KEY_LABEL = "idempotency_key"
+
+# Label set by the middleware on messages that should not be sent
+DUPLICATE_LABEL = "_duplicate"
+
+# Deletes the key only while it is still held by the task, by then the
+# key may have expired and been claimed by another
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class IdempotencyMiddleware(TaskiqMiddleware):
+    """ Drops duplicate enqueues inside a configurable window
+
+    Retries (see SimpleRetryMiddleware) are kicked with the same labels
+    and task id as the original, these are recognised because the
+    claimed key holds their task id and are allowed through.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        window: int = 300,
+        key_prefix: str = "taskiq:idempotency",
+    ) -> None:
+        super().__init__()
+        self.window = window
+        self.key_prefix = key_prefix
+        # The client does not connect until it's first used
+        self.redis = Redis.from_url(redis_url, decode_responses=True)
+
+    async def shutdown(self) -> None:
+        await self.redis.close()
+
+    def _key(self, message: TaskiqMessage) -> str:
+        idempotency_key = message.labels[IDEMPOTENCY_KEY_LABEL]
+        return f"{self.key_prefix}:{message.task_name}:{idempotency_key}"
+
+    async def pre_send(self, message: TaskiqMessage) -> TaskiqMessage:
+        """ Claim the idempotency key or point the message at the
+        task that has already claimed it
+        """
+        if not message.labels.get(IDEMPOTENCY_KEY_LABEL):
+            return message
+
+        key = self._key(message)
+
+        # The claimed key could expire between SET and GET, in which
+        # case we have another go at claiming it
+        for _ in range(2):
+            claimed = await self.redis.set(
+                key,
+                message.task_id,
+                nx=True,
+                ex=self.window,
+            )
+
+            if claimed:
+                return message
+
+            existing_task_id = await self.redis.get(key)
+
+            if existing_task_id is None:
+                continue
+
+            # A retry of the task that claimed the key
+            if existing_task_id == message.task_id:
+                return message
+
+            logger.info(
+                "Dropping duplicate of task '%s' (%s), already queued as %s",
+                message.task_name,
+                key,
+                existing_task_id,
+            )
+
+            message.task_id = existing_task_id
+            message.labels[DUPLICATE_LABEL] = True
+            return message
+
+        return message
+
+    async def release(self, message) -> None:
+        """ Give up the key claimed by a message that was not sent
+        """
+        if (
+            not message.labels.get(IDEMPOTENCY_KEY_LABEL)
+            or is_duplicate(message.labels)
+        ):
+            return
+
+        await self.redis.eval(
+            RELEASE_SCRIPT,
+            1,
+            self._key(message),
+            message.task_id,
+        )
+
+
+def is_duplicate(labels: dict) -> bool:
+    """ Used by the broker to decide if a message should be sent """
+    return bool(labels.get(DUPLICATE_LABEL))
@@ -0,0 +1,60 @@
+""" Metrics for tasks queued and run via the broker
+
+The enqueue time is stamped as a label when a task is sent (this
+includes retries), when the worker picks up the task it records how
+long the task waited in the queue. Once the task has run it records
+how long it took, whether it succeeded and how many retries it had.
+
+All metrics are labelled by task name, see metrics.py.
+"""
+import time
+from typing import Any
+
+from taskiq import TaskiqMessage, TaskiqMiddleware, TaskiqResult
+
+from ..metrics import (
+    task_queue_wait_seconds,
+    task_duration_seconds,
+    task_total,
+    task_retries,
+)
+
+# Label carrying the unix timestamp when the task was sent
+ENQUEUED_AT_LABEL = "enqueued_at"
+
+
+class InstrumentationMiddleware(TaskiqMiddleware):
+    """ Records queue wait, duration, outcome and retries of tasks
+    """
+
+    def pre_send(self, message: TaskiqMessage) -> TaskiqMessage:
+        message.labels[ENQUEUED_AT_LABEL] = time.time()
+        return message
+
+    def pre_execute(self, message: TaskiqMessage) -> TaskiqMessage:
+        enqueued_at = message.labels.get(ENQUEUED_AT_LABEL)
+
+        if enqueued_at is not None:
+            task_queue_wait_seconds.labels(message.task_name).observe(
+                max(time.time() - float(enqueued_at), 0)
+            )
+
+        return message
+
+    def post_execute(
+        self,
+        message: TaskiqMessage,
+        result: TaskiqResult[Any],
+    ) -> None:
+        task_duration_seconds.labels(message.task_name).observe(
+            result.execution_time
+        )
+
+        task_total.labels(
+            message.task_name,
+            "failure" if result.is_err else "success",
+        ).inc()
+
+        task_retries.labels(message.task_name).observe(
+            int(message.labels.get("_retries", 0))
+        )
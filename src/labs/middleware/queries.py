@@ -0,0 +1,204 @@
+""" Profiling of the SQL statements run while serving a request
+
+Statements are counted and timed through the engine's cursor events
+and attributed to the request (or test) that is being profiled. A
+statement whose text was run several times within the same request
+is flagged as a probable N+1, e.g a query per row of a listing where
+a join or an IN would have done.
+
+The profile is carried in a context variable, SQLAlchemy runs the
+statements of an AsyncSession in the context of the caller so they
+are attributed to the right request even when many are in flight.
+
+Enable the middleware with PROFILER_SQL_ENABLED, responses then carry
+X-DB-Query-Count, X-DB-Query-Time (milliseconds) and, if any were
+found, X-DB-Repeated-Queries and each request is logged.
+
+Tests use process wide profiles to set a budget on the number of
+statements an endpoint may run (see query_budget in tests/conftest.py).
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Profile of the request being served in the current context
+_profile: ContextVar[Optional["QueryProfile"]] = ContextVar(
+    "query_profile",
+    default=None,
+)
+
+# Profiles that record every statement run by the process
+_process_profiles: list["QueryProfile"] = []
+
+
+class QueryProfile:
+    """ Statements run while profiling, by their text
+    """
+
+    def __init__(self, repeat_threshold: int = 3) -> None:
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.duration = 0.0  # In seconds
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    @property
+    def repeated(self) -> dict[str, int]:
+        """ Statements that were run at least repeat_threshold times
+        """
+        return {
+            statement: count
+            for statement, count in self.statements.most_common()
+            if count >= self.repeat_threshold
+        }
+
+    def report(self) -> str:
+        """ A summary that lists the statements that were run
+        """
+        lines = [
+            f"{self.count} statements in {self.duration * 1000:.1f}ms"
+        ]
+        lines += [
+            f"  {count}x {' '.join(statement.split())}"
+            for statement, count in self.statements.most_common()
+        ]
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile_queries(
+    repeat_threshold: int = 3,
+    process_wide: bool = False,
+) -> Iterator[QueryProfile]:
+    """ Profile the statements run within the block
+
+    By default only statements run in the current context are
+    recorded, process_wide records statements run by any thread or
+    task e.g by an app served by a test client.
+    """
+    profile = QueryProfile(repeat_threshold)
+
+    if process_wide:
+        _process_profiles.append(profile)
+        try:
+            yield profile
+        finally:
+            _process_profiles.remove(profile)
+        return
+
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+
+    profile = _profile.get()
+
+    if profile is not None:
+        profile.record(statement, duration)
+
+    for profile in _process_profiles:
+        profile.record(statement, duration)
+
+
+def _handle_error(exception_context):
+    # Statements that fail don't reach after_cursor_execute
+    connection = exception_context.connection
+    started = connection.info.get("query_started") if connection else None
+
+    if started:
+        started.pop()
+
+
+def record_queries(engine) -> None:
+    """ Attribute the statements run on the engine to profiles
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    if event.contains(
+        sync_engine,
+        "before_cursor_execute",
+        _before_cursor_execute,
+    ):
+        return
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class QueryProfilerMiddleware:
+    """ ASGI middleware that profiles the statements of each request
+
+    Statements run after the response has started (e.g while a
+    response is streamed) are logged but not in the headers.
+    """
+
+    def __init__(self, app: ASGIApp, repeat_threshold: int = 3) -> None:
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(profile.count)
+                headers["X-DB-Query-Time"] = f"{profile.duration * 1000:.1f}"
+
+                if profile.repeated:
+                    headers["X-DB-Repeated-Queries"] = \
+                        str(len(profile.repeated))
+
+            await send(message)
+
+        with profile_queries(self.repeat_threshold) as profile:
+            await self.app(scope, receive, send_wrapper)
+
+        if not profile.count:
+            return
+
+        logger.info(
+            "%s %s ran %d statements in %.1fms",
+            scope["method"],
+            scope["path"],
+            profile.count,
+            profile.duration * 1000,
+        )
+
+        for statement, count in profile.repeated.items():
+            logger.warning(
+                "%s %s ran the same statement %d times, probable N+1: %s",
+                scope["method"],
+                scope["path"],
+                count,
+                " ".join(statement.split()),
+            )
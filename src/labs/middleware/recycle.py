@@ -0,0 +1,68 @@
+""" Recycles worker processes that use too much memory
+
+Long running workers tend to grow their resident memory over time,
+once a process goes over the configured limit it sends itself SIGTERM.
+taskiq treats this as a graceful shutdown, it stops fetching messages,
+waits for in flight tasks to finish (see WORKER_DRAIN_TIMEOUT) and
+the process manager starts a fresh process in its place.
+
+Recycling after a number of tasks is handled by taskiq itself via
+--max-tasks-per-child (see worker.py).
+"""
+import os
+import resource
+import signal
+from logging import getLogger
+from typing import Any
+
+from taskiq import TaskiqMessage, TaskiqMiddleware, TaskiqResult
+
+logger = getLogger(__name__)
+
+
+def resident_memory_mb() -> float:
+    """ Current resident memory of this process in megabytes
+
+    /proc is only available on Linux (i.e in our containers), other
+    platforms fallback to the peak resident memory.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RecycleMiddleware(TaskiqMiddleware):
+    """ Asks the worker process to stop once it's over the memory limit
+    """
+
+    def __init__(self, max_rss_mb: int) -> None:
+        super().__init__()
+        self.max_rss_mb = max_rss_mb
+        self.recycling = False
+
+    def post_execute(
+        self,
+        message: TaskiqMessage,
+        result: TaskiqResult[Any],
+    ) -> None:
+        if self.recycling:
+            return
+
+        rss = resident_memory_mb()
+
+        if rss < self.max_rss_mb:
+            return
+
+        logger.warning(
+            "Worker %s is using %.0fMB (limit %dMB), recycling",
+            os.getpid(),
+            rss,
+            self.max_rss_mb,
+        )
+
+        self.recycling = True
+        os.kill(os.getpid(), signal.SIGTERM)
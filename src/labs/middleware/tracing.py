@@ -0,0 +1,80 @@
+""" Trace context propagation through tasks
+
+When a task is sent the current trace context is added to its labels,
+the worker that runs the task continues the trace in a span of its
+own. A task queued while serving a request shows up in the trace of
+the request, along with the statements and requests the task made.
+
+Labels that already carry a context (e.g retries, or tasks relayed
+from the outbox) keep it, see tracing.py.
+"""
+from typing import Any
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from taskiq import TaskiqMessage, TaskiqMiddleware, TaskiqResult
+
+from ..tracing import tracer, inject_trace_context
+
+
+class TracingMiddleware(TaskiqMiddleware):
+    """ Carries the trace context to workers and traces task execution
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Span and context token of each task that is running
+        self._running: dict[str, tuple] = {}
+
+    def pre_send(self, message: TaskiqMessage) -> TaskiqMessage:
+        inject_trace_context(message.labels)
+        return message
+
+    def pre_execute(self, message: TaskiqMessage) -> TaskiqMessage:
+        span = tracer.start_span(
+            f"run {message.task_name}",
+            context=propagate.extract(message.labels),
+            kind=SpanKind.CONSUMER,
+            attributes={
+                "messaging.system": "taskiq",
+                "messaging.message.id": message.task_id,
+                "taskiq.task_name": message.task_name,
+                "taskiq.retries": int(message.labels.get("_retries", 0)),
+            },
+        )
+
+        # The task runs in the same context as the middlewares, any
+        # spans it starts are children of the task's span
+        token = context.attach(trace.set_span_in_context(span))
+        self._running[message.task_id] = (span, token)
+
+        return message
+
+    def on_error(
+        self,
+        message: TaskiqMessage,
+        result: TaskiqResult[Any],
+        exception: BaseException,
+    ) -> None:
+        running = self._running.get(message.task_id)
+
+        if running is not None:
+            running[0].record_exception(exception)
+
+    def post_execute(
+        self,
+        message: TaskiqMessage,
+        result: TaskiqResult[Any],
+    ) -> None:
+        running = self._running.pop(message.task_id, None)
+
+        if running is None:
+            return
+
+        span, token = running
+
+        if result.is_err:
+            span.set_status(Status(StatusCode.ERROR))
+
+        span.end()
+        context.detach(token)
@@ -6,4 +6,5 @@
 """
 
 from .user import User
-from .s3 import S3FileMetadata
+from .s3 import S3FileMetadata, S3Blob
+from .outbox import OutboxMessage
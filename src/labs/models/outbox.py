@@ -0,0 +1,116 @@
+""" Transactional outbox for queuing tasks
+
+Handlers should not block on the broker (or lose tasks when it's down)
+after they have committed a change to the database. Instead of calling
+.kiq() a handler writes an OutboxMessage in the same transaction as the
+domain change, the relay (see outbox.py) publishes the pending messages
+to the broker and marks them as sent.
+
+Usage:
+    session.add(user)
+    await session.flush()
+
+    await OutboxMessage.enqueue(
+        session,
+        send_account_verification_email,
+        str(user.id),
+    )
+
+    await session.commit()
+
+"""
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import Index, func, select
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from .utils import (
+    DateTimeMixin,
+    IdentifierMixin,
+    jsonb,
+    timestamp,
+)
+
+from ..db import Base
+from ..settings import settings
+from ..tracing import inject_trace_context
+
+
+class OutboxMessage(
+    Base,
+    IdentifierMixin,
+    DateTimeMixin,
+):
+    """ A task waiting to be published to the broker
+
+    The task_id is assigned when the message is written so the
+    relay publishes the same task id regardless of how many times
+    it has to attempt the publish.
+    """
+    __tablename__ = "outbox_message"
+
+    task_id: Mapped[str] = mapped_column(
+        default=lambda: uuid4().hex
+    )
+    task_name: Mapped[str]
+
+    args: Mapped[jsonb]
+    kwargs: Mapped[jsonb]
+    labels: Mapped[jsonb]
+
+    # Set by the relay once the broker has confirmed the publish
+    sent_at: Mapped[timestamp]
+
+    # Number of failed attempts to publish the message
+    attempts: Mapped[int] = mapped_column(
+        default=0
+    )
+
+    # Failed messages are retried after a backoff, not before this
+    next_attempt_at: Mapped[timestamp]
+
+    __table_args__ = (
+        # The relay only ever looks for unsent messages
+        Index(
+            "ix_outbox_message_unsent",
+            "created_at",
+            postgresql_where="sent_at IS NULL",
+        ),
+    )
+
+    @classmethod
+    async def enqueue(
+        cls,
+        async_db_session,
+        task,
+        *args,
+        labels: Optional[dict] = None,
+        **kwargs
+    ) -> "OutboxMessage":
+        """ Add a task to the outbox as part of the current transaction
+
+        This does not commit the session, the message is only visible
+        to the relay once the caller commits their transaction. The
+        NOTIFY is also delivered on commit and wakes up the relay.
+
+        The current trace context is kept with the message, the task
+        continues the trace of the transaction that queued it.
+        """
+        message = cls(
+            task_name=task.task_name,
+            args=list(args),
+            kwargs=kwargs,
+            labels=inject_trace_context({**task.labels, **(labels or {})}),
+        )
+
+        async_db_session.add(message)
+
+        await async_db_session.execute(
+            select(func.pg_notify(settings.outbox.channel, ""))
+        )
+
+        return message
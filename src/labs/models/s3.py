@@ -2,12 +2,14 @@
 
 
 """
+import enum
 from typing import Optional
-from uuid import uuid4
 from datetime import timedelta
 from typing import Union
+from uuid import uuid4
 
-from sqlalchemy import event
+from sqlalchemy import BigInteger, Enum, UniqueConstraint, event, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import (
     mapped_column,
     Mapped,
@@ -18,13 +20,133 @@ from .utils import (
     IdentifierMixin,
     ModelCRUDMixin,
     CUDByMixin,
+    fk_s3_blob_uuid,
+    fk_s3_file_metadata_uuid,
+    fk_user_uuid,
+    timestamp,
 )
 
 from ..db import Base
-from ..utils import minio_client
+from ..utils import minio_client, async_storage, presigner, storage_router
 from ..settings import settings
 
 
+class UploadState(str, enum.Enum):
+    """ Where the upload of an object is at
+
+    Single part uploads remain pending until they are verified, while
+    multipart uploads are uploading until they are completed or
+    aborted by the client or for being left unfinished.
+    """
+    pending = "pending"
+    uploading = "uploading"
+    completed = "completed"
+    aborted = "aborted"
+
+
+class S3Blob(
+    Base,
+    IdentifierMixin,
+    DateTimeMixin,
+):
+    """ An object in the store shared by identical uploads
+
+    In content addressed mode (see S3_CONTENT_ADDRESSED) clients send
+    the SHA-256 of the file with the upload request, the object is
+    stored under a key derived from the user and the digest and every
+    upload of the same content by the user refers to it rather than
+    storing a copy.
+
+    Blobs are never shared between users, knowing the digest of a file
+    is not proof of having it, a user could otherwise claim the file of
+    another and download it.
+
+    ref_count is the number of S3FileMetadata records that refer to
+    the blob, the object can be removed once it drops to zero.
+
+    Usage:
+        blobs = await S3Blob.acquire_many(
+            session,
+            settings.storage.bucket_name,
+            current_user.id,
+            [(sha256, file_size, mime_type, 1)],
+        )
+    """
+    __tablename__ = "s3_blob"
+    __table_args__ = (
+        UniqueConstraint("bucket_name", "created_by_user_id", "sha256"),
+    )
+
+    bucket_name: Mapped[str]
+    created_by_user_id: Mapped[fk_user_uuid]
+    s3_key: Mapped[str]
+    sha256: Mapped[str]
+
+    file_size: Mapped[int] = mapped_column(BigInteger)
+    mime_type: Mapped[str]
+
+    ref_count: Mapped[int] = mapped_column(default=0)
+
+    # Set once the object has been uploaded and its digest confirmed,
+    # uploads of valid blobs are not required
+    is_valid: Mapped[bool] = mapped_column(default=False)
+    verified_at: Mapped[timestamp]
+
+    @classmethod
+    async def acquire_many(
+        cls,
+        session,
+        bucket_name: str,
+        user_id,
+        claims: list[tuple[str, int, str, int]],
+    ) -> dict:
+        """ Take references to the user's blobs of (sha256, size, type, count)
+
+        Blobs are created where they don't exist and their ref_count
+        raised by count otherwise, in a single INSERT .. ON CONFLICT.
+        A blob whose size or type does not match the claim is left
+        alone and missing from the result, the upload should then be
+        stored on its own.
+
+        Each sha256 must appear once in claims, count is the number of
+        references to take. Returns the (id, sha256, s3_key, is_valid)
+        of each blob by sha256. The session is not committed.
+        """
+        if not claims:
+            return {}
+
+        statement = pg_insert(cls).values([
+            dict(
+                bucket_name=bucket_name,
+                created_by_user_id=user_id,
+                s3_key=blob_s3_key(sha256, user_id),
+                sha256=sha256,
+                file_size=file_size,
+                mime_type=mime_type,
+                ref_count=count,
+            )
+            for sha256, file_size, mime_type, count in claims
+        ])
+
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                cls.bucket_name,
+                cls.created_by_user_id,
+                cls.sha256,
+            ],
+            set_=dict(
+                ref_count=cls.ref_count + statement.excluded.ref_count,
+            ),
+            where=(
+                (cls.file_size == statement.excluded.file_size) &
+                (cls.mime_type == statement.excluded.mime_type)
+            ),
+        ).returning(cls.id, cls.sha256, cls.s3_key, cls.is_valid)
+
+        result = await session.execute(statement)
+        return {row.sha256: row for row in result}
+
+
 class S3FileMetadata(
     Base,
     DateTimeMixin,
@@ -61,6 +183,9 @@ class S3FileMetadata(
 
     """
     __tablename__ = "s3_file_metadata"
+    __table_args__ = (
+        UniqueConstraint("derived_from_id", "derivative"),
+    )
 
     # For applications using multiple buckets for different purposes
     # e.g user generated content and then a public media bucket we store
@@ -75,7 +200,8 @@ class S3FileMetadata(
     prefix: Mapped[Optional[str]]
 
     file_name: Mapped[str]
-    file_size: Mapped[int]
+    # Multipart uploads can be well over the range of an Integer
+    file_size: Mapped[int] = mapped_column(BigInteger)
 
     mime_type: Mapped[str]
 
@@ -96,24 +222,131 @@ class S3FileMetadata(
         default=False
     )
 
+    # When the object was last checked against the store, unverified
+    # objects are periodically checked again (see routers/upload/tasks.py)
+    verified_at: Mapped[timestamp]
+
+    # Digest of the content as claimed by the client, uploads that are
+    # content addressed refer to a shared S3Blob
+    sha256: Mapped[Optional[str]]
+    blob_id: Mapped[fk_s3_blob_uuid]
+
+    # Tracks multipart uploads (see routers/upload/multipart.py), the
+    # upload_id is assigned by the store when the upload is initiated
+    upload_state: Mapped[UploadState] = mapped_column(
+        Enum(UploadState, native_enum=False, length=16),
+        default=UploadState.pending,
+        server_default=UploadState.pending.value,
+    )
+    upload_id: Mapped[Optional[str]]
+    part_size: Mapped[Optional[int]] = mapped_column(BigInteger)
+    part_count: Mapped[Optional[int]]
+
+    # Renditions of an uploaded image (see routers/upload/tasks.py) refer
+    # to the original and are named after their size e.g "512", they
+    # are orphaned once the original is removed
+    derived_from_id: Mapped[fk_s3_file_metadata_uuid]
+    derivative: Mapped[Optional[str]]
+
+    @classmethod
+    async def create_many(
+        cls,
+        session,
+        values: list[dict],
+    ) -> list[dict]:
+        """ Create many records in a single multi-row INSERT
+
+        Each item of values holds the columns of a record, every item
+        must have the same columns. Keys are assigned the same way as
+        when a single record is created unless one is provided. The
+        session is not committed, this is left to the caller.
+
+        Returns the items of values with the id and s3_key of their
+        record. Ids are assigned here rather than read back from the
+        INSERT, content addressed records share keys so rows returned
+        could not be told apart.
+        """
+        values = [
+            dict(
+                item,
+                id=item.get('id') or uuid4(),
+                s3_key=(
+                    item.get('s3_key') or
+                    generate_s3_key(item.get('file_name'), item.get('prefix'))
+                ),
+            )
+            for item in values
+        ]
+
+        if values:
+            await session.execute(insert(cls).values(values))
+
+        return values
+
+    @classmethod
+    def presign_upload(
+        cls,
+        s3_key: str,
+        bucket_name: str,
+        sha256: Optional[str] = None,
+    ) -> str:
+        """ A URL to create or replace the object with the given key
+
+        Use this where the record has not been loaded e.g following
+        create_many, otherwise use the presigned_upload_url property.
+
+        Pass the sha256 of blobs, the store then only accepts content
+        with that digest (see utils/presign.py).
+        """
+        return presigner.presigned_put_object(
+            bucket_name,
+            s3_key,
+            expires=timedelta(
+                seconds=settings.lifetime.link_s3_upload
+            ),
+            sha256=sha256,
+        )
+
+    def presign_upload_part(self, part_number: int) -> str:
+        """ A URL to upload a part of a multipart upload
+
+        Part URLs are unique to the upload and are not cached.
+        """
+        return presigner.presign(
+            "PUT",
+            self.bucket_name,
+            self.s3_key,
+            settings.lifetime.link_s3_upload,
+            query_params={
+                "partNumber": str(part_number),
+                "uploadId": self.upload_id,
+            },
+        )
+
+    @property
+    def content_disposition(self) -> str:
+        """ Downloads are saved using the name of the uploaded file
+        """
+        return f'attachment; filename="{self.file_name}"'
+
     @property
     def presigned_download_url(self) -> Union[str, None]:
         """ Provides a presigned download url for the object in the store
 
         If there is an issue then you will receive None, the application should not proceed
         with the download if this is the case.
+
+        URLs are cached and reused until they are close to expiring (see
+        utils/presign.py) so this is cheap to call for long listings.
         """
         try:
-            return minio_client.presigned_get_object(
-                settings.storage.bucket_name,
+            return presigner.presigned_get_object(
+                self.bucket_name,
                 self.s3_key,
                 expires=timedelta(
-                    minutes=settings.lifetime.link_s3_download
+                    seconds=settings.lifetime.link_s3_download
                 ),
-                response_headers={
-                    'response-content-disposition':
-                    f'attachment; filename="{self.file_name}"'
-                },
+                disposition=self.content_disposition,
             )
         except Exception as e:
             return None
@@ -132,14 +365,11 @@ class S3FileMetadata(
         should not proceed with the upload.
         """
         try:
-            url = minio_client.presigned_put_object(
-                settings.storage.bucket_name,
+            return self.presign_upload(
                 self.s3_key,
-                expires=timedelta(
-                    minutes=settings.lifetime.link_s3_upload
-                )
+                self.bucket_name,
+                self.sha256 if self.blob_id else None,
             )
-            return url
         except Exception:
             return None
 
@@ -153,7 +383,7 @@ class S3FileMetadata(
         """
         try:
             minio_client.enable_object_legal_hold(
-                settings.storage.bucket_name,
+                self.bucket_name,
                 self.s3_key,
             )
             self.legal_hold = True
@@ -170,7 +400,7 @@ class S3FileMetadata(
         """
         try:
             minio_client.disable_object_legal_hold(
-                settings.storage.bucket_name,
+                self.bucket_name,
                 self.s3_key,
             )
 
@@ -181,6 +411,49 @@ class S3FileMetadata(
             self.legal_hold = True
             return False
 
+    async def async_presigned_download_url(self) -> Union[str, None]:
+        """ Awaitable variant of presigned_download_url
+
+        Signing happens locally and is cached, so no request is made
+        to the store.
+        """
+        return self.presigned_download_url
+
+    async def async_presigned_upload_url(self) -> Union[str, None]:
+        """ Awaitable variant of presigned_upload_url
+        """
+        return self.presigned_upload_url
+
+    async def async_enable_legal_hold(self) -> bool:
+        """ Awaitable variant of enable_legal_hold
+
+        Does not block the event loop while the store responds.
+        """
+        try:
+            await async_storage.enable_object_legal_hold(
+                self.bucket_name,
+                self.s3_key,
+            )
+            self.legal_hold = True
+            return True
+        except Exception:
+            self.legal_hold = False
+            return False
+
+    async def async_disable_legal_hold(self) -> bool:
+        """ Awaitable variant of disable_legal_hold
+        """
+        try:
+            await async_storage.disable_object_legal_hold(
+                self.bucket_name,
+                self.s3_key,
+            )
+            self.legal_hold = False
+            return True
+        except Exception:
+            self.legal_hold = True
+            return False
+
 
 @event.listens_for(S3FileMetadata, 'init')
 def assign_s3_key(target, args, kwargs):
@@ -194,12 +467,44 @@ def assign_s3_key(target, args, kwargs):
     Suffix ensures that the file extension is preserved if it is provided in the
     file_name. While for files that are accessed by presigned_urls this is not
     required, it is useful for files that are accessed by the public.
+
+    Keys are placed under the prefix of the object, if one is given, and a
+    short hash so requests are spread across partitions of the bucket.
+    """
+    target.s3_key = generate_s3_key(
+        kwargs.get('file_name'),
+        kwargs.get('prefix'),
+    )
+
+
+def blob_s3_key(sha256: str, user_id) -> str:
+    """ Key of a content addressed object, from its owner and digest
     """
-    suffix = ""
+    return storage_router.sharded(sha256, prefix=f"sha256/{user_id}")
+
 
-    if 'file_name' in kwargs:
-        file_name_split = kwargs['file_name'].split('.')
-        if len(file_name_split) > 1:
-            suffix = "." + file_name_split[-1]
+def derivative_s3_key(original_id, name: str) -> str:
+    """ Key of a derivative, under the derived prefix and the original's id
 
-    target.s3_key = uuid4().hex + suffix
+    e.g derived/<shard>/<uuid>/512.webp for the original record <uuid>.
+    Derivatives belong to the record rather than the object, records
+    sharing a content addressed object each have their own.
+    """
+    extension = settings.imaging.format.lower()
+
+    return "/".join((
+        storage_router.sharded(
+            str(original_id),
+            prefix=settings.imaging.prefix,
+        ),
+        f"{name}.{extension}",
+    ))
+
+
+def generate_s3_key(
+    file_name: Optional[str] = None,
+    prefix: Optional[str] = None,
+) -> str:
+    """ A new key for an object, see StorageRouter.key
+    """
+    return storage_router.key(file_name, prefix)
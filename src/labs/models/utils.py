@@ -68,6 +68,15 @@ fk_s3_file_metadata_uuid = Annotated[
     )
 ]
 
+fk_s3_blob_uuid = Annotated[
+    UUID,
+    mapped_column(
+        PGUUID(as_uuid=True),
+        ForeignKey("s3_blob.id"),
+        nullable=True,
+    )
+]
+
 timestamp_req = Annotated[
     datetime,
     mapped_column(
@@ -291,6 +300,26 @@ class ModelCRUDMixin:
         users = users.scalars().all()
         return users
 
+    @classmethod
+    async def get_rows_in_range(
+        cls,
+        async_db_session,
+        columns: tuple[str, ...],
+        offset: int = 0,
+        limit: int = 100,
+    ):
+        """ Get the columns of records with limit and offset as rows
+
+        Rows are tuples in the order of columns, loading them skips
+        building an object per record and the identity map, use this
+        to list records that are serialised and not modified (see
+        RowSerializer in dto/utils.py).
+        """
+        query = select(*(getattr(cls, column) for column in columns))
+        query = query.limit(limit).offset(offset)
+        rows = await async_db_session.execute(query)
+        return rows.all()
+
     @classmethod
     async def get_all(
         cls,
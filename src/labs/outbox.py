@@ -0,0 +1,219 @@
+""" Relay that publishes the transactional outbox to the broker
+
+Handlers write OutboxMessage rows in the same transaction as their
+domain changes (see models/outbox.py), this process publishes them.
+
+Pending messages are claimed in batches with FOR UPDATE SKIP LOCKED so
+more than one relay can run at a time, each batch is published
+concurrently and the broker's publisher confirms are awaited together
+before the batch is marked as sent in a single statement.
+
+The relay LISTENs on the outbox channel so it's woken up as soon as a
+handler commits, polling is only a fallback for missed notifications.
+
+Messages that fail to publish are retried with an exponential backoff
+(see OUTBOX_RETRY_BACKOFF) until they reach OUTBOX_MAX_ATTEMPTS, after
+which they are logged as errors and left for an operator. The relay
+stops draining while publishing fails and backs off the same way while
+the database is unavailable.
+
+This is called from the command line via poetry scripts.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+import asyncpg
+from sqlalchemy import func, or_, select, update
+
+from taskiq.kicker import AsyncKicker
+
+from .broker import broker
+from .db import AsyncSessionFactory
+from .models import OutboxMessage
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def publish(message: OutboxMessage) -> None:
+    """ Publish a single outbox message via the broker
+
+    This goes through the kicker so the broker middlewares (e.g
+    idempotency) are applied exactly as they would be for .kiq()
+    """
+    kicker = AsyncKicker(
+        task_name=message.task_name,
+        broker=broker,
+        labels=message.labels or {},
+    ).with_task_id(message.task_id)
+
+    await kicker.kiq(
+        *(message.args or []),
+        **(message.kwargs or {}),
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """ Seconds to wait before the next attempt, after attempts failed
+    """
+    return min(
+        settings.outbox.retry_backoff * 2 ** max(attempts - 1, 0),
+        settings.outbox.max_retry_backoff,
+    )
+
+
+def record_attempts(
+    messages: Sequence[OutboxMessage],
+    results: Sequence,
+) -> list:
+    """ Schedule the retry of messages that failed to publish
+
+    Returns the ids of the messages that were published, failed
+    messages have their attempts counted and their next attempt
+    pushed back, those out of attempts are logged as errors.
+    """
+    now = datetime.now(timezone.utc)
+    sent_ids = []
+
+    for message, result in zip(messages, results):
+        if not isinstance(result, BaseException):
+            sent_ids.append(message.id)
+            continue
+
+        message.attempts += 1
+        message.next_attempt_at = now + timedelta(
+            seconds=retry_delay(message.attempts)
+        )
+
+        if message.attempts >= settings.outbox.max_attempts:
+            logger.error(
+                "Giving up on outbox message %s (%s) after %d attempts, "
+                "it will not be published: %s",
+                message.id,
+                message.task_name,
+                message.attempts,
+                result,
+            )
+        else:
+            logger.warning(
+                "Unable to publish outbox message %s (%s), attempt %d: %s",
+                message.id,
+                message.task_name,
+                message.attempts,
+                result,
+            )
+
+    return sent_ids
+
+
+async def relay_pending(
+    batch_size: int = settings.outbox.batch_size,
+) -> int:
+    """ Publish a batch of pending messages and mark them as sent
+
+    Returns the number of messages that were sent, the caller should
+    keep calling this while it returns a full batch. A batch with
+    failures returns less, so the relay waits instead of retrying.
+    """
+    async with AsyncSessionFactory() as session:
+        query = (
+            select(OutboxMessage)
+            .where(
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.attempts < settings.outbox.max_attempts,
+                or_(
+                    OutboxMessage.next_attempt_at.is_(None),
+                    OutboxMessage.next_attempt_at <= func.now(),
+                ),
+            )
+            .order_by(OutboxMessage.created_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+        messages = (await session.execute(query)).scalars().all()
+
+        if not messages:
+            await session.rollback()
+            return 0
+
+        results = await asyncio.gather(
+            *(publish(message) for message in messages),
+            return_exceptions=True,
+        )
+
+        # Failed messages are updated on commit
+        sent_ids = record_attempts(messages, results)
+
+        if sent_ids:
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(sent_ids))
+                .values(sent_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+
+        await session.commit()
+
+        return len(sent_ids)
+
+
+async def run_relay():
+    """ Relay messages until the process is stopped
+    """
+    await broker.startup()
+
+    wakeup = asyncio.Event()
+
+    connection = await asyncpg.connect(str(settings.db.dsn))
+    await connection.add_listener(
+        settings.outbox.channel,
+        lambda *args: wakeup.set(),
+    )
+
+    logger.info("Listening for outbox messages")
+
+    failures = 0
+
+    try:
+        while True:
+            wakeup.clear()
+
+            try:
+                # Drain the outbox, a full batch means there's more to do
+                while await relay_pending() == settings.outbox.batch_size:
+                    pass
+            except Exception:
+                failures += 1
+                logger.exception(
+                    "Unable to relay outbox messages, retrying in %.0fs",
+                    retry_delay(failures),
+                )
+                await asyncio.sleep(retry_delay(failures))
+                continue
+
+            failures = 0
+
+            try:
+                await asyncio.wait_for(
+                    wakeup.wait(),
+                    timeout=settings.outbox.poll_interval,
+                )
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await connection.close()
+        await broker.shutdown()
+
+
+def relay():
+    """ Async IO container to run the relay
+    """
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_relay())
+
+
+if __name__ == "__main__":
+    relay()
@@ -0,0 +1,234 @@
+""" On demand CPU and memory profiling of a running process
+
+The CPU profiler is statistical, a helper thread samples the stack of
+every other thread at an interval while the process carries on
+serving traffic. The cost is proportional to the sampling rate rather
+than the amount of work the process does, and nothing is paid while
+no profile is running.
+
+Profiles are returned as a speedscope file (https://speedscope.app)
+or as collapsed stacks, the input of flamegraph.pl and most other
+flame graph tools.
+
+The memory profiler takes two tracemalloc snapshots some seconds
+apart and reports the lines that allocated the most in between.
+Tracing is started for the duration and stopped again, as it slows
+down every allocation while it runs.
+
+A process runs one profile of each kind at a time. These are served
+to administrators by the API (see routers/admin), workers are
+profiled via control tasks.
+
+Usage:
+    content, media_type = await profile_cpu(seconds=10)
+    allocations = await profile_heap(seconds=10, limit=25)
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+# Media type of each format profiles are returned in
+CPU_PROFILE_FORMATS = {
+    "speedscope": "application/json",
+    "collapsed": "text/plain",
+}
+
+_cpu_lock = threading.Lock()
+_heap_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """ A profile of the same kind is already running in the process
+    """
+
+
+class SamplingProfiler:
+    """ Samples the stacks of all other threads at an interval
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        # Number of times each stack was seen, stacks are tuples of
+        # (function, file, line) from the root, headed by the thread
+        self.samples: Counter = Counter()
+        self.duration = 0.0
+
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="sampling-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.duration = time.monotonic() - self._started
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+
+        while not self._stopped.wait(self.interval):
+            names = {
+                thread.ident: thread.name
+                for thread in threading.enumerate()
+            }
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        (code.co_name, code.co_filename, code.co_firstlineno)
+                    )
+                    frame = frame.f_back
+
+                stack.append((names.get(thread_id, str(thread_id)), "", 0))
+                self.samples[tuple(reversed(stack))] += 1
+
+    @staticmethod
+    def _frame_name(frame: tuple) -> str:
+        name, file_name, line = frame
+
+        if not file_name:
+            return name
+
+        return f"{name} ({os.path.basename(file_name)}:{line})"
+
+    def collapsed(self) -> str:
+        """ A line per stack, frames separated by ; and the sample count
+        """
+        return "".join(
+            f"{';'.join(self._frame_name(frame) for frame in stack)} {count}\n"
+            for stack, count in self.samples.most_common()
+        )
+
+    def speedscope(self, name: str = "labs") -> dict:
+        """ A speedscope file, with a sampled profile per thread
+        """
+        frames: dict[tuple, int] = {}
+        profiles: dict[str, dict] = {}
+
+        for stack, count in self.samples.items():
+            thread_name = stack[0][0]
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": [],
+                "weights": [],
+            })
+
+            profile["samples"].append([
+                frames.setdefault(frame, len(frames)) for frame in stack[1:]
+            ])
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": __package__,
+            "shared": {
+                "frames": [
+                    {"name": frame_name, "file": file_name, "line": line}
+                    for frame_name, file_name, line in frames
+                ],
+            },
+            "profiles": list(profiles.values()),
+        }
+
+
+async def profile_cpu(
+    seconds: float,
+    interval: float = 0.005,
+    format: str = "speedscope",
+) -> tuple[str, str]:
+    """ Profile the process for a number of seconds
+
+    Returns the profile in the format and its media type, raises a
+    ProfilerBusyError if a CPU profile is already running.
+    """
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A CPU profile is already running")
+
+    try:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    finally:
+        _cpu_lock.release()
+
+    if format == "collapsed":
+        content = profiler.collapsed()
+    else:
+        content = json.dumps(profiler.speedscope(f"{__package__} {os.getpid()}"))
+
+    return content, CPU_PROFILE_FORMATS[format]
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+async def profile_heap(seconds: float, limit: int = 25) -> list[dict]:
+    """ The lines that allocated the most over a number of seconds
+
+    Returns the top lines by growth in size, raises a ProfilerBusyError
+    if a memory profile is already running.
+    """
+    if not _heap_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A memory profile is already running")
+
+    # Tracing may have been started elsewhere e.g PYTHONTRACEMALLOC
+    started_tracing = not tracemalloc.is_tracing()
+
+    try:
+        if started_tracing:
+            tracemalloc.start()
+
+        # Snapshots of a large heap take a while, they are taken off
+        # the loop so the process carries on serving
+        before = await asyncio.to_thread(_snapshot)
+        await asyncio.sleep(seconds)
+        after = await asyncio.to_thread(_snapshot)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _heap_lock.release()
+
+    return [
+        {
+            "file": stat.traceback[0].filename,
+            "line": stat.traceback[0].lineno,
+            "size": stat.size,
+            "size_diff": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in after.compare_to(before, "lineno")[:limit]
+    ]
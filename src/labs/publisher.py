@@ -0,0 +1,220 @@
+""" Pooled AMQP publisher for API processes
+
+The broker publishes every message on a single channel and awaits the
+confirmation of each message before returning, under bursts of traffic
+(e.g signups) this latency shows up in the response times.
+
+PublisherPool opens a configurable number of channels on the broker's
+write connection, each channel drains a shared bounded buffer in
+batches and awaits the publisher confirms of the batch together.
+
+The buffer is bounded, once it's full callers wait for space which
+applies backpressure to the handlers rather than growing memory.
+
+Stopping the pool publishes what's left in the buffer, for at most
+the drain timeout, messages that could not be published by then are
+failed so callers awaiting them are not left waiting.
+
+Usage (see AppBroker in broker.py):
+    pool = PublisherPool(connection, exchange_name)
+    await pool.start()
+    await pool.publish(message, routing_key)
+    await pool.stop()
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aio_pika import Message
+from aio_pika.abc import AbstractChannel, AbstractConnection
+
+from .metrics import (
+    publish_total,
+    publish_latency_seconds,
+    publish_batch_size,
+    publish_buffered,
+)
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PublisherPool:
+    """ A pool of confirming channels fed from a bounded buffer
+    """
+
+    def __init__(
+        self,
+        connection: AbstractConnection,
+        exchange_name: str,
+        channels: int = settings.publisher.channels,
+        batch_size: int = settings.publisher.batch_size,
+        buffer_size: int = settings.publisher.buffer_size,
+        await_confirm: bool = settings.publisher.await_confirm,
+        confirm_timeout: int = settings.publisher.confirm_timeout,
+        drain_timeout: int = settings.publisher.drain_timeout,
+    ) -> None:
+        self.connection = connection
+        self.exchange_name = exchange_name
+        self.channel_count = channels
+        self.batch_size = batch_size
+        self.await_confirm = await_confirm
+        self.confirm_timeout = confirm_timeout
+        self.drain_timeout = drain_timeout
+
+        self._buffer: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self._channels: list[AbstractChannel] = []
+        self._publishers: list[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._publishers)
+
+    async def start(self) -> None:
+        """ Open the channels and start a publisher for each
+        """
+        for _ in range(self.channel_count):
+            channel = await self.connection.channel(
+                publisher_confirms=True
+            )
+            exchange = await channel.get_exchange(
+                self.exchange_name,
+                ensure=False,
+            )
+            self._channels.append(channel)
+            self._publishers.append(
+                asyncio.create_task(self._run_publisher(exchange))
+            )
+
+    async def stop(self) -> None:
+        """ Publish what's left in the buffer and close the channels
+        """
+        try:
+            await asyncio.wait_for(
+                self._buffer.join(),
+                timeout=self.drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.error(
+                "Timed out publishing the buffer, %d messages left",
+                self._buffer.qsize(),
+            )
+
+        for publisher in self._publishers:
+            publisher.cancel()
+
+        await asyncio.gather(*self._publishers, return_exceptions=True)
+
+        left = []
+        while not self._buffer.empty():
+            left.append(self._buffer.get_nowait())
+            self._buffer.task_done()
+
+        self._abandon(left)
+        publish_buffered.set(0)
+
+        for channel in self._channels:
+            await channel.close()
+
+        self._publishers = []
+        self._channels = []
+
+    async def publish(
+        self,
+        message: Message,
+        routing_key: str,
+    ) -> None:
+        """ Buffer a message to be published
+
+        Waits for space in the buffer if it's full, and if configured
+        to do so waits for the broker to confirm the message.
+        """
+        confirmed: Optional[asyncio.Future] = None
+
+        if self.await_confirm:
+            confirmed = asyncio.get_running_loop().create_future()
+
+        await self._buffer.put(
+            (message, routing_key, confirmed, time.perf_counter())
+        )
+        publish_buffered.set(self._buffer.qsize())
+
+        if confirmed is not None:
+            await confirmed
+
+    async def _run_publisher(self, exchange) -> None:
+        """ Drains the buffer in batches onto a single channel
+        """
+        while True:
+            batch = [await self._buffer.get()]
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._buffer.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            publish_buffered.set(self._buffer.qsize())
+            publish_batch_size.observe(len(batch))
+
+            try:
+                await self._publish_batch(exchange, batch)
+            except asyncio.CancelledError:
+                self._abandon(batch)
+                raise
+            finally:
+                for _ in batch:
+                    self._buffer.task_done()
+
+    def _abandon(self, batch) -> None:
+        """ Fail messages that the pool stopped before publishing
+        """
+        for _, routing_key, confirmed, _ in batch:
+            publish_total.labels(outcome="failed").inc()
+
+            if confirmed is None:
+                logger.error(
+                    "Unable to publish message to %s: publisher stopped",
+                    routing_key,
+                )
+            elif not confirmed.done():
+                confirmed.set_exception(
+                    ConnectionError("Publisher stopped")
+                )
+
+    async def _publish_batch(self, exchange, batch) -> None:
+        """ Publish the batch and await the confirms together
+        """
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(
+                    exchange.publish(message, routing_key=routing_key),
+                    timeout=self.confirm_timeout,
+                )
+                for message, routing_key, _, _ in batch
+            ),
+            return_exceptions=True,
+        )
+
+        now = time.perf_counter()
+
+        for (_, routing_key, confirmed, queued_at), result in zip(batch, results):
+            publish_latency_seconds.observe(now - queued_at)
+
+            if isinstance(result, BaseException):
+                publish_total.labels(outcome="failed").inc()
+
+                if confirmed is None:
+                    logger.error(
+                        "Unable to publish message to %s: %s",
+                        routing_key,
+                        result,
+                    )
+                elif not confirmed.done():
+                    confirmed.set_exception(result)
+            else:
+                publish_total.labels(outcome="confirmed").inc()
+
+                if confirmed is not None and not confirmed.done():
+                    confirmed.set_result(None)
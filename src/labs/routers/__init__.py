@@ -12,6 +12,7 @@ from .auth import router as router_auth
 from .ext import router as router_ext
 from .users import router as router_users
 from .upload import router as router_upload
+from .admin import router as router_admin
 
 # Mount all routers at the top level
 # this is what the FastAPI app will use
@@ -32,3 +33,7 @@ router_root.include_router(
   router_upload,
   prefix="/upload",
 )
+router_root.include_router(
+  router_admin,
+  prefix="/admin",
+)
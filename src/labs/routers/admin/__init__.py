@@ -0,0 +1,167 @@
+""" Administration endpoints to diagnose running processes
+
+Profiles are taken of the API process that serves the request, or of
+a worker via a control task (see tasks.py). Each process runs one
+profile of a kind at a time, a request for another responds with a 409.
+
+CPU profiles open in https://speedscope.app, or pass format=collapsed
+for the input of flamegraph.pl and similar tools.
+"""
+import os
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response,\
+    status
+from taskiq import TaskiqResultTimeoutError
+
+from ...models import User
+from ...dto import HeapProfileResponse
+from ...profiler import ProfilerBusyError, profile_cpu, profile_heap
+from ...settings import settings
+from ..utils import get_admin_user
+from .tasks import profile_worker_cpu, profile_worker_heap
+
+router = APIRouter(tags=["admin"])
+
+# Extra time a worker has to pick up and answer a control task
+WORKER_GRACE_SECONDS = 30
+
+CpuProfileFormat = Literal["speedscope", "collapsed"]
+
+seconds_query = Query(
+    10.0,
+    gt=0,
+    le=settings.profiler.max_seconds,
+    description="Length of the profile in seconds",
+)
+
+
+def _cpu_profile_response(
+    content: str,
+    media_type: str,
+    format: str,
+    pid: int,
+) -> Response:
+    extension = "speedscope.json" if format == "speedscope" else "txt"
+
+    return Response(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition":
+                f'attachment; filename="profile-{pid}.{extension}"',
+        },
+    )
+
+
+async def _wait_for_worker(task, seconds: float) -> dict:
+    try:
+        result = await task.wait_result(
+            timeout=seconds + WORKER_GRACE_SECONDS,
+        )
+    except TaskiqResultTimeoutError:
+        raise HTTPException(
+            status.HTTP_504_GATEWAY_TIMEOUT,
+            "No worker returned the profile in time",
+        )
+
+    if result.is_err:
+        raise HTTPException(
+            status.HTTP_502_BAD_GATEWAY,
+            f"Worker failed to profile: {result.error}",
+        )
+
+    return result.return_value
+
+
+@router.get(
+    "/profile/cpu",
+    summary="Profile the CPU usage of the API process",
+    response_class=Response,
+)
+async def get_cpu_profile(
+    seconds: float = seconds_query,
+    format: CpuProfileFormat = "speedscope",
+    current_user: User = Depends(get_admin_user),
+) -> Response:
+    """ Sample the stacks of the process for a number of seconds
+
+    The response is sent once the profile is complete.
+    """
+    try:
+        content, media_type = await profile_cpu(
+            seconds,
+            settings.profiler.cpu_interval,
+            format,
+        )
+    except ProfilerBusyError as error:
+        raise HTTPException(status.HTTP_409_CONFLICT, str(error))
+
+    return _cpu_profile_response(content, media_type, format, os.getpid())
+
+
+@router.get(
+    "/profile/heap",
+    summary="Profile the memory allocations of the API process",
+)
+async def get_heap_profile(
+    seconds: float = seconds_query,
+    limit: int = Query(settings.profiler.heap_limit, ge=1, le=1000),
+    current_user: User = Depends(get_admin_user),
+) -> HeapProfileResponse:
+    """ Lines that allocated the most over a number of seconds
+    """
+    try:
+        allocations = await profile_heap(seconds, limit)
+    except ProfilerBusyError as error:
+        raise HTTPException(status.HTTP_409_CONFLICT, str(error))
+
+    return HeapProfileResponse(
+        pid=os.getpid(),
+        seconds=seconds,
+        allocations=allocations,
+    )
+
+
+@router.get(
+    "/profile/worker/cpu",
+    summary="Profile the CPU usage of a worker process",
+    response_class=Response,
+)
+async def get_worker_cpu_profile(
+    seconds: float = seconds_query,
+    format: CpuProfileFormat = "speedscope",
+    current_user: User = Depends(get_admin_user),
+) -> Response:
+    """ Sample the stacks of whichever worker picks up the control task
+    """
+    task = await profile_worker_cpu.kiq(
+        seconds,
+        settings.profiler.cpu_interval,
+        format,
+    )
+    result = await _wait_for_worker(task, seconds)
+
+    return _cpu_profile_response(
+        result["content"],
+        result["media_type"],
+        format,
+        result["pid"],
+    )
+
+
+@router.get(
+    "/profile/worker/heap",
+    summary="Profile the memory allocations of a worker process",
+)
+async def get_worker_heap_profile(
+    seconds: float = seconds_query,
+    limit: int = Query(settings.profiler.heap_limit, ge=1, le=1000),
+    current_user: User = Depends(get_admin_user),
+) -> HeapProfileResponse:
+    """ Lines that allocated the most in whichever worker picks up the task
+    """
+    task = await profile_worker_heap.kiq(seconds, limit)
+    result = await _wait_for_worker(task, seconds)
+
+    return HeapProfileResponse(seconds=seconds, **result)
@@ -0,0 +1,35 @@
+""" Control tasks to profile worker processes
+
+A task is run by whichever worker picks it up, so a profile is of one
+worker process. Profiles of a worker that is busy with long tasks
+start once it has a free slot.
+"""
+import os
+
+from ...broker import broker
+from ...profiler import profile_cpu, profile_heap
+
+
+@broker.task
+async def profile_worker_cpu(
+    seconds: float,
+    interval: float,
+    format: str,
+) -> dict:
+    content, media_type = await profile_cpu(seconds, interval, format)
+
+    return {
+        "pid": os.getpid(),
+        "content": content,
+        "media_type": media_type,
+    }
+
+
+@broker.task
+async def profile_worker_heap(seconds: float, limit: int) -> dict:
+    allocations = await profile_heap(seconds, limit)
+
+    return {
+        "pid": os.getpid(),
+        "allocations": allocations,
+    }
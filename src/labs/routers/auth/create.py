@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...db import get_async_session
 from ...models.user import User
+from ...models.outbox import OutboxMessage
 from ...dto.auth import SignupRequest, SignupResponse
 
 from .tasks import send_account_verification_email
@@ -41,17 +42,25 @@ async def signup_user(
             detail="User already exists"
         )
 
-    user = await User.create(session, **request.dict())
+    # The user and the task to send the verification email are
+    # written in the same transaction, the outbox relay publishes
+    # the task so we never block on the broker
+    user = User(**request.dict())
+    session.add(user)
 
-    # We should have a user here, otherwise something went wrong
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to create user"
-        )
+    # Flush to get the id assigned by the database
+    await session.flush()
+
+    # The idempotency key ensures a double submission does not
+    # invalidate the first email
+    await OutboxMessage.enqueue(
+        session,
+        send_account_verification_email,
+        str(user.id),
+        labels={"idempotency_key": f"{user.id}:verify"},
+    )
 
-    # Queue a task to send the verification email
-    await send_account_verification_email.kiq(str(user.id))
+    await session.commit()
 
     return SignupResponse(
         success=True,
@@ -5,14 +5,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...db import get_async_session
-from ...models import User
+from ...models import User, OutboxMessage
 from ...settings import settings
 
 from ...dto.auth import OTPTriggerEmailRequest, \
     OTPTriggerSMSRequest, InitiateResetPasswordRequest
 
 from .tasks import send_reset_password_email,\
-    send_account_verification_email
+    send_account_verification_email, send_otp_email
 
 router = APIRouter()
 
@@ -46,7 +46,12 @@ async def initiate_otp_email(
         )
 
     # Initiate the OTP process as a background task
-    await send_otp_email.kiq(str(user.id))
+    await OutboxMessage.enqueue(
+        session,
+        send_otp_email,
+        str(user.id),
+    )
+    await session.commit()
 
 
 @router.post(
@@ -92,7 +97,13 @@ async def initiate_password_reset(
         )
 
     # Queue a task to send the verification email
-    await send_reset_password_email.kiq(str(user.id))
+    await OutboxMessage.enqueue(
+        session,
+        send_reset_password_email,
+        str(user.id),
+        labels={"idempotency_key": f"{user.id}:reset_password"},
+    )
+    await session.commit()
 
 
 @router.post(
@@ -115,5 +126,12 @@ async def initiate_verification_email(
             status_code=status.HTTP_204_NO_CONTENT,
         )
 
-    # Queue a task to send the verification email
-    await send_account_verification_email.kiq(str(user.id))
+    # Queue a task to send the verification email, the idempotency key
+    # ensures a double submission does not invalidate the first email
+    await OutboxMessage.enqueue(
+        session,
+        send_account_verification_email,
+        str(user.id),
+        labels={"idempotency_key": f"{user.id}:verify"},
+    )
+    await session.commit()
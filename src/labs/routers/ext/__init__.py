@@ -1,11 +1,11 @@
 """Scenes for the ext module
 """
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Response, status
 
-from ...db import get_async_session
-from ...dto.ext import HealthCheckResponse, EchoResponse
+from ...dto.ext import HealthCheckResponse, EchoResponse, LivenessResponse,\
+    ProbeResponse
+from ...health import readiness
 
 router = APIRouter(tags=["ext"])
 
@@ -22,26 +22,59 @@ async def echo() -> EchoResponse:
     )
 
 
+@router.get("/health/live")
+async def get_liveness() -> LivenessResponse:
+    """Check that the process is alive.
+
+    Does not check any other service, an outage of the database should
+    not get every replica restarted. Use this for liveness probes.
+    """
+    return LivenessResponse()
+
+
+@router.get(
+    "/health/ready",
+    responses={
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"model": HealthCheckResponse},
+    },
+)
+async def get_readiness(response: Response) -> HealthCheckResponse:
+    """Check that the services the API depends on are available.
+
+    Responds with a 503 if any of them are not, use this for readiness
+    probes. Results are cached for HEALTH_CACHE_TTL seconds.
+    """
+    health = await get_health()
+
+    if not health.all_ok:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return health
+
+
 @router.get(
     "/healthcheck",
 )
-async def get_health(
-    session: AsyncSession = Depends(get_async_session)
-) -> HealthCheckResponse:
+async def get_health() -> HealthCheckResponse:
     """Check the health of the server.
 
     Purpose of this endpoint is to check the health of the server.
-    We check for connection to the database, queue and logger
+    We check for connection to the database, queue, results backend
+    and the object store.
     """
+    checks = await readiness.check()
 
-    response = HealthCheckResponse()
-    response.db_ok = session.is_active
-
-    # This will be done better with pyndatic 2
-    response.all_ok = (
-        response.db_ok and
-        response.queue_ok and
-        response.log_ok
+    response = HealthCheckResponse(
+        checks={
+            name: ProbeResponse(**result._asdict())
+            for name, result in checks.items()
+        },
     )
+    response.db_ok = checks["db"].ok
+    response.queue_ok = checks["queue"].ok
+    response.redis_ok = checks["redis"].ok
+    response.storage_ok = checks["storage"].ok
+
+    response.all_ok = all(result.ok for result in checks.values())
 
     return response
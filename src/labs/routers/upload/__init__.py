@@ -1,9 +1,11 @@
 """
 
 """
-from datetime import datetime
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Made available by the router utils
@@ -11,11 +13,120 @@ from ..utils import get_current_user
 
 from ...db import get_async_session
 from ...settings import settings
-from ...models import S3FileMetadata, User
+from ...models import S3FileMetadata, S3Blob, OutboxMessage, User
 from ...dto import FileUploadRequest, FileUploadResponse
+from ...utils.presign import checksum_headers
+
+# Imported so the tasks are registered with the broker
+from . import tasks
+from .multipart import router as router_multipart
+from .download import router as router_download
+from .utils import bucket_for_request
 
 router = APIRouter(tags=["file-uploads"])
 
+router.include_router(router_multipart, prefix="/multipart")
+router.include_router(router_download)
+
+
+async def _create_upload_urls(
+    session: AsyncSession,
+    current_user: User,
+    upload_requests: list[FileUploadRequest],
+) -> list[FileUploadResponse]:
+    """ Record the claims of the client and presign a URL for each
+
+    The records are created with a single INSERT, the URLs are signed
+    locally so no request is made to the store.
+
+    In content addressed mode uploads with a digest refer to a blob
+    shared by the uploads of the user, where the blob has already been
+    uploaded and verified the record is valid straight away and no
+    link is provided. Otherwise the link only accepts the content with
+    the digest, so no upload can replace a blob with other content.
+    Images that are valid straight away are queued for derivatives.
+    """
+    now = datetime.now(timezone.utc)
+    bucket_names = [
+        bucket_for_request(upload_request)
+        for upload_request in upload_requests
+    ]
+    blobs = {}
+
+    if settings.storage.content_addressed:
+        claims = defaultdict(Counter)
+        for bucket_name, request in zip(bucket_names, upload_requests):
+            if request.sha256:
+                claims[bucket_name][(
+                    request.sha256.lower(),
+                    request.file_size,
+                    request.mime_type,
+                )] += 1
+
+        for bucket_name, bucket_claims in claims.items():
+            acquired = await S3Blob.acquire_many(
+                session,
+                bucket_name,
+                current_user.id,
+                [claim + (count,) for claim, count in bucket_claims.items()],
+            )
+            blobs.update(
+                ((bucket_name, sha256), blob)
+                for sha256, blob in acquired.items()
+            )
+
+    values = []
+
+    for bucket_name, upload_request in zip(bucket_names, upload_requests):
+        sha256 = upload_request.sha256.lower() if upload_request.sha256 else None
+        blob = blobs.get((bucket_name, sha256))
+
+        values.append(dict(
+            bucket_name=bucket_name,
+            s3_key=blob.s3_key if blob else None,
+            file_name=upload_request.file_name,
+            file_size=upload_request.file_size,
+            mime_type=upload_request.mime_type,
+            sha256=sha256,
+            blob_id=blob.id if blob else None,
+            is_valid=bool(blob and blob.is_valid),
+            verified_at=now if blob and blob.is_valid else None,
+            created_by_user_id=current_user.id,
+            last_updated_by_user_id=current_user.id,
+        ))
+
+    values = await S3FileMetadata.create_many(session, values)
+
+    for item in values:
+        if item['is_valid'] and tasks.has_derivatives(item['mime_type']):
+            await OutboxMessage.enqueue(
+                session,
+                tasks.generate_image_derivatives,
+                str(item['id']),
+            )
+
+    await session.commit()
+
+    return [
+        FileUploadResponse(
+            id=item['id'],
+            upload_required=False,
+            expires=settings.lifetime.link_s3_upload,
+        ) if item['is_valid'] else FileUploadResponse(
+            id=item['id'],
+            presigned_upload_url=S3FileMetadata.presign_upload(
+                item['s3_key'],
+                item['bucket_name'],
+                item['sha256'] if item['blob_id'] else None,
+            ),
+            upload_headers=(
+                checksum_headers(item['sha256']) if item['blob_id'] else None
+            ),
+            expires=settings.lifetime.link_s3_upload,
+        )
+        for item in values
+    ]
+
 
 @router.post("")
 async def get_upload_url(
@@ -23,20 +134,35 @@ async def get_upload_url(
     session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_user),
 ) -> FileUploadResponse:
-    """
-    """
+    """ Presigned URL to upload a single file
 
-    s3_file_metadata = await S3FileMetadata.create(
+    The file is verified against the claim once the link expires.
+    """
+    responses = await _create_upload_urls(
         session,
-        file_name=upload_request.file_name,
-        file_size=upload_request.file_size,
-        mime_type=upload_request.mime_type,
-        user=current_user,
+        current_user,
+        [upload_request],
     )
 
-    response = FileUploadResponse(
-        presigned_upload_url=s3_file_metadata.presigned_upload_url,
-        expires=settings.S3_UPLOAD_EXPIRY,
-    )
+    return responses[0]
+
 
-    return response
+@router.post("/batch")
+async def get_upload_urls(
+    upload_requests: Annotated[
+        list[FileUploadRequest],
+        Body(min_length=1, max_length=settings.storage.upload_batch_size),
+    ],
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> list[FileUploadResponse]:
+    """ Presigned URLs to upload many files in one request
+
+    URLs are returned in the order of the requested files, up to
+    S3_UPLOAD_BATCH_SIZE files can be requested at a time.
+    """
+    return await _create_upload_urls(
+        session,
+        current_user,
+        upload_requests,
+    )
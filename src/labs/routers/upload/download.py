@@ -0,0 +1,204 @@
+""" Streaming downloads through the API
+
+Presigned links can be shared and are valid until they expire, files
+that must be authorised on every access are served through the API
+instead. The object is streamed from the store to the client a chunk
+at a time, so memory use does not depend on the size of the object,
+and the client applies backpressure as chunks are only read from the
+store as fast as they are sent.
+
+Range and If-None-Match requests are passed on to the store, so
+clients can resume downloads, seek in media and revalidate their
+cache with 206 and 304 responses.
+
+Each process serves at most S3_MAX_DOWNLOAD_STREAMS downloads at once,
+further requests are turned away with a 503 rather than queued.
+"""
+import asyncio
+import re
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+import httpx
+from fastapi import APIRouter, Depends, Header, HTTPException, Response,\
+    status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.types import Receive, Scope, Send
+
+from ..utils import get_current_user
+
+from ...db import get_async_session
+from ...settings import settings
+from ...models import S3FileMetadata, User
+from ...utils import async_storage
+
+router = APIRouter()
+
+# Shared by all downloads served by the process
+download_slots = asyncio.Semaphore(settings.storage.max_download_streams)
+
+# A single range of bytes, the store does not serve multiple ranges
+RANGE_PATTERN = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+
+# Headers of the store's response that are passed on to the client
+FORWARDED_HEADERS = (
+    "content-length",
+    "content-range",
+    "etag",
+    "last-modified",
+)
+
+
+def single_range(range: Optional[str]) -> Optional[str]:
+    """ The Range header if it's a single range of bytes
+
+    Anything else is ignored, as the specification permits, and the
+    whole object is served.
+    """
+    if range is None:
+        return None
+
+    range = range.replace(" ", "")
+
+    if not RANGE_PATTERN.match(range):
+        return None
+
+    start, _, end = range[len("bytes="):].partition("-")
+    if start and end and int(end) < int(start):
+        return None
+
+    return range
+
+
+async def _stream(upstream: httpx.Response) -> AsyncIterator[bytes]:
+    async for chunk in upstream.aiter_bytes(
+        settings.storage.download_chunk_size
+    ):
+        yield chunk
+
+
+class DownloadResponse(StreamingResponse):
+    """ Streams a download, then releases what it held to serve it
+
+    The stack is closed once the response is over, however it ended,
+    including when the client went away or the response could not be
+    started, in which case the body is never iterated.
+    """
+
+    def __init__(self, content, stack: AsyncExitStack, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.stack = stack
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stack.aclose()
+
+
+@router.get("/{id}/download")
+async def download_file(
+    id: UUID,
+    range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+):
+    """ Stream a file that the user uploaded
+
+    Administrators can download any file. Responds with a 206 for a
+    range and a 304 if the ETag matches If-None-Match.
+    """
+    s3_file_metadata = await S3FileMetadata.get(session, id)
+
+    if (
+        s3_file_metadata is None or
+        s3_file_metadata.deleted or
+        not s3_file_metadata.is_valid or (
+            s3_file_metadata.created_by_user_id != current_user.id and
+            not current_user.is_admin
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found",
+        )
+
+    if download_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many downloads in progress",
+            headers={"Retry-After": "1"},
+        )
+
+    headers = {}
+    if single_range(range):
+        headers["Range"] = single_range(range)
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+
+    # The slot and the connection to the store are held until the
+    # last chunk has been sent, or the client goes away
+    stack = AsyncExitStack()
+    await download_slots.acquire()
+    stack.callback(download_slots.release)
+
+    try:
+        upstream = await stack.enter_async_context(
+            async_storage.get_object(
+                s3_file_metadata.bucket_name,
+                s3_file_metadata.s3_key,
+                headers=headers,
+            )
+        )
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    response_headers = {
+        name: upstream.headers[name]
+        for name in FORWARDED_HEADERS
+        if name in upstream.headers
+    }
+    response_headers["Accept-Ranges"] = "bytes"
+    response_headers["Cache-Control"] = "private"
+
+    if upstream.status_code in (
+        status.HTTP_200_OK,
+        status.HTTP_206_PARTIAL_CONTENT,
+    ):
+        response_headers["Content-Disposition"] = \
+            s3_file_metadata.content_disposition
+
+        return DownloadResponse(
+            _stream(upstream),
+            stack,
+            status_code=upstream.status_code,
+            media_type=s3_file_metadata.mime_type,
+            headers=response_headers,
+        )
+
+    await stack.aclose()
+
+    if upstream.status_code in (
+        status.HTTP_304_NOT_MODIFIED,
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+    ):
+        response_headers.pop("content-length", None)
+        return Response(
+            status_code=upstream.status_code,
+            headers=response_headers,
+        )
+
+    if upstream.status_code == status.HTTP_404_NOT_FOUND:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found",
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="Unable to read the file from the store",
+    )
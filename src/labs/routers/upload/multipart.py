@@ -0,0 +1,313 @@
+""" Multipart uploads of large files
+
+A single presigned PUT has to succeed in one go, for large files a
+network blip means starting again. Multipart uploads split the file
+into parts that are uploaded independently (and in parallel), parts
+that failed can be uploaded again and an interrupted upload can be
+resumed by asking for the parts that are missing.
+
+The flow for a client is:
+    POST   /upload/multipart                initiate, returns part links
+    GET    /upload/multipart/{id}           uploaded parts, missing links
+    POST   /upload/multipart/{id}/complete  assemble the parts
+    DELETE /upload/multipart/{id}           abort the upload
+
+Uploads that are not completed are aborted after the multipart
+lifetime (see tasks.py), the store discards the uploaded parts.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator
+from uuid import UUID
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, status
+from minio.datatypes import Part
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..utils import get_current_user
+
+from ...db import get_async_session
+from ...settings import settings
+from ...models import S3FileMetadata, User, OutboxMessage
+from ...models.s3 import UploadState
+from ...utils import async_storage
+from ...utils.s3 import StorageError, part_layout
+from ...dto import FileUploadRequest, MultipartUploadResponse,\
+    MultipartCompleteRequest, UploadPart, UploadedPart, UploadStateResponse
+
+from .tasks import verify_s3_file_availability
+from .utils import bucket_for_request
+
+router = APIRouter()
+
+# Errors completing an upload that are down to the parts the client
+# uploaded or listed, anything else is the store failing
+CLIENT_ERROR_CODES = ("InvalidPart", "InvalidPartOrder", "EntityTooSmall")
+
+
+@contextmanager
+def storage_errors(
+    detail: str,
+    ignore: tuple[str, ...] = (),
+) -> Iterator[None]:
+    """ Respond to errors of the store with an HTTP error
+
+    Errors caused by the client are a 400, the store being unavailable,
+    overloaded (e.g SlowDown) or unreachable is a 503. Errors with a
+    code in ignore are suppressed.
+    """
+    try:
+        yield
+    except StorageError as e:
+        if e.code in ignore:
+            return
+
+        if e.code in CLIENT_ERROR_CODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=e.message or detail,
+            )
+
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+        )
+    except (httpx.HTTPError, OSError):
+        # Connection errors of httpx are not OSErrors
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+        )
+
+
+async def _get_upload(
+    session: AsyncSession,
+    id: UUID,
+    current_user: User,
+) -> S3FileMetadata:
+    """ A multipart upload in progress that belongs to the user
+    """
+    query = select(S3FileMetadata).where(
+        S3FileMetadata.id == id,
+        S3FileMetadata.created_by_user_id == current_user.id,
+        S3FileMetadata.upload_id.is_not(None),
+        S3FileMetadata.deleted.is_(False),
+    )
+
+    s3_file_metadata = (await session.execute(query)).scalar_one_or_none()
+
+    if s3_file_metadata is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found",
+        )
+
+    if s3_file_metadata.upload_state != UploadState.uploading:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is {s3_file_metadata.upload_state.value}",
+        )
+
+    return s3_file_metadata
+
+
+def _upload_response(
+    s3_file_metadata: S3FileMetadata,
+    uploaded_parts: list[Part],
+) -> MultipartUploadResponse:
+    """ Links for every part that is yet to be uploaded
+    """
+    uploaded = {part.part_number for part in uploaded_parts}
+
+    return MultipartUploadResponse(
+        id=s3_file_metadata.id,
+        part_size=s3_file_metadata.part_size,
+        part_count=s3_file_metadata.part_count,
+        parts=[
+            UploadPart(
+                part_number=part_number,
+                presigned_upload_url=s3_file_metadata.presign_upload_part(
+                    part_number
+                ),
+            )
+            for part_number in range(1, s3_file_metadata.part_count + 1)
+            if part_number not in uploaded
+        ],
+        uploaded_parts=[
+            UploadedPart(
+                part_number=part.part_number,
+                etag=part.etag,
+                size=part.size,
+            )
+            for part in uploaded_parts
+        ],
+        expires=settings.lifetime.link_s3_upload,
+    )
+
+
+@router.post("")
+async def initiate_multipart_upload(
+    upload_request: FileUploadRequest,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> MultipartUploadResponse:
+    """ Start a multipart upload, returns a link for each part
+
+    The size of the parts is decided by the server, every part other
+    than the last one must be exactly part_size bytes.
+    """
+    part_size, part_count = part_layout(
+        upload_request.file_size,
+        settings.storage.multipart_part_size,
+    )
+
+    s3_file_metadata = S3FileMetadata(
+        bucket_name=bucket_for_request(upload_request),
+        file_name=upload_request.file_name,
+        file_size=upload_request.file_size,
+        mime_type=upload_request.mime_type,
+        sha256=upload_request.sha256.lower() if upload_request.sha256 else None,
+        created_by_user_id=current_user.id,
+        last_updated_by_user_id=current_user.id,
+        upload_state=UploadState.uploading,
+        part_size=part_size,
+        part_count=part_count,
+    )
+
+    with storage_errors("Unable to start the upload"):
+        s3_file_metadata.upload_id = await async_storage.create_multipart_upload(
+            s3_file_metadata.bucket_name,
+            s3_file_metadata.s3_key,
+            content_type=upload_request.mime_type,
+        )
+
+    try:
+        session.add(s3_file_metadata)
+        await session.commit()
+    except Exception:
+        # Don't leave parts that nothing refers to in the store
+        await async_storage.abort_multipart_upload(
+            s3_file_metadata.bucket_name,
+            s3_file_metadata.s3_key,
+            s3_file_metadata.upload_id,
+        )
+        raise
+
+    return _upload_response(s3_file_metadata, [])
+
+
+@router.get("/{id}")
+async def get_multipart_upload(
+    id: UUID,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> MultipartUploadResponse:
+    """ Parts uploaded so far and fresh links for the rest
+
+    Use this to resume an interrupted upload or to renew links that
+    have expired before their parts were uploaded.
+    """
+    s3_file_metadata = await _get_upload(session, id, current_user)
+
+    with storage_errors("Unable to list the uploaded parts"):
+        uploaded_parts = await async_storage.list_parts(
+            s3_file_metadata.bucket_name,
+            s3_file_metadata.s3_key,
+            s3_file_metadata.upload_id,
+        )
+
+    return _upload_response(s3_file_metadata, uploaded_parts)
+
+
+@router.post("/{id}/complete")
+async def complete_multipart_upload(
+    id: UUID,
+    complete_request: MultipartCompleteRequest,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> UploadStateResponse:
+    """ Assemble the uploaded parts into the object
+
+    Every part must have been uploaded, the object is then queued to
+    be verified against what the client claimed.
+    """
+    s3_file_metadata = await _get_upload(session, id, current_user)
+
+    if complete_request.parts is None:
+        with storage_errors("Unable to list the uploaded parts"):
+            parts = await async_storage.list_parts(
+                s3_file_metadata.bucket_name,
+                s3_file_metadata.s3_key,
+                s3_file_metadata.upload_id,
+            )
+    else:
+        parts = [
+            Part(part_number=part.part_number, etag=part.etag)
+            for part in complete_request.parts
+        ]
+
+    missing = set(range(1, s3_file_metadata.part_count + 1)) - {
+        part.part_number for part in parts
+    }
+
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Parts {sorted(missing)} have not been uploaded",
+        )
+
+    with storage_errors("Unable to complete the upload"):
+        await async_storage.complete_multipart_upload(
+            s3_file_metadata.bucket_name,
+            s3_file_metadata.s3_key,
+            s3_file_metadata.upload_id,
+            parts,
+        )
+
+    s3_file_metadata.upload_state = UploadState.completed
+    s3_file_metadata.last_updated_by_user_id = current_user.id
+
+    await OutboxMessage.enqueue(
+        session,
+        verify_s3_file_availability,
+        [str(s3_file_metadata.id)],
+    )
+    await session.commit()
+
+    return UploadStateResponse(
+        id=s3_file_metadata.id,
+        upload_state=s3_file_metadata.upload_state.value,
+    )
+
+
+@router.delete("/{id}")
+async def abort_multipart_upload(
+    id: UUID,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_user),
+) -> UploadStateResponse:
+    """ Abort the upload, parts uploaded so far are discarded
+    """
+    s3_file_metadata = await _get_upload(session, id, current_user)
+
+    # The store may have discarded the upload already
+    with storage_errors("Unable to abort the upload", ignore=("NoSuchUpload",)):
+        await async_storage.abort_multipart_upload(
+            s3_file_metadata.bucket_name,
+            s3_file_metadata.s3_key,
+            s3_file_metadata.upload_id,
+        )
+
+    s3_file_metadata.upload_state = UploadState.aborted
+    s3_file_metadata.deleted = True
+    s3_file_metadata.deleted_at = datetime.now(timezone.utc)
+    s3_file_metadata.deleted_by_user_id = current_user.id
+
+    await session.commit()
+
+    return UploadStateResponse(
+        id=s3_file_metadata.id,
+        upload_state=s3_file_metadata.upload_state.value,
+    )
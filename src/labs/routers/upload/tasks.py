@@ -1,14 +1,607 @@
+import asyncio
+import logging
+import tempfile
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer, and_, column, delete, exists, func, or_,\
+    select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from taskiq import TaskiqDepends
 
-from ...db import get_async_session
-from ...utils import minio_client
+from ...db import get_async_session, AsyncSessionFactory
+from ...utils import minio_client, async_storage
+from ...utils.s3 import StorageError
+from ...utils.storage import object_matches_claim, stat_objects,\
+    remove_objects
+from ...metrics import gc_objects_removed, gc_bytes_reclaimed,\
+    gc_rows_deleted
 from ...broker import broker
+from ...imaging import render
+from ...models import S3FileMetadata, S3Blob, OutboxMessage
+from ...models.s3 import UploadState, derivative_s3_key
+from ...settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Multipart uploads can only be verified once they are completed
+VERIFIABLE_STATES = (UploadState.pending, UploadState.completed)
+
+
+def has_derivatives(mime_type: str) -> bool:
+    """ Whether derivatives are rendered for valid files of the type
+    """
+    return (
+        settings.imaging.enabled and
+        mime_type.split(";")[0].strip().lower()
+        in settings.imaging.mime_types
+    )
+
+
+async def _object_digests(
+    objects: set[tuple[str, str]],
+) -> dict:
+    """ SHA-256 of each (bucket_name, s3_key), or the error hashing it
+
+    Objects are read concurrently, up to the size of the connection
+    pool of the storage client.
+    """
+    semaphore = asyncio.Semaphore(settings.storage.max_concurrency)
+
+    async def digest(bucket_name: str, s3_key: str) -> str:
+        async with semaphore:
+            return await async_storage.object_sha256(bucket_name, s3_key)
+
+    objects = list(objects)
+    results = await asyncio.gather(
+        *(digest(bucket_name, s3_key) for bucket_name, s3_key in objects),
+        return_exceptions=True,
+    )
+    return dict(zip(objects, results))
 
 
 @broker.task
 async def verify_s3_file_availability(
+    s3_file_metadata_ids: list[str],
+    session: AsyncSession = TaskiqDepends(get_async_session)
+) -> int:
+    """ Verify that uploaded objects match what the client claimed
+
+    Objects are checked concurrently on the storage thread pool, the
+    size and content type in the store are compared against the
+    file_size and mime_type the client provided. The outcome of every
+    object that could be checked is written in a single UPDATE.
+
+    Where the client provided a SHA-256 the content is also hashed,
+    once per object, and must match. Blobs shared by content addressed
+    uploads are marked valid along with the records.
+
+    Objects that could not be checked (e.g the store errored) are left
+    alone and picked up by the next sweep. Images that are found to be
+    valid are queued for their derivatives to be rendered.
+
+    Returns the number of objects that were found to be valid.
+    """
+    query = select(
+        S3FileMetadata.id,
+        S3FileMetadata.bucket_name,
+        S3FileMetadata.s3_key,
+        S3FileMetadata.file_size,
+        S3FileMetadata.mime_type,
+        S3FileMetadata.sha256,
+        S3FileMetadata.blob_id,
+        S3FileMetadata.derivative,
+    ).where(
+        S3FileMetadata.id.in_(s3_file_metadata_ids),
+        S3FileMetadata.is_valid.is_(False),
+        S3FileMetadata.deleted.is_(False),
+        S3FileMetadata.upload_state.in_(VERIFIABLE_STATES),
+    )
+
+    rows = (await session.execute(query)).all()
+
+    if not rows:
+        return 0
+
+    stats = await stat_objects(
+        minio_client,
+        ((row.bucket_name, row.s3_key) for row in rows),
+    )
+
+    matched_ids = {
+        row.id for row, stat in zip(rows, stats)
+        if not isinstance(stat, Exception) and
+        object_matches_claim(stat, row.file_size, row.mime_type)
+    }
+
+    digests = await _object_digests({
+        (row.bucket_name, row.s3_key) for row in rows
+        if row.id in matched_ids and row.sha256
+    })
+
+    checked_ids = []
+    valid_ids = []
+    valid_blob_ids = set()
+
+    for row, stat in zip(rows, stats):
+        if isinstance(stat, Exception):
+            continue
+
+        digest = digests.get((row.bucket_name, row.s3_key))
+
+        if isinstance(digest, Exception):
+            continue
+
+        checked_ids.append(row.id)
+
+        if row.id in matched_ids and (not row.sha256 or digest == row.sha256):
+            valid_ids.append(row.id)
+
+            if row.blob_id:
+                valid_blob_ids.add(row.blob_id)
+
+    if checked_ids:
+        await session.execute(
+            update(S3FileMetadata)
+            .where(S3FileMetadata.id.in_(checked_ids))
+            .values(
+                is_valid=S3FileMetadata.id.in_(valid_ids),
+                verified_at=datetime.now(timezone.utc),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if valid_blob_ids:
+            await session.execute(
+                update(S3Blob)
+                .where(S3Blob.id.in_(valid_blob_ids))
+                .values(
+                    is_valid=True,
+                    verified_at=datetime.now(timezone.utc),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+        valid = set(valid_ids)
+        for row in rows:
+            if (
+                row.id in valid and
+                row.derivative is None and
+                has_derivatives(row.mime_type)
+            ):
+                await OutboxMessage.enqueue(
+                    session,
+                    generate_image_derivatives,
+                    str(row.id),
+                )
+
+        await session.commit()
+
+    return len(valid_ids)
+
+
+@broker.task
+async def generate_image_derivatives(
     s3_file_metadata_id: str,
     session: AsyncSession = TaskiqDepends(get_async_session)
+) -> int:
+    """ Render the derivatives of an uploaded image
+
+    The original is streamed from the store to a temporary file and
+    rendered at each of IMAGING_SIZES in the image process pool (see
+    imaging.py), so resizing does not hold up other tasks on the
+    worker. Derivatives are stored under IMAGING_PREFIX and recorded
+    as valid files that refer to the original, owned by the user who
+    uploaded it.
+
+    Originals that already have derivatives, are too large or can't
+    be read as an image are skipped.
+
+    Returns the number of derivatives created.
+    """
+    derived = aliased(S3FileMetadata)
+
+    query = select(S3FileMetadata).where(
+        S3FileMetadata.id == s3_file_metadata_id,
+        S3FileMetadata.is_valid.is_(True),
+        S3FileMetadata.deleted.is_(False),
+        S3FileMetadata.derivative.is_(None),
+        S3FileMetadata.file_size <= settings.imaging.max_file_size,
+        ~exists().where(derived.derived_from_id == S3FileMetadata.id),
+    )
+
+    original = (await session.execute(query)).scalar_one_or_none()
+
+    if original is None:
+        return 0
+
+    with tempfile.NamedTemporaryFile(prefix="labs-image-") as original_file:
+        await async_storage.download_object(
+            original.bucket_name,
+            original.s3_key,
+            original_file,
+            chunk_size=settings.storage.download_chunk_size,
+        )
+
+        try:
+            derivatives = await render(
+                original_file.name,
+                settings.imaging.sizes,
+                format=settings.imaging.format,
+                quality=settings.imaging.quality,
+                max_pixels=settings.imaging.max_pixels,
+                processes=settings.imaging.processes,
+            )
+        except Exception:
+            logger.warning(
+                "Unable to render derivatives of %s",
+                original.id,
+                exc_info=True,
+            )
+            return 0
+
+    if not derivatives:
+        return 0
+
+    s3_keys = [
+        derivative_s3_key(original.id, derivative.name)
+        for derivative in derivatives
+    ]
+
+    await asyncio.gather(*(
+        async_storage.put_object(
+            original.bucket_name,
+            s3_key,
+            derivative.data,
+            content_type=settings.imaging.mime_type,
+        )
+        for s3_key, derivative in zip(s3_keys, derivatives)
+    ))
+
+    now = datetime.now(timezone.utc)
+    stem = original.file_name.rsplit(".", 1)[0]
+    extension = settings.imaging.format.lower()
+
+    await S3FileMetadata.create_many(session, [
+        dict(
+            bucket_name=original.bucket_name,
+            s3_key=s3_key,
+            file_name=f"{stem}-{derivative.name}.{extension}",
+            file_size=len(derivative.data),
+            mime_type=settings.imaging.mime_type,
+            is_valid=True,
+            verified_at=now,
+            upload_state=UploadState.completed,
+            derived_from_id=original.id,
+            derivative=derivative.name,
+            created_by_user_id=original.created_by_user_id,
+            last_updated_by_user_id=original.created_by_user_id,
+        )
+        for s3_key, derivative in zip(s3_keys, derivatives)
+    ])
+    await session.commit()
+
+    return len(derivatives)
+
+
+@broker.task(
+    schedule=[{"cron": "*/5 * * * *"}],
+)
+async def sweep_unverified_s3_files(
+    session: AsyncSession = TaskiqDepends(get_async_session)
+) -> int:
+    """ Queue verification of uploads that are yet to be validated
+
+    Picks up objects whose upload link has expired (so the upload has
+    either happened or never will) and that have not been checked
+    since, these are queued in batches so workers can share the load.
+
+    Objects found missing or invalid after their link expired stay so
+    and are left to the garbage collector, they are not queued again.
+    Objects yet to be checked (including those the store could not be
+    asked about) go first, then those checked before their link expired.
+
+    Returns the number of objects queued for verification.
+    """
+    now = datetime.now(timezone.utc)
+    upload_window = timedelta(seconds=settings.lifetime.link_s3_upload)
+
+    query = select(S3FileMetadata.id).where(
+        S3FileMetadata.is_valid.is_(False),
+        S3FileMetadata.deleted.is_(False),
+        S3FileMetadata.upload_state.in_(VERIFIABLE_STATES),
+        S3FileMetadata.created_at < now - upload_window,
+        or_(
+            S3FileMetadata.verified_at.is_(None),
+            S3FileMetadata.verified_at <
+            S3FileMetadata.created_at + upload_window,
+        ),
+    ).order_by(
+        S3FileMetadata.verified_at.asc().nulls_first(),
+        S3FileMetadata.created_at,
+    ).limit(
+        settings.storage.verify_batch_size * 10
+    )
+
+    ids = [str(id) for id in (await session.execute(query)).scalars()]
+
+    batch_size = settings.storage.verify_batch_size
+    for start in range(0, len(ids), batch_size):
+        await verify_s3_file_availability.kiq(ids[start:start + batch_size])
+
+    return len(ids)
+
+
+@broker.task(
+    schedule=[{"cron": "0 * * * *"}],
+)
+async def abort_stale_multipart_uploads(
+    session: AsyncSession = TaskiqDepends(get_async_session)
+) -> int:
+    """ Abort multipart uploads that were left unfinished
+
+    Parts of an unfinished upload take up space in the store until the
+    upload is aborted. Uploads that are older than the multipart
+    lifetime are aborted and their records logically deleted, uploads
+    that could not be aborted are retried on the next run.
+
+    Returns the number of uploads that were aborted.
+    """
+    now = datetime.now(timezone.utc)
+
+    query = select(
+        S3FileMetadata.id,
+        S3FileMetadata.bucket_name,
+        S3FileMetadata.s3_key,
+        S3FileMetadata.upload_id,
+    ).where(
+        S3FileMetadata.upload_state == UploadState.uploading,
+        S3FileMetadata.created_at < now - timedelta(
+            seconds=settings.lifetime.link_s3_multipart_upload
+        ),
+    ).limit(
+        settings.storage.verify_batch_size
+    )
+
+    rows = (await session.execute(query)).all()
+
+    results = await asyncio.gather(*(
+        async_storage.abort_multipart_upload(
+            row.bucket_name,
+            row.s3_key,
+            row.upload_id,
+        )
+        for row in rows
+    ), return_exceptions=True)
+
+    aborted_ids = [
+        row.id for row, result in zip(rows, results)
+        if not isinstance(result, Exception) or (
+            isinstance(result, StorageError) and
+            result.code == "NoSuchUpload"
+        )
+    ]
+
+    if aborted_ids:
+        await session.execute(
+            update(S3FileMetadata)
+            .where(S3FileMetadata.id.in_(aborted_ids))
+            .values(
+                upload_state=UploadState.aborted,
+                deleted=True,
+                deleted_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+    return len(aborted_ids)
+
+
+async def _remove_grouped_objects(rows) -> set[tuple[str, str]]:
+    """ Remove the objects of rows bucket by bucket
+
+    Returns the (bucket_name, s3_key) of objects that were not removed.
+    """
+    by_bucket = defaultdict(list)
+    for row in rows:
+        by_bucket[row.bucket_name].append(row.s3_key)
+
+    failed = set()
+    for bucket_name, s3_keys in by_bucket.items():
+        try:
+            errors = await remove_objects(minio_client, bucket_name, s3_keys)
+        except Exception:
+            logger.exception("Unable to remove objects from %s", bucket_name)
+            errors = set(s3_keys)
+
+        failed.update((bucket_name, s3_key) for s3_key in errors)
+
+    return failed
+
+
+async def _collect_s3_files(
+    session: AsyncSession,
+    rows,
+    report: Counter,
 ) -> None:
-    pass
+    """ Remove the objects of a batch of records and delete the records
+
+    Objects shared by content addressed records are not removed here,
+    the reference each record held on the blob is released instead.
+    Records whose object could not be removed are kept for next time.
+    """
+    owned = [row for row in rows if row.blob_id is None]
+    failed = await _remove_grouped_objects(owned)
+
+    removed = [
+        row for row in owned
+        if (row.bucket_name, row.s3_key) not in failed
+    ]
+    shared = [row for row in rows if row.blob_id is not None]
+
+    references = Counter(row.blob_id for row in shared)
+    if references:
+        released = values(
+            column("id", PGUUID(as_uuid=True)),
+            column("count", Integer),
+            name="released",
+        ).data(list(references.items()))
+
+        await session.execute(
+            update(S3Blob)
+            .where(S3Blob.id == released.c.id)
+            .values(ref_count=S3Blob.ref_count - released.c.count)
+            .execution_options(synchronize_session=False)
+        )
+
+    deleted_ids = [row.id for row in removed + shared]
+    if deleted_ids:
+        await session.execute(
+            delete(S3FileMetadata)
+            .where(S3FileMetadata.id.in_(deleted_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+    await session.commit()
+
+    report["objects_removed"] += len(removed)
+    report["bytes_reclaimed"] += sum(row.file_size for row in removed)
+    report["rows_deleted"] += len(deleted_ids)
+    report["errors"] += len(owned) - len(removed)
+
+
+async def _collect_s3_blobs(
+    session: AsyncSession,
+    rows,
+    report: Counter,
+) -> None:
+    """ Remove blobs that are no longer referred to
+
+    The blobs are locked while their objects are removed, an upload of
+    the same content waits and then creates a new blob rather than
+    referring to one whose object is being removed.
+    """
+    locked = (await session.execute(
+        select(
+            S3Blob.id,
+            S3Blob.bucket_name,
+            S3Blob.s3_key,
+            S3Blob.file_size,
+        ).where(
+            S3Blob.id.in_([row.id for row in rows]),
+            S3Blob.ref_count <= 0,
+        ).with_for_update(skip_locked=True)
+    )).all()
+
+    failed = await _remove_grouped_objects(locked)
+
+    removed = [
+        row for row in locked
+        if (row.bucket_name, row.s3_key) not in failed
+    ]
+
+    if removed:
+        await session.execute(
+            delete(S3Blob)
+            .where(S3Blob.id.in_([row.id for row in removed]))
+            .execution_options(synchronize_session=False)
+        )
+
+    await session.commit()
+
+    report["objects_removed"] += len(removed)
+    report["bytes_reclaimed"] += sum(row.file_size for row in removed)
+    report["errors"] += len(locked) - len(removed)
+
+
+@broker.task(
+    schedule=[{"cron": "0 3 * * *"}],
+)
+async def collect_s3_garbage(
+    session: AsyncSession = TaskiqDepends(get_async_session)
+) -> dict:
+    """ Remove objects that are no longer needed and their records
+
+    Candidates are records that were logically deleted, or whose object
+    failed verification (e.g it was never uploaded), once they are older
+    than the retention periods in the lifetime settings, and derivatives
+    whose original has been removed. Anything under
+    a legal hold or a multipart upload in progress is left alone.
+
+    Candidates are streamed from a server side cursor and handled in
+    batches of S3_GC_BATCH_SIZE, each batch is one request to the store
+    and is committed on its own, so memory use stays bounded no matter
+    how many records there are. Blobs of content addressed uploads that
+    are no longer referred to are removed last.
+
+    Returns what was reclaimed.
+    """
+    now = datetime.now(timezone.utc)
+    batch_size = settings.storage.gc_batch_size
+    report = Counter(objects_removed=0, bytes_reclaimed=0, rows_deleted=0, errors=0)
+
+    s3_files = select(
+        S3FileMetadata.id,
+        S3FileMetadata.bucket_name,
+        S3FileMetadata.s3_key,
+        S3FileMetadata.file_size,
+        S3FileMetadata.blob_id,
+    ).where(
+        S3FileMetadata.legal_hold.is_(False),
+        S3FileMetadata.upload_state != UploadState.uploading,
+        or_(
+            and_(
+                S3FileMetadata.deleted.is_(True),
+                func.coalesce(
+                    S3FileMetadata.deleted_at,
+                    S3FileMetadata.updated_at,
+                ) < now - timedelta(
+                    seconds=settings.lifetime.gc_deleted_s3_files
+                ),
+            ),
+            and_(
+                S3FileMetadata.is_valid.is_(False),
+                S3FileMetadata.verified_at.is_not(None),
+                S3FileMetadata.created_at < now - timedelta(
+                    seconds=settings.lifetime.gc_invalid_s3_files
+                ),
+            ),
+            and_(
+                S3FileMetadata.derivative.is_not(None),
+                S3FileMetadata.derived_from_id.is_(None),
+            ),
+        ),
+    ).execution_options(yield_per=batch_size)
+
+    s3_blobs = select(S3Blob.id).where(
+        S3Blob.ref_count <= 0,
+    ).execution_options(yield_per=batch_size)
+
+    # Candidates are read on a session of their own, the cursor stays
+    # open while each batch is committed on the task's session
+    async with AsyncSessionFactory() as stream_session:
+        result = await stream_session.stream(s3_files)
+        async for rows in result.partitions():
+            await _collect_s3_files(session, rows, report)
+
+        result = await stream_session.stream(s3_blobs)
+        async for rows in result.partitions():
+            await _collect_s3_blobs(session, rows, report)
+
+    gc_objects_removed.inc(report["objects_removed"])
+    gc_bytes_reclaimed.inc(report["bytes_reclaimed"])
+    gc_rows_deleted.inc(report["rows_deleted"])
+
+    logger.info(
+        "Garbage collection removed %d objects (%d bytes) and %d records, "
+        "%d objects could not be removed",
+        report["objects_removed"],
+        report["bytes_reclaimed"],
+        report["rows_deleted"],
+        report["errors"],
+    )
+
+    return dict(report)
@@ -0,0 +1,21 @@
+""" Helpers shared by the upload handlers
+
+"""
+from fastapi import HTTPException, status
+
+from ...dto import FileUploadRequest
+from ...utils import storage_router
+
+
+def bucket_for_request(upload_request: FileUploadRequest) -> str:
+    """ Bucket configured for the purpose of the upload
+
+    Raises a 400 if the purpose is not one of the configured buckets.
+    """
+    try:
+        return storage_router.bucket(upload_request.purpose)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown purpose {upload_request.purpose}",
+        )
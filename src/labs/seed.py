@@ -0,0 +1,421 @@
+""" Synthetic data to test the application at production scale
+
+Seeds millions of users and the files they uploaded, with timestamps
+spread over years, so that pagination, indexes and caches can be
+tried against a realistic amount of data locally.
+
+Rows are generated in chunks by a pool of processes, each streams its
+chunk into Postgres with COPY on its own connection. Users are seeded
+first, the files of a chunk refer to users by their index, whose ids
+are derived from the seed so no rows have to be read back.
+
+Every user has the same password, hashed once, bcrypt would otherwise
+take days for millions of users. Sign in as a seeded user with it e.g
+in the load tests (see benchmarks).
+
+Data is added to what is in the database, the same seed generates the
+same users so use another seed or initialise the database to run it
+again. Tables are analysed once seeding is complete.
+
+Usage:
+    python -m labs.seed --users 1000000 --files 5000000
+
+This is called from the command line via poetry scripts.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Callable, NamedTuple, Optional
+
+import asyncpg
+
+from .models import S3FileMetadata, User
+from .models.s3 import UploadState
+from .settings import settings
+from .utils import storage_router
+from .utils.auth import hash_password
+
+logger = logging.getLogger(__name__)
+
+# Ids of seeded users are derived from the seed and their index
+USER_NAMESPACE = uuid.UUID("5b3f2c1e-8d4a-4f6b-9c7e-2a1d0e9f8b7c")
+
+USER_COLUMNS = (
+    "id",
+    "email",
+    "mobile_number",
+    "password",
+    "otp_secret",
+    "first_name",
+    "last_name",
+    "is_admin",
+    "verified",
+    "created_at",
+    "updated_at",
+)
+
+FILE_COLUMNS = (
+    "id",
+    "bucket_name",
+    "s3_key",
+    "prefix",
+    "file_name",
+    "file_size",
+    "mime_type",
+    "deleted",
+    "legal_hold",
+    "is_valid",
+    "verified_at",
+    "upload_state",
+    "created_by_user_id",
+    "last_updated_by_user_id",
+    "deleted_by_user_id",
+    "created_at",
+    "updated_at",
+    "deleted_at",
+)
+
+# Mime type, extension, weight and the median and spread of the size
+# (lognormal) of files of the type
+FILE_TYPES = (
+    ("image/jpeg", "jpg", 40, 12.5, 1.0),
+    ("image/png", "png", 20, 12.0, 1.2),
+    ("application/pdf", "pdf", 25, 12.0, 1.5),
+    ("video/mp4", "mp4", 5, 17.0, 1.5),
+    ("text/csv", "csv", 10, 10.0, 2.0),
+)
+FILE_TYPE_WEIGHTS = [file_type[2] for file_type in FILE_TYPES]
+
+FILE_PREFIXES = (None, "avatars", "documents", "media")
+
+FILE_STEMS = (
+    "scan", "invoice", "photo", "receipt", "report", "export",
+    "statement", "screenshot", "contract", "recording",
+)
+
+BASE32 = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+
+
+class Plan(NamedTuple):
+    """ What to seed, shared by the processes seeding chunks """
+    seed: int
+    users: int
+    start: float  # Timestamps of the first user and of the end
+    end: float
+    password_hash: str
+    bucket_name: str
+    upload_window: float  # Seconds an upload link is valid for
+    first_names: tuple[str, ...]
+    last_names: tuple[str, ...]
+
+
+def make_plan(
+    users: int,
+    seed: int = 0,
+    years: float = 5,
+    password: str = "password",
+    password_hash: Optional[str] = None,
+) -> Plan:
+    """ Plan to seed users over the years up to now
+
+    Names are picked from pools generated once, generating a name per
+    row with faker would take longer than the rest of the row.
+    """
+    from faker import Faker
+
+    fake = Faker()
+    fake.seed_instance(seed)
+
+    def names(generate: Callable[[], str]) -> tuple[str, ...]:
+        return tuple(sorted({generate() for _ in range(2000)}))
+
+    end = time.time()
+
+    return Plan(
+        seed=seed,
+        users=users,
+        start=end - years * 365.25 * 24 * 3600,
+        end=end,
+        password_hash=password_hash or hash_password(password),
+        bucket_name=settings.storage.bucket_name,
+        upload_window=settings.lifetime.link_s3_upload,
+        first_names=names(fake.first_name),
+        last_names=names(fake.last_name),
+    )
+
+
+def user_id(plan: Plan, index: int) -> uuid.UUID:
+    return uuid.uuid5(USER_NAMESPACE, f"{plan.seed}:{index}")
+
+
+def user_created_at(plan: Plan, index: int) -> float:
+    """ Users signed up at a steady rate, in the order of their index
+    """
+    return plan.start + (plan.end - plan.start) * (index + 0.5) / plan.users
+
+
+def _datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def user_records(plan: Plan, first: int, count: int) -> list[tuple]:
+    """ Rows of the users first to first + count, in USER_COLUMNS
+    """
+    rng = random.Random(f"{plan.seed}:users:{first}")
+    records = []
+
+    for index in range(first, first + count):
+        first_name = rng.choice(plan.first_names)
+        last_name = rng.choice(plan.last_names)
+        created_at = user_created_at(plan, index)
+        local_part = re.sub(r"[^a-z]", "", f"{first_name}.{last_name}".lower())
+
+        records.append((
+            user_id(plan, index),
+            f"{local_part}.{plan.seed}.{index}@example.com",
+            (
+                f"+614{rng.randrange(10 ** 8):08d}"
+                if rng.random() < 0.6 else None
+            ),
+            plan.password_hash,
+            "".join(rng.choices(BASE32, k=32)),
+            first_name,
+            last_name,
+            rng.random() < 0.001,
+            rng.random() < 0.9,
+            _datetime(created_at),
+            _datetime(created_at + rng.random() * (plan.end - created_at)),
+        ))
+
+    return records
+
+
+def file_records(plan: Plan, first: int, count: int) -> list[tuple]:
+    """ Rows of the files first to first + count, in FILE_COLUMNS
+
+    Files are uploaded by a random user some time after they signed
+    up, most were verified shortly after and a few were deleted. The
+    rest failed verification once their upload link expired, as the
+    sweep finds them, so they are left to be collected.
+    """
+    rng = random.Random(f"{plan.seed}:files:{first}")
+    records = []
+
+    for index in range(first, first + count):
+        owner = rng.randrange(plan.users)
+        owner_id = user_id(plan, owner)
+        signed_up_at = user_created_at(plan, owner)
+        created_at = signed_up_at + rng.random() * (plan.end - signed_up_at)
+
+        mime_type, extension, _, mu, sigma = rng.choices(
+            FILE_TYPES,
+            FILE_TYPE_WEIGHTS,
+        )[0]
+        prefix = rng.choice(FILE_PREFIXES)
+        file_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+
+        is_valid = rng.random() < 0.95
+        verified_at = min(
+            created_at + (
+                rng.uniform(30, 600) if is_valid
+                else plan.upload_window + rng.uniform(0, 300)
+            ),
+            plan.end,
+        )
+        deleted_at = (
+            created_at + rng.random() * (plan.end - created_at)
+            if rng.random() < 0.03 else None
+        )
+
+        records.append((
+            file_id,
+            plan.bucket_name,
+            storage_router.sharded(f"{file_id.hex}.{extension}", prefix),
+            prefix,
+            f"{rng.choice(FILE_STEMS)}_{index}.{extension}",
+            max(int(rng.lognormvariate(mu, sigma)), 1),
+            mime_type,
+            deleted_at is not None,
+            False,
+            is_valid,
+            _datetime(verified_at),
+            (UploadState.completed if is_valid else UploadState.pending).value,
+            owner_id,
+            owner_id,
+            owner_id if deleted_at else None,
+            _datetime(created_at),
+            _datetime(deleted_at or verified_at),
+            _datetime(deleted_at) if deleted_at else None,
+        ))
+
+    return records
+
+
+async def _copy(table: str, columns: tuple, records: list[tuple]) -> None:
+    connection = await asyncpg.connect(str(settings.db.dsn))
+
+    try:
+        await connection.copy_records_to_table(
+            table,
+            records=records,
+            columns=columns,
+        )
+    finally:
+        await connection.close()
+
+
+def seed_chunk(
+    table: str,
+    columns: tuple,
+    make_records: Callable,
+    plan: Plan,
+    first: int,
+    count: int,
+) -> int:
+    """ Generate and COPY a chunk of rows, runs in a pool process
+    """
+    asyncio.run(_copy(table, columns, make_records(plan, first, count)))
+    return count
+
+
+def _seed_table(
+    executor: ProcessPoolExecutor,
+    table: str,
+    columns: tuple,
+    make_records: Callable,
+    plan: Plan,
+    total: int,
+    chunk_size: int,
+) -> None:
+    started = time.monotonic()
+    seeded = 0
+
+    futures = [
+        executor.submit(
+            seed_chunk,
+            table,
+            columns,
+            make_records,
+            plan,
+            first,
+            min(chunk_size, total - first),
+        )
+        for first in range(0, total, chunk_size)
+    ]
+
+    for future in as_completed(futures):
+        seeded += future.result()
+        logger.info(
+            "Seeded %d of %d rows of %s (%.0f rows/s)",
+            seeded,
+            total,
+            table,
+            seeded / (time.monotonic() - started),
+        )
+
+
+async def _analyse(tables: list[str]) -> None:
+    connection = await asyncpg.connect(str(settings.db.dsn))
+
+    try:
+        for table in tables:
+            await connection.execute(f'ANALYZE "{table}"')
+    finally:
+        await connection.close()
+
+
+def seed(
+    users: int,
+    files: int,
+    seed: int = 0,
+    years: float = 5,
+    password: str = "password",
+    chunk_size: int = 10000,
+    processes: Optional[int] = None,
+) -> None:
+    """ Seed users and then files, in chunks across processes
+    """
+    plan = make_plan(users, seed=seed, years=years, password=password)
+    tables = [User.__tablename__, S3FileMetadata.__tablename__]
+
+    # Processes are spawned, forking would copy the loop and the
+    # connection pools of the parent
+    with ProcessPoolExecutor(
+        processes or os.cpu_count(),
+        mp_context=get_context("spawn"),
+    ) as executor:
+        _seed_table(
+            executor,
+            tables[0],
+            USER_COLUMNS,
+            user_records,
+            plan,
+            users,
+            chunk_size,
+        )
+        _seed_table(
+            executor,
+            tables[1],
+            FILE_COLUMNS,
+            file_records,
+            plan,
+            files,
+            chunk_size,
+        )
+
+    asyncio.run(_analyse(tables))
+
+
+def run(argv: Optional[list[str]] = None):
+    """ Command line entrypoint, see the module documentation
+    """
+    parser = argparse.ArgumentParser(
+        prog=f"python -m {__name__}",
+        description="Seed the database with synthetic users and files",
+    )
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=500000)
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Same seed, same data, use another to seed more",
+    )
+    parser.add_argument(
+        "--years", type=float, default=5,
+        help="Users signed up over this many years up to now",
+    )
+    parser.add_argument(
+        "--password", default="password",
+        help="Password of every seeded user",
+    )
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument(
+        "--processes", type=int,
+        help="Processes generating and copying chunks, one per CPU by default",
+    )
+    args = parser.parse_args(argv)
+
+    if args.files and not args.users:
+        parser.error("files are uploaded by users, seed at least one")
+
+    logging.basicConfig(level=logging.INFO)
+    seed(
+        args.users,
+        args.files,
+        seed=args.seed,
+        years=args.years,
+        password=args.password,
+        chunk_size=args.chunk_size,
+        processes=args.processes,
+    )
+
+
+if __name__ == "__main__":
+    run()
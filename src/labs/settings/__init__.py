@@ -13,6 +13,14 @@ from .lifetime import LifetimeSettings
 from .jwt import JWTSettings
 from .api_router import APIRouterSettings
 from .verbosity import VerbositySettings
+from .outbox import OutboxSettings
+from .publisher import PublisherSettings
+from .worker import WorkerSettings
+from .imaging import ImagingSettings
+from .health import HealthSettings
+from .tracing import TracingSettings
+from .profiler import ProfilerSettings
+from .watchdog import WatchdogSettings
 
 
 class Settings(BaseSettings):
@@ -65,6 +73,30 @@ class Settings(BaseSettings):
     # Verbosity of various tokens
     verbosity: VerbositySettings = VerbositySettings()
 
+    # Relay of tasks written to the transactional outbox
+    outbox: OutboxSettings = OutboxSettings()
+
+    # Publishing tasks to the broker from API processes
+    publisher: PublisherSettings = PublisherSettings()
+
+    # Runtime configuration of the TaskIQ workers
+    worker: WorkerSettings = WorkerSettings()
+
+    # Derivatives of uploaded images
+    imaging: ImagingSettings = ImagingSettings()
+
+    # Readiness checks of the services the API depends on
+    health: HealthSettings = HealthSettings()
+
+    # Tracing of requests and tasks via OpenTelemetry
+    tracing: TracingSettings = TracingSettings()
+
+    # Debugging aids for performance, not to be enabled in production
+    profiler: ProfilerSettings = ProfilerSettings()
+
+    # Detection of calls that block the event loop
+    watchdog: WatchdogSettings = WatchdogSettings()
+
 
 # A singleton instance of the configuration
 settings: Settings = Settings()
@@ -17,6 +17,9 @@ class AMQPSettings(BaseSettings):
     port: int = 5672
     host: str
 
+    # Queue that TaskIQ workers consume tasks from
+    queue_name: str = "taskiq"
+
     @property
     def dsn(self) -> AmqpDsn:
         """ Construct the DSN for the AMQP broker
@@ -0,0 +1,18 @@
+""" Health check configuration
+
+Orchestrators probe every replica every few seconds, checks of the
+services the API depends on are cached so probes don't add load to
+the database or the broker in proportion to the number of replicas.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class HealthSettings(BaseSettings):
+
+    timeout: float = 2.0  # In seconds, for each service to respond
+    cache_ttl: float = 5.0  # In seconds, results are reused for this long
+
+    model_config = SettingsConfigDict(
+        env_prefix="HEALTH_",
+    )
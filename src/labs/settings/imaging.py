@@ -0,0 +1,47 @@
+""" Derivatives of uploaded images
+
+Once an uploaded image is verified smaller versions of it are rendered
+by the workers, so clients showing thumbnails or previews don't have
+to download the original.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class ImagingSettings(BaseSettings):
+
+    enabled: bool = True
+
+    # Content types of originals that derivatives are rendered for
+    mime_types: list[str] = [
+        "image/jpeg",
+        "image/png",
+        "image/webp",
+        "image/gif",
+        "image/tiff",
+        "image/bmp",
+    ]
+
+    # Longest side in pixels of each derivative, sizes that are larger
+    # than the original are skipped
+    sizes: list[int] = [128, 512, 1024]
+
+    # Derivatives are encoded in this format (Pillow format name)
+    format: str = "WEBP"
+    mime_type: str = "image/webp"
+    quality: int = 80
+
+    # Derivatives are stored under this prefix, followed by the id of
+    # the record of the original
+    prefix: str = "derived"
+
+    # Processes rendering derivatives in each worker process
+    processes: int = 2
+
+    # Originals above these limits are not processed
+    max_file_size: int = 50 * 1024 * 1024  # In bytes
+    max_pixels: int = 100_000_000
+
+    model_config = SettingsConfigDict(
+        env_prefix="IMAGING_",
+    )
@@ -18,6 +18,11 @@ class LifetimeSettings(BaseSettings):
 
     link_s3_upload: int = 300  # In seconds
     link_s3_download: int = 300  # In seconds
+    link_s3_multipart_upload: int = 86400  # In seconds, unfinished uploads are aborted
+    link_s3_cache_margin: int = 60  # In seconds, cached links have at least this left
+
+    gc_deleted_s3_files: int = 604800  # In seconds, logically deleted objects are kept
+    gc_invalid_s3_files: int = 86400  # In seconds, objects that failed verification are kept
 
     token_jwt_access: int = 1800
 
@@ -25,6 +30,7 @@ class LifetimeSettings(BaseSettings):
     token_account_verification: int = 600  # In seconds
 
     queue_retry_count: int = 6  # How many times should a query be retried
+    queue_idempotency_window: int = 300  # In seconds, duplicate tasks are dropped
 
     totp_token: int = 30  # How long is a token valid
     totp_drift_window: int = 30  # How far off can you drift
@@ -0,0 +1,27 @@
+""" Transactional outbox configuration
+
+Handlers write tasks to the outbox table and a relay process publishes
+them to the broker, these settings tune how the relay behaves.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class OutboxSettings(BaseSettings):
+
+    # Postgres channel used to wake up the relay
+    channel: str = "outbox"
+
+    batch_size: int = 100  # Messages published per transaction
+    poll_interval: int = 5  # In seconds, if no NOTIFY is received
+    max_attempts: int = 10  # Messages are not retried beyond this
+
+    # In seconds, the wait before retrying a failed message doubles
+    # with every attempt up to the max, the relay backs off the same
+    # way while the database is unavailable
+    retry_backoff: float = 1
+    max_retry_backoff: int = 300
+
+    model_config = SettingsConfigDict(
+        env_prefix="OUTBOX_",
+    )
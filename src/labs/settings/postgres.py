@@ -41,6 +41,29 @@ class PostgresSettings(BaseSettings):
             MultiHostUrl(db_url),
         )
 
+    @property
+    def dsn(self) -> PostgresDsn:
+        """Construct the Postgres DSN without a SQLAlchemy driver
+
+          This is used when talking to asyncpg directly e.g listening
+          for notifications or using COPY
+        """
+        db_url = "".join([
+            "postgresql://",
+            self.user,
+            ":",
+            self.password.get_secret_value(),
+            "@",
+            self.host,
+            ":",
+            str(self.port),
+            "/",
+            self.db])
+
+        return PostgresDsn(
+            MultiHostUrl(db_url),
+        )
+
     model_config = SettingsConfigDict(
         env_prefix="POSTGRES_",
     )
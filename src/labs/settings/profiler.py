@@ -0,0 +1,32 @@
+""" Profiling configuration
+
+Aids to find out where requests spend their time, these add overhead
+and expose details of the application so are off by default.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class ProfilerSettings(BaseSettings):
+
+    # Count and time the SQL statements of each request, reported in
+    # response headers and logs (see middleware/queries.py)
+    sql_enabled: bool = False
+
+    # A statement run this many times in a request is a probable N+1
+    sql_repeat_threshold: int = 3
+
+    # Longest CPU or memory profile an administrator may ask for, in
+    # seconds (see profiler.py and routers/admin)
+    max_seconds: float = 60.0
+
+    # Seconds between stack samples of the CPU profiler, the overhead
+    # of profiling is proportional to the rate
+    cpu_interval: float = 0.005
+
+    # Number of allocating lines reported by a memory profile
+    heap_limit: int = 25
+
+    model_config = SettingsConfigDict(
+        env_prefix="PROFILER_",
+    )
@@ -0,0 +1,31 @@
+""" AMQP publisher configuration for API processes
+
+Tasks queued by request handlers are published through a pool of
+channels with publisher confirms awaited in batches. These settings
+allow tuning the pool to the traffic an API process receives.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class PublisherSettings(BaseSettings):
+
+    # Set to False to use the broker's single channel
+    enabled: bool = True
+
+    channels: int = 4  # Channels opened on the write connection
+    batch_size: int = 50  # Messages confirmed together per channel
+    buffer_size: int = 1000  # Messages waiting before callers block
+
+    # If False the caller returns as soon as the message is buffered
+    # and publish failures are only logged and counted
+    await_confirm: bool = True
+    confirm_timeout: int = 10  # In seconds
+
+    # Seconds a stopping pool waits for the buffer to be published,
+    # messages left after are failed
+    drain_timeout: int = 10
+
+    model_config = SettingsConfigDict(
+        env_prefix="PUBLISHER_",
+    )
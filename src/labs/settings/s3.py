@@ -14,13 +14,55 @@ from pydantic.types import SecretStr
 class S3BucketSettings(BaseSettings):
 
     endpoint: str
-    bucket_name: str
+    bucket_name: str  # Default bucket, used where no purpose is given
+
+    # Further buckets by the purpose of the objects, provided as JSON
+    # e.g S3_BUCKETS='{"ugc": "labs-ugc", "media": "labs-media"}'
+    buckets: dict[str, str] = {}
+
+    # Hex characters of hash prefixed to keys, spreading requests
+    # over 16 ** key_shard_chars partitions of a bucket (0 disables)
+    key_shard_chars: int = 2
+
     port: int = 443  # Overriden for development
     access_key: Optional[SecretStr]
     secret_key: Optional[SecretStr]
     region: str = "ap-south-1"  # Set to Linode Singapore
     tls: bool = True  # See docs on using SSL in development
 
+    # Requests to the store that are made at the same time, this
+    # sizes the thread pool and the HTTP connection pool
+    max_concurrency: int = 16
+    timeout: int = 30  # In seconds, for connecting and reading
+    retries: int = 5  # Connection failures and server errors
+
+    # Presigned URLs kept in memory by each process for reuse
+    presign_cache_size: int = 10000
+
+    # Large files are uploaded in parts of at least this many bytes,
+    # parts are made larger for files that would need over 10,000
+    multipart_part_size: int = 16 * 1024 * 1024
+
+    # Uploads that provide a SHA-256 are stored once per content and
+    # user, the user's duplicates are not uploaded again
+    content_addressed: bool = False
+
+    # Most files a client can ask to upload in a single request
+    upload_batch_size: int = 500
+
+    # Objects removed by the garbage collector in a single request,
+    # the store accepts at most 1000
+    gc_batch_size: int = 1000
+
+    # Objects streamed through the API (see routers/upload/download.py)
+    # are read in chunks of this many bytes, limiting the memory each
+    # download uses, and each process serves at most so many at once
+    download_chunk_size: int = 64 * 1024
+    max_download_streams: int = 64
+
+    # Uploads are verified in batches by a scheduled sweep
+    verify_batch_size: int = 500
+
     model_config = SettingsConfigDict(
         env_prefix="S3_",
     )
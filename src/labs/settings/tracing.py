@@ -0,0 +1,24 @@
+""" OpenTelemetry tracing configuration
+
+Spans are exported to an OpenTelemetry collector (or any backend that
+accepts OTLP over HTTP), see tracing.py.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class TracingSettings(BaseSettings):
+
+    enabled: bool = False
+
+    # Name the spans of the API and workers are reported under
+    service_name: str = "labs"
+
+    endpoint: str = "http://localhost:4318/v1/traces"
+
+    # Fraction of traces that are recorded, between 0 and 1
+    sample_ratio: float = 1.0
+
+    model_config = SettingsConfigDict(
+        env_prefix="TRACING_",
+    )
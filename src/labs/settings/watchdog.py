@@ -0,0 +1,19 @@
+""" Event loop watchdog configuration
+
+Every API and worker process measures the lag of its event loop and
+logs the stack of calls that block it, see watchdog.py.
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class WatchdogSettings(BaseSettings):
+
+    enabled: bool = True
+
+    interval: float = 0.1  # In seconds, between heartbeats of the loop
+    threshold: float = 0.25  # In seconds, stalls longer are logged
+
+    model_config = SettingsConfigDict(
+        env_prefix="WATCHDOG_",
+    )
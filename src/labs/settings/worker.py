@@ -0,0 +1,36 @@
+""" Worker runtime configuration
+
+These settings control how many tasks a worker process runs at once,
+how many messages it holds on to, when a process is recycled and how
+long a process has to finish in flight tasks when asked to stop.
+
+They are passed to taskiq by the worker entrypoint (see worker.py).
+"""
+
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class WorkerSettings(BaseSettings):
+
+    processes: int = 2  # Worker processes started per container
+    concurrency: int = 10  # Tasks a process runs at the same time
+    prefetch: int = 10  # Messages a process holds that are yet to run
+
+    # A process is recycled after running this many tasks or if it's
+    # resident memory goes over the limit, None disables the check
+    max_tasks_per_child: Optional[int] = None
+    max_rss_mb: Optional[int] = None
+
+    # In seconds, on SIGTERM (or when recycled) the process stops
+    # fetching messages and waits this long for in flight tasks
+    drain_timeout: int = 30
+    shutdown_timeout: int = 5  # In seconds, to close broker connections
+
+    # Prometheus metrics of all worker processes are served on this port
+    metrics_port: int = 9100
+
+    model_config = SettingsConfigDict(
+        env_prefix="WORKER_",
+    )
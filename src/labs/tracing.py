@@ -0,0 +1,152 @@
+""" OpenTelemetry tracing
+
+Follows a request from the API through the database, the broker and
+the workers that run the tasks it queued, to the store and SMTP. The
+spans of a request share a trace, so a slow response can be broken
+down into where the time went.
+
+- FastAPI routes and SQLAlchemy statements are instrumented by the
+  OpenTelemetry instrumentations, see configure_tracing.
+- Tasks carry the trace context in their labels (see
+  middleware/tracing.py), tasks sent through the outbox carry the
+  context of the transaction that queued them.
+- Requests to the store and SMTP sends are wrapped in spans by the
+  clients in utils and email.py.
+
+Spans are exported over OTLP (HTTP) in batches. Tracing is off unless
+TRACING_ENABLED is set, spans are then no-ops and cost next to nothing.
+
+Usage:
+    from labs.tracing import tracer
+
+    with tracer.start_as_current_span("render"):
+        ...
+"""
+from typing import Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.trace import Span, SpanKind
+
+from .settings import settings
+
+tracer = trace.get_tracer(__package__)
+
+# Set up once per process by configure_tracing
+_provider = None
+
+
+def inject_trace_context(labels: dict) -> dict:
+    """ Add the current trace context to labels, unless they carry one
+
+    Labels of retried tasks, or of tasks relayed from the outbox,
+    already carry the context of the trace they belong to.
+    """
+    if "traceparent" not in labels:
+        propagate.inject(labels)
+
+    return labels
+
+
+def storage_span(
+    method: str,
+    bucket_name: Optional[str],
+    object_name: Optional[str] = None,
+) -> Span:
+    """ Span of a request to the object store, use as a context manager
+
+    The span is not made current, requests are leaves of the trace and
+    streamed responses are closed in another task than they are opened.
+    """
+    return tracer.start_span(
+        f"s3 {method}",
+        kind=SpanKind.CLIENT,
+        attributes={
+            "http.request.method": method,
+            "aws.s3.bucket": bucket_name or "",
+            "aws.s3.key": object_name or "",
+        },
+    )
+
+
+def configure_tracing(
+    service_name: Optional[str] = None,
+    exporter=None,
+):
+    """ Set up the tracer provider of the process and instrument the engine
+
+    Spans are exported over OTLP to TRACING_ENDPOINT in batches, pass
+    an exporter to use another (e.g an in memory exporter for tests),
+    it then exports each span as it ends.
+
+    Traces are sampled at TRACING_SAMPLE_RATIO when they start, spans
+    follow the decision of their parent so traces are kept whole.
+
+    Only the first call in a process has an effect, workers import the
+    API (see broker.py) and would otherwise set it up twice.
+    """
+    global _provider
+
+    if _provider is not None:
+        return _provider
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor,\
+        SimpleSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased,\
+        TraceIdRatioBased
+
+    from .db import engine
+
+    provider = TracerProvider(
+        resource=Resource.create({
+            "service.name": service_name or settings.tracing.service_name,
+        }),
+        sampler=ParentBased(TraceIdRatioBased(settings.tracing.sample_ratio)),
+    )
+
+    if exporter is None:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import\
+            OTLPSpanExporter
+
+        provider.add_span_processor(BatchSpanProcessor(
+            OTLPSpanExporter(endpoint=settings.tracing.endpoint)
+        ))
+    else:
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+    trace.set_tracer_provider(provider)
+    instrument_engine(engine)
+
+    _provider = provider
+    return provider
+
+
+def instrument_engine(engine) -> None:
+    """ Record a span for every statement executed on the engine
+    """
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
+    SQLAlchemyInstrumentor().instrument(
+        engine=getattr(engine, "sync_engine", engine),
+    )
+
+
+def instrument_app(app) -> None:
+    """ Record a span for every request served by the app
+
+    Metrics scrapes and health probes are not traced.
+    """
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    FastAPIInstrumentor.instrument_app(
+        app,
+        excluded_urls="/metrics,/ext/health",
+    )
+
+
+def shutdown_tracing() -> None:
+    """ Export spans that are yet to be sent
+    """
+    if _provider is not None:
+        _provider.shutdown()
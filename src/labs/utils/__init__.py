@@ -2,16 +2,75 @@
 
 """
 
-from minio import Minio
+import certifi
+import urllib3
 
 from ..settings  import settings
+from .presign import Presigner
+from .routing import StorageRouter
+from .s3 import AsyncStorage
+from .storage import TracedMinio
 
-minio_client = Minio(
+minio_client = TracedMinio(
     f"{settings.storage.endpoint}:{settings.storage.port}",
     access_key=settings.storage.access_key.get_secret_value(),
     secret_key=settings.storage.secret_key.get_secret_value(),
-    secure=settings.storage,
+    secure=settings.storage.tls,
     region=settings.storage.region,
+    # The connection pool must be as large as the number of threads
+    # making requests (see utils/storage.py) or connections are dropped
+    http_client=urllib3.PoolManager(
+        maxsize=settings.storage.max_concurrency,
+        timeout=urllib3.Timeout(
+            connect=settings.storage.timeout,
+            read=settings.storage.timeout,
+        ),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=certifi.where(),
+        retries=urllib3.Retry(
+            total=settings.storage.retries,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+    ),
+)
+
+# Decides the bucket and key of new objects (see utils/routing.py)
+storage_router = StorageRouter(
+    settings.storage.bucket_name,
+    buckets=settings.storage.buckets,
+    shard_chars=settings.storage.key_shard_chars,
+)
+
+# Signs URLs without a request to the store and caches them, use
+# this rather than the clients to presign (see utils/presign.py)
+presigner = Presigner(
+    f"{settings.storage.endpoint}:{settings.storage.port}",
+    access_key=settings.storage.access_key.get_secret_value(),
+    secret_key=settings.storage.secret_key.get_secret_value(),
+    region=settings.storage.region,
+    secure=settings.storage.tls,
+    cache_size=settings.storage.presign_cache_size,
+    cache_margin=settings.lifetime.link_s3_cache_margin,
+)
+
+# Async counterpart of the minio client for use on the event loop,
+# connections are pooled and opened on first use
+async_storage = AsyncStorage(
+    f"{settings.storage.endpoint}:{settings.storage.port}",
+    access_key=settings.storage.access_key.get_secret_value(),
+    secret_key=settings.storage.secret_key.get_secret_value(),
+    region=settings.storage.region,
+    secure=settings.storage.tls,
+    # Downloads hold a connection for as long as they stream, they
+    # must not starve the other requests of connections
+    max_connections=(
+        settings.storage.max_concurrency +
+        settings.storage.max_download_streams
+    ),
+    timeout=settings.storage.timeout,
+    retries=settings.storage.retries,
+    presigner=presigner,
 )
 
 def redis_client():
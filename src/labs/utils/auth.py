@@ -18,6 +18,7 @@ import bcrypt
 import jwt
 
 from ..settings import settings
+from ..tracing import tracer
 
 
 def verify_password(
@@ -28,10 +29,11 @@ def verify_password(
 
     the str.encode is used to convert the string to bytes
     """
-    return bcrypt.checkpw(
-        str.encode(plain_password),
-        str.encode(hashed_password)
-    )
+    with tracer.start_as_current_span("bcrypt verify"):
+        return bcrypt.checkpw(
+            str.encode(plain_password),
+            str.encode(hashed_password)
+        )
 
 
 def hash_password(password) -> str:
@@ -42,10 +44,11 @@ def hash_password(password) -> str:
 
     the input string has to be an byte string
     """
-    encoded_password = bcrypt.hashpw(
-        str.encode(password),
-        bcrypt.gensalt()
-    )
+    with tracer.start_as_current_span("bcrypt hash"):
+        encoded_password = bcrypt.hashpw(
+            str.encode(password),
+            bcrypt.gensalt()
+        )
     # Return a string representation so that it can be stored
     return encoded_password.decode()
 
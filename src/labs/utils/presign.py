@@ -0,0 +1,313 @@
+""" Offline presigning of object URLs with caching
+
+Every presigned URL costs a SigV4 signature, which is a chain of five
+HMACs to derive the signing key followed by one more to sign. The
+signing key only depends on the secret, the date and the region, so
+it's derived once a day and reused for every URL.
+
+URLs themselves stay valid for the lifetime they were signed with,
+a listing of hundreds of attachments would otherwise sign every one
+of them on every request. Signed URLs are cached per object and
+disposition and are handed out until they are close to expiring, so
+a client always receives a URL with at least the margin left to run.
+
+Nothing here makes a request to the store, the region is always
+known from the settings.
+
+Headers can be signed into a URL, the request must then carry them
+with the same values, e.g x-amz-checksum-sha256 so the store rejects
+any content but that with the digest (see checksum_headers).
+
+Usage:
+    from labs.utils import presigner
+
+    url = presigner.presigned_get_object(
+        bucket_name,
+        s3_key,
+        expires=timedelta(seconds=300),
+        disposition='attachment; filename="report.pdf"',
+    )
+"""
+import base64
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Hashable, Optional
+from urllib.parse import SplitResult, urlunsplit
+
+from minio.helpers import BaseURL, queryencode
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+
+
+def checksum_headers(sha256: str) -> dict[str, str]:
+    """ Headers that have the store check the SHA-256 of an upload
+
+    The store expects the digest in base64 rather than hex.
+    """
+    return {
+        "x-amz-checksum-sha256":
+            base64.b64encode(bytes.fromhex(sha256)).decode(),
+    }
+
+
+class URLCache:
+    """ A bounded cache of URLs that expire
+
+    Entries are evicted once they expire or, when the cache is full,
+    least recently used first.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            url, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return url
+
+    def set(self, key: Hashable, url: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (url, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class Presigner:
+    """ Signs object URLs locally, reusing signing keys and URLs
+
+    URLs are signed the same way the minio client signs them, and can
+    be used interchangeably.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        secure: bool = True,
+        cache_size: int = 10000,
+        cache_margin: int = 60,
+    ) -> None:
+        scheme = "https" if secure else "http"
+
+        self.access_key = access_key
+        self.region = region
+        self.cache_margin = cache_margin
+        self.cache = URLCache(cache_size)
+
+        self._secret_key = secret_key
+        self._base_url = BaseURL(f"{scheme}://{endpoint}", region)
+        self._signing_keys: dict[tuple[str, str], bytes] = {}
+
+    def signing_key(self, date_stamp: str, region: str) -> bytes:
+        """ The key used to sign requests on a date (YYYYMMDD) in a region
+
+        Keys are derived once and kept until the date changes.
+        """
+        key = self._signing_keys.get((date_stamp, region))
+
+        if key is None:
+            key = hmac.digest(
+                ("AWS4" + self._secret_key).encode(),
+                date_stamp.encode(),
+                "sha256",
+            )
+            for part in (region, "s3", "aws4_request"):
+                key = hmac.digest(key, part.encode(), "sha256")
+
+            # Only the current date is useful, keys of previous
+            # dates are dropped rather than kept forever
+            self._signing_keys = {
+                k: v for k, v in self._signing_keys.items()
+                if k[0] == date_stamp
+            }
+            self._signing_keys[(date_stamp, region)] = key
+
+        return key
+
+    def presign(
+        self,
+        method: str,
+        bucket_name: str,
+        object_name: str,
+        expires: int,
+        query_params: Optional[dict] = None,
+        date: Optional[datetime] = None,
+        headers: Optional[dict] = None,
+    ) -> str:
+        """ Sign a URL for the object that is valid for expires seconds
+
+        Any headers are signed along with the host, requests using the
+        URL must send them with the same values.
+        """
+        date = (date or datetime.now(timezone.utc)).astimezone(timezone.utc)
+        date_stamp = date.strftime("%Y%m%d")
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+
+        url = self._base_url.build(
+            method=method,
+            region=self.region,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            query_params=query_params,
+        )
+
+        signed_headers = {
+            name.lower(): value.strip()
+            for name, value in (headers or {}).items()
+        }
+        signed_headers["host"] = url.netloc
+        header_names = ";".join(sorted(signed_headers))
+
+        query = url.query + "&" if url.query else ""
+        query += (
+            f"X-Amz-Algorithm={ALGORITHM}"
+            f"&X-Amz-Credential={queryencode(self.access_key + '/' + scope)}"
+            f"&X-Amz-Date={date.strftime('%Y%m%dT%H%M%SZ')}"
+            f"&X-Amz-Expires={expires}"
+            f"&X-Amz-SignedHeaders={queryencode(header_names)}"
+        )
+
+        canonical_query = "&".join(
+            "=".join(pair) for pair in sorted(
+                param.split("=") for param in query.split("&")
+            )
+        )
+        canonical_request = (
+            f"{method}\n"
+            f"{url.path or '/'}\n"
+            f"{canonical_query}\n"
+            + "".join(
+                f"{name}:{signed_headers[name]}\n"
+                for name in sorted(signed_headers)
+            ) +
+            f"\n{header_names}\n"
+            f"UNSIGNED-PAYLOAD"
+        )
+        string_to_sign = (
+            f"{ALGORITHM}\n{date.strftime('%Y%m%dT%H%M%SZ')}\n{scope}\n"
+            f"{hashlib.sha256(canonical_request.encode()).hexdigest()}"
+        )
+        signature = hmac.new(
+            self.signing_key(date_stamp, self.region),
+            string_to_sign.encode(),
+            hashlib.sha256,
+        ).hexdigest()
+
+        return urlunsplit(SplitResult(
+            url.scheme,
+            url.netloc,
+            url.path,
+            f"{query}&X-Amz-Signature={signature}",
+            url.fragment,
+        ))
+
+    def _cached_presign(
+        self,
+        cache_key: Hashable,
+        method: str,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta,
+        query_params: Optional[dict] = None,
+    ) -> str:
+        url = self.cache.get(cache_key)
+
+        if url is not None:
+            return url
+
+        seconds = int(expires.total_seconds())
+        url = self.presign(
+            method,
+            bucket_name,
+            object_name,
+            seconds,
+            query_params=query_params,
+        )
+
+        # URLs that are too short lived to hand out again are not kept
+        if seconds > self.cache_margin:
+            self.cache.set(cache_key, url, seconds - self.cache_margin)
+
+        return url
+
+    def presigned_get_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta = timedelta(days=7),
+        disposition: Optional[str] = None,
+    ) -> str:
+        """ A URL to download the object, cached per disposition
+        """
+        query_params = (
+            {"response-content-disposition": disposition}
+            if disposition else None
+        )
+
+        return self._cached_presign(
+            ("GET", bucket_name, object_name, disposition, expires),
+            "GET",
+            bucket_name,
+            object_name,
+            expires,
+            query_params=query_params,
+        )
+
+    def presigned_put_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta = timedelta(days=7),
+        sha256: Optional[str] = None,
+    ) -> str:
+        """ A URL to create or replace the object
+
+        With a sha256 only content with that digest is accepted, the
+        upload must send checksum_headers(sha256). These URLs are for
+        objects shared by uploads and are never cached, each upload is
+        handed a URL of its own.
+        """
+        if sha256:
+            return self.presign(
+                "PUT",
+                bucket_name,
+                object_name,
+                int(expires.total_seconds()),
+                headers=checksum_headers(sha256),
+            )
+
+        return self._cached_presign(
+            ("PUT", bucket_name, object_name, None, expires),
+            "PUT",
+            bucket_name,
+            object_name,
+            expires,
+        )
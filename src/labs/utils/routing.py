@@ -0,0 +1,91 @@
+""" Routing of objects to buckets and key prefixes
+
+An application may store objects in more than one bucket, e.g user
+generated content in a private bucket and media in a public one. The
+router maps the purpose of an upload to a configured bucket, records
+keep the name of their bucket so they are always found where they were
+put, even if the configuration changes later.
+
+Stores partition their request rate by key prefix, keys that all start
+the same way are served by the same partition. Keys are given a short
+prefix derived from a hash of the name, which spreads the requests
+evenly across 16 ** shard_chars partitions.
+
+Usage:
+    from labs.utils import storage_router
+
+    bucket_name = storage_router.bucket("media")
+    s3_key = storage_router.key("photo.jpg", prefix="avatars")
+"""
+import hashlib
+from typing import Optional
+from uuid import uuid4
+
+
+class StorageRouter:
+    """ Decides the bucket and key of new objects
+    """
+
+    def __init__(
+        self,
+        default_bucket: str,
+        buckets: Optional[dict[str, str]] = None,
+        shard_chars: int = 2,
+    ) -> None:
+        self.default_bucket = default_bucket
+        self.buckets = dict(buckets or {})
+        self.shard_chars = shard_chars
+
+    @property
+    def bucket_names(self) -> set[str]:
+        """ Every bucket the application stores objects in
+        """
+        return {self.default_bucket, *self.buckets.values()}
+
+    def bucket(self, purpose: Optional[str] = None) -> str:
+        """ Bucket for objects of a purpose, the default bucket if None
+
+        Raises a KeyError if the purpose has not been configured.
+        """
+        if purpose is None:
+            return self.default_bucket
+
+        return self.buckets[purpose]
+
+    def shard(self, name: str) -> str:
+        """ Prefix that spreads keys evenly across partitions
+        """
+        return hashlib.blake2b(
+            name.encode(),
+            digest_size=8,
+        ).hexdigest()[:self.shard_chars]
+
+    def sharded(self, name: str, prefix: Optional[str] = None) -> str:
+        """ Key for a name, with the shard and optional prefix
+        """
+        parts = [prefix.strip("/")] if prefix else []
+
+        if self.shard_chars:
+            parts.append(self.shard(name))
+
+        parts.append(name)
+        return "/".join(parts)
+
+    def key(
+        self,
+        file_name: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
+        """ A new key, keeping the extension of the file name
+
+        While for files that are accessed by presigned URLs the
+        extension is not required, it's useful for public files.
+        """
+        suffix = ""
+
+        if file_name:
+            file_name_split = file_name.split('.')
+            if len(file_name_split) > 1:
+                suffix = "." + file_name_split[-1]
+
+        return self.sharded(uuid4().hex + suffix, prefix)
@@ -0,0 +1,589 @@
+""" Native async client for S3 compatible object stores
+
+The minio client is synchronous, the helpers in storage.py move its
+calls off the event loop onto a thread pool, which costs a thread per
+request in flight. This client speaks to the store directly over a
+pooled httpx connection manager, signing requests using the minio
+signer so the two clients agree on URLs and signatures.
+
+Only the operations the application uses are provided, each mirrors
+the minio method of the same name.
+
+Usage:
+    from labs.utils import async_storage
+
+    stat = await async_storage.stat_object(bucket_name, s3_key)
+    url = async_storage.presigned_get_object(bucket_name, s3_key)
+"""
+import asyncio
+import hashlib
+import xml.etree.ElementTree as ET
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO, Optional
+from urllib.parse import SplitResult, urlunsplit
+
+import certifi
+import httpx
+from minio.commonconfig import ENABLED, DISABLED
+from minio.credentials import Credentials
+from minio.datatypes import Object, Part
+from minio.helpers import BaseURL, md5sum_hash, sha256_hash
+from minio.legalhold import LegalHold
+from minio.signer import sign_v4_s3
+from minio.time import to_amz_date
+from minio.xml import Element, SubElement, findall, findtext, getbytes, marshal
+
+from ..tracing import storage_span
+from .presign import Presigner
+
+# Responses that are worth retrying, the store is either overloaded
+# or a node is unavailable
+RETRY_STATUS = (500, 502, 503, 504)
+
+# Error codes the store uses for a missing object
+NOT_FOUND_CODES = ("NoSuchKey", "NoSuchObject", "NotFound")
+
+# Parts of a multipart upload must be at least 5MiB, except the last
+# one, and an upload can have at most 10,000 parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_COUNT = 10000
+
+
+def part_layout(file_size: int, part_size: int) -> tuple[int, int]:
+    """ Size and number of parts to upload a file in
+
+    The part size is raised (in whole MiB) where the file would
+    otherwise need more parts than the store allows.
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+
+    if file_size > part_size * MAX_PART_COUNT:
+        mib = 1024 * 1024
+        part_size = -(-file_size // MAX_PART_COUNT)
+        part_size = -(-part_size // mib) * mib
+
+    return part_size, max(1, -(-file_size // part_size))
+
+
+class StorageError(Exception):
+    """ Raised when the store responds with an error
+
+    code is the S3 error code (e.g NoSuchKey) where the store provided
+    one, HEAD requests carry no body so the status is used instead.
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        code: Optional[str] = None,
+        message: Optional[str] = None,
+    ):
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        super().__init__(
+            f"S3 operation failed; status: {status_code}, "
+            f"code: {code}, message: {message}"
+        )
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "StorageError":
+        code = message = None
+
+        if response.content:
+            try:
+                element = ET.fromstring(response.content)
+                code = element.findtext("Code")
+                message = element.findtext("Message")
+            except ET.ParseError:
+                pass
+
+        if code is None and response.status_code == 404:
+            code = "NotFound"
+
+        return cls(response.status_code, code, message)
+
+
+class AsyncStorage:
+    """ Async client for a single S3 compatible endpoint
+
+    The underlying httpx client is created on first use so the
+    instance can be created at import time, call close() on shutdown
+    to release the pooled connections.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        secure: bool = True,
+        max_connections: int = 16,
+        timeout: float = 30,
+        retries: int = 5,
+        backoff_factor: float = 0.2,
+        presigner: Optional[Presigner] = None,
+    ) -> None:
+        scheme = "https" if secure else "http"
+
+        self.region = region
+        self.credentials = Credentials(access_key, secret_key)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+        self._base_url = BaseURL(f"{scheme}://{endpoint}", region)
+        self.presigner = presigner or Presigner(
+            endpoint,
+            access_key,
+            secret_key,
+            region,
+            secure=secure,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                # Waiting for a connection from the pool is bounded by
+                # the callers, not the timeout
+                timeout=httpx.Timeout(self.timeout, pool=None),
+                # Retries connection failures, responses are retried
+                # in _execute as httpx does not look at the status
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.retries,
+                    verify=certifi.where(),
+                ),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _sign(
+        self,
+        method: str,
+        url: SplitResult,
+        body: bytes = b"",
+        headers: Optional[dict] = None,
+    ) -> dict:
+        """ Headers for a request signed at the current time
+        """
+        date = datetime.now(timezone.utc)
+        request_headers = dict(headers or {})
+        request_headers["Host"] = url.netloc
+        request_headers["x-amz-date"] = to_amz_date(date)
+        request_headers["x-amz-content-sha256"] = (
+            "UNSIGNED-PAYLOAD" if self._base_url.is_https
+            else sha256_hash(body)
+        )
+        if body:
+            request_headers["Content-Length"] = str(len(body))
+
+        return sign_v4_s3(
+            method=method,
+            url=url,
+            region=self.region,
+            headers=request_headers,
+            credentials=self.credentials,
+            content_sha256=request_headers["x-amz-content-sha256"],
+            date=date,
+        )
+
+    async def _execute(
+        self,
+        method: str,
+        bucket_name: str,
+        object_name: Optional[str] = None,
+        body: bytes = b"",
+        headers: Optional[dict] = None,
+        query_params: Optional[dict] = None,
+    ) -> httpx.Response:
+        """ Sign and send a request, retrying on server errors
+
+        Each attempt is signed again as signatures carry the time.
+        """
+        url = self._base_url.build(
+            method=method,
+            region=self.region,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            query_params=query_params,
+        )
+
+        with storage_span(method, bucket_name, object_name) as span:
+            for attempt in range(self.retries + 1):
+                request_headers = self._sign(method, url, body, headers)
+
+                response = await self.client.request(
+                    method,
+                    urlunsplit(url),
+                    content=body or None,
+                    headers=request_headers,
+                )
+
+                if response.status_code not in RETRY_STATUS:
+                    break
+
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+            span.set_attribute("http.response.status_code", response.status_code)
+
+        if response.is_error:
+            raise StorageError.from_response(response)
+
+        return response
+
+    @asynccontextmanager
+    async def get_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        headers: Optional[dict] = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """ Stream the content of an object
+
+        The response is yielded as soon as the headers arrive, read the
+        body with aiter_bytes. Headers such as Range and If-None-Match
+        are passed to the store, so the status may be 206, 304 or 416
+        as well as an error, it's up to the caller to check.
+
+        Usage:
+            async with async_storage.get_object(bucket, key) as response:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    ...
+        """
+        url = self._base_url.build(
+            method="GET",
+            region=self.region,
+            bucket_name=bucket_name,
+            object_name=object_name,
+        )
+
+        with storage_span("GET", bucket_name, object_name) as span:
+            async with self.client.stream(
+                "GET",
+                urlunsplit(url),
+                headers=self._sign("GET", url, headers=headers),
+            ) as response:
+                span.set_attribute(
+                    "http.response.status_code",
+                    response.status_code,
+                )
+                yield response
+
+    async def object_sha256(
+        self,
+        bucket_name: str,
+        object_name: str,
+        chunk_size: int = 1024 * 1024,
+    ) -> str:
+        """ Hex SHA-256 of the content of an object
+
+        The object is streamed through the hash a chunk at a time so
+        memory use does not depend on the size of the object.
+        """
+        digest = hashlib.sha256()
+
+        async with self.get_object(bucket_name, object_name) as response:
+            if response.is_error:
+                await response.aread()
+                raise StorageError.from_response(response)
+
+            async for chunk in response.aiter_bytes(chunk_size):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    async def download_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        file: BinaryIO,
+        chunk_size: int = 1024 * 1024,
+    ) -> int:
+        """ Write the content of an object to a file, a chunk at a time
+
+        Returns the number of bytes written.
+        """
+        size = 0
+
+        async with self.get_object(bucket_name, object_name) as response:
+            if response.is_error:
+                await response.aread()
+                raise StorageError.from_response(response)
+
+            async for chunk in response.aiter_bytes(chunk_size):
+                size += file.write(chunk)
+
+        file.flush()
+        return size
+
+    async def stat_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+    ) -> Object:
+        """ Get the size, type and other information of an object
+        """
+        response = await self._execute("HEAD", bucket_name, object_name)
+
+        last_modified = response.headers.get("last-modified")
+
+        return Object(
+            bucket_name,
+            object_name,
+            last_modified=(
+                parsedate_to_datetime(last_modified)
+                if last_modified else None
+            ),
+            etag=response.headers.get("etag", "").replace('"', ""),
+            size=int(response.headers.get("content-length", 0)),
+            content_type=response.headers.get("content-type"),
+            metadata=response.headers,
+            version_id=response.headers.get("x-amz-version-id"),
+        )
+
+    async def head_bucket(self, bucket_name: str) -> None:
+        """ Check that the bucket exists and can be accessed
+
+        Raises a StorageError otherwise.
+        """
+        await self._execute("HEAD", bucket_name)
+
+    async def stat_object_or_none(
+        self,
+        bucket_name: str,
+        object_name: str,
+    ) -> Optional[Object]:
+        """ As stat_object, but None where the object does not exist
+        """
+        try:
+            return await self.stat_object(bucket_name, object_name)
+        except StorageError as e:
+            if e.code in NOT_FOUND_CODES:
+                return None
+            raise
+
+    async def put_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        data: bytes,
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        """ Create or replace a (small) object, returns its etag
+
+        The content is sent in a single request, use multipart uploads
+        for large objects.
+        """
+        response = await self._execute(
+            "PUT",
+            bucket_name,
+            object_name,
+            body=data,
+            headers={
+                "Content-Type": content_type,
+                "Content-MD5": md5sum_hash(data),
+            },
+        )
+        return response.headers.get("etag", "").replace('"', "")
+
+    async def _set_object_legal_hold(
+        self,
+        bucket_name: str,
+        object_name: str,
+        status: str,
+    ) -> None:
+        body = marshal(LegalHold(status == ENABLED))
+        await self._execute(
+            "PUT",
+            bucket_name,
+            object_name,
+            body=body,
+            headers={"Content-MD5": md5sum_hash(body)},
+            query_params={"legal-hold": ""},
+        )
+
+    async def enable_object_legal_hold(
+        self,
+        bucket_name: str,
+        object_name: str,
+    ) -> None:
+        await self._set_object_legal_hold(bucket_name, object_name, ENABLED)
+
+    async def disable_object_legal_hold(
+        self,
+        bucket_name: str,
+        object_name: str,
+    ) -> None:
+        await self._set_object_legal_hold(bucket_name, object_name, DISABLED)
+
+    async def create_multipart_upload(
+        self,
+        bucket_name: str,
+        object_name: str,
+        content_type: Optional[str] = None,
+    ) -> str:
+        """ Start a multipart upload, returns the id of the upload
+        """
+        response = await self._execute(
+            "POST",
+            bucket_name,
+            object_name,
+            headers={
+                "Content-Type": content_type or "application/octet-stream"
+            },
+            query_params={"uploads": ""},
+        )
+        element = ET.fromstring(response.content)
+        return findtext(element, "UploadId", True)
+
+    async def list_parts(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+    ) -> list[Part]:
+        """ Every part uploaded so far, following each page of results
+        """
+        parts = []
+        query_params = {"uploadId": upload_id, "max-parts": "1000"}
+
+        while True:
+            response = await self._execute(
+                "GET",
+                bucket_name,
+                object_name,
+                query_params=query_params,
+            )
+            element = ET.fromstring(response.content)
+            parts.extend(
+                Part.fromxml(tag) for tag in findall(element, "Part")
+            )
+
+            if findtext(element, "IsTruncated") != "true":
+                return parts
+
+            query_params = dict(
+                query_params,
+                **{
+                    "part-number-marker":
+                    findtext(element, "NextPartNumberMarker", True)
+                },
+            )
+
+    async def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+        parts: list[Part],
+    ) -> str:
+        """ Assemble the parts into the object, returns its etag
+        """
+        element = Element("CompleteMultipartUpload")
+        for part in sorted(parts, key=lambda part: part.part_number):
+            tag = SubElement(element, "Part")
+            SubElement(tag, "PartNumber", str(part.part_number))
+            SubElement(tag, "ETag", '"' + part.etag + '"')
+        body = getbytes(element)
+
+        response = await self._execute(
+            "POST",
+            bucket_name,
+            object_name,
+            body=body,
+            headers={
+                "Content-Type": "application/xml",
+                "Content-MD5": md5sum_hash(body),
+            },
+            query_params={"uploadId": upload_id},
+        )
+
+        # Errors can be reported in the body of a successful response
+        # once the store has started assembling the object
+        element = ET.fromstring(response.content)
+        if element.tag == "Error":
+            raise StorageError(
+                response.status_code,
+                element.findtext("Code"),
+                element.findtext("Message"),
+            )
+
+        return (findtext(element, "ETag") or "").replace('"', "")
+
+    async def abort_multipart_upload(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+    ) -> None:
+        """ Abort the upload, the store discards the uploaded parts
+        """
+        await self._execute(
+            "DELETE",
+            bucket_name,
+            object_name,
+            query_params={"uploadId": upload_id},
+        )
+
+    def get_presigned_url(
+        self,
+        method: str,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta,
+        query_params: Optional[dict] = None,
+    ) -> str:
+        """ Presign a URL, this is computed locally and does not block
+
+        URLs signed here are not cached, see presign.py for the cache.
+        """
+        return self.presigner.presign(
+            method,
+            bucket_name,
+            object_name,
+            int(expires.total_seconds()),
+            query_params=query_params,
+        )
+
+    def presigned_get_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta = timedelta(days=7),
+        response_headers: Optional[dict] = None,
+    ) -> str:
+        return self.get_presigned_url(
+            "GET",
+            bucket_name,
+            object_name,
+            expires,
+            query_params=response_headers,
+        )
+
+    def presigned_put_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta = timedelta(days=7),
+    ) -> str:
+        return self.get_presigned_url(
+            "PUT",
+            bucket_name,
+            object_name,
+            expires,
+        )
@@ -0,0 +1,158 @@
+""" Helpers for working with objects in the store
+
+The minio client is synchronous, calling it directly from a coroutine
+blocks the event loop for the duration of the request. These helpers
+run the calls on a bounded thread pool so many requests can be in
+flight without blocking the loop or overwhelming the store.
+
+Calls run in the context of the caller, so their spans (see
+TracedMinio) belong to the caller's trace.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Union
+
+from minio import Minio
+from minio.datatypes import Object
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+from ..settings import settings
+from ..tracing import storage_span
+
+# Shared by all callers in the process, sized to match the
+# connection pool of the minio client
+storage_executor = ThreadPoolExecutor(
+    max_workers=settings.storage.max_concurrency,
+    thread_name_prefix="storage",
+)
+
+
+class TracedMinio(Minio):
+    """ Minio client that records a span for each request to the store
+    """
+
+    def _url_open(
+        self,
+        method,
+        region,
+        bucket_name=None,
+        object_name=None,
+        *args,
+        **kwargs,
+    ):
+        with storage_span(method, bucket_name, object_name) as span:
+            response = super()._url_open(
+                method,
+                region,
+                bucket_name,
+                object_name,
+                *args,
+                **kwargs,
+            )
+            span.set_attribute("http.response.status_code", response.status)
+            return response
+
+
+def object_matches_claim(
+    stat: Optional[Object],
+    file_size: int,
+    mime_type: str,
+) -> bool:
+    """ Check an object in the store against what the client claimed
+
+    Content types are compared without parameters (e.g charset) and
+    regardless of case, a missing object never matches.
+    """
+    if stat is None:
+        return False
+
+    content_type = (stat.content_type or "").split(";")[0].strip().lower()
+
+    return (
+        stat.size == file_size and
+        content_type == mime_type.split(";")[0].strip().lower()
+    )
+
+
+def _stat_object_or_none(
+    client: Minio,
+    bucket_name: str,
+    s3_key: str,
+) -> Optional[Object]:
+    try:
+        return client.stat_object(bucket_name, s3_key)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject", "NotFound"):
+            return None
+        raise
+
+
+async def stat_objects(
+    client: Minio,
+    objects: Iterable[tuple[str, str]],
+    executor: ThreadPoolExecutor = storage_executor,
+) -> list[Union[Object, None, Exception]]:
+    """ Stat many (bucket_name, s3_key) objects concurrently
+
+    Results are in the same order as the objects, missing objects
+    are None and any other error is returned in place of the result
+    so one failure does not fail the batch.
+    """
+    loop = asyncio.get_running_loop()
+
+    return await asyncio.gather(*(
+        loop.run_in_executor(
+            executor,
+            contextvars.copy_context().run,
+            _stat_object_or_none,
+            client,
+            bucket_name,
+            s3_key,
+        )
+        for bucket_name, s3_key in objects
+    ), return_exceptions=True)
+
+
+def _remove_objects(
+    client: Minio,
+    bucket_name: str,
+    s3_keys: list[str],
+) -> set[str]:
+    # Errors are yielded lazily, the request is only made once the
+    # iterator is consumed
+    return {
+        error.name
+        for error in client.remove_objects(
+            bucket_name,
+            (DeleteObject(s3_key) for s3_key in s3_keys),
+        )
+    }
+
+
+async def remove_objects(
+    client: Minio,
+    bucket_name: str,
+    s3_keys: list[str],
+    executor: ThreadPoolExecutor = storage_executor,
+) -> set[str]:
+    """ Remove objects from a bucket, 1000 per request to the store
+
+    Keys of objects that are already missing are treated as removed.
+
+    Returns the keys of the objects that could not be removed.
+    """
+    if not s3_keys:
+        return set()
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(
+        executor,
+        contextvars.copy_context().run,
+        _remove_objects,
+        client,
+        bucket_name,
+        s3_keys,
+    )
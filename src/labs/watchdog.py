@@ -0,0 +1,135 @@
+""" Watchdog for calls that block the event loop
+
+A synchronous call on the event loop (e.g hashing a password, sending
+an email or a request with the minio client) holds up every other
+request or task the process is serving until it returns.
+
+The watchdog schedules a heartbeat on the loop, the lag is how much
+later than asked for the heartbeat runs, and is recorded for every
+beat (see metrics.py). A helper thread watches the heartbeat, if the
+loop has not beaten for longer than the threshold it samples the stack
+of the loop's thread, which shows the call that is blocking it and the
+coroutine that made it, and logs it. A stall is sampled once.
+
+The API (see api.py) and the workers (see broker.py) run a watchdog,
+configured by the WATCHDOG_ settings.
+
+Usage:
+    from labs.watchdog import loop_watchdog
+
+    loop_watchdog.start()  # on the loop
+    ...
+    await loop_watchdog.stop()
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from .metrics import event_loop_lag_seconds, event_loop_stalls
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """ Measures the lag of the running loop and samples stalls
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25) -> None:
+        self.interval = interval
+        self.threshold = threshold
+
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+        self._loop_thread_id: Optional[int] = None
+        self._beat_at = 0.0
+        self._sampled = False
+
+    @property
+    def is_running(self) -> bool:
+        return self._heartbeat is not None
+
+    def start(self) -> None:
+        """ Start watching the running loop, call this from the loop
+        """
+        if self.is_running:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._stopped.clear()
+
+        self._heartbeat = asyncio.get_running_loop().create_task(
+            self._beat()
+        )
+        self._thread = threading.Thread(
+            target=self._watch,
+            name="loop-watchdog",
+            daemon=True,
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if not self.is_running:
+            return
+
+        self._stopped.set()
+        self._heartbeat.cancel()
+
+        try:
+            await self._heartbeat
+        except asyncio.CancelledError:
+            pass
+
+        self._heartbeat = None
+        self._thread.join()
+        self._thread = None
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            event_loop_lag_seconds.observe(max(now - expected, 0))
+
+            self._beat_at = now
+            self._sampled = False
+
+    def _watch(self) -> None:
+        # Checked more often than the loop beats, so a stall is
+        # sampled soon after it crosses the threshold
+        while not self._stopped.wait(self.interval / 2):
+            stalled_for = time.monotonic() - self._beat_at - self.interval
+
+            if stalled_for > self.threshold and not self._sampled:
+                self._sampled = True
+                self._sample(stalled_for)
+
+    def _sample(self, stalled_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+
+        if frame is None:
+            return
+
+        event_loop_stalls.inc()
+
+        logger.warning(
+            "Event loop blocked for %.0fms and counting, in:\n%s",
+            stalled_for * 1000,
+            "".join(traceback.format_stack(frame)),
+        )
+
+
+# Watches the loop of the process, API and worker processes each run
+# a single event loop
+loop_watchdog = LoopWatchdog(
+    interval=settings.watchdog.interval,
+    threshold=settings.watchdog.threshold,
+)
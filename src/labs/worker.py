@@ -0,0 +1,129 @@
+""" Worker entrypoint
+
+Starts the taskiq worker with the runtime configuration provided by
+the worker settings, this keeps the container environment as the
+single place where workers are tuned (see charts/worker).
+
+Any arguments are passed through to taskiq and take precedence
+e.g python -m labs.worker --log-level DEBUG
+
+Metrics recorded by the worker processes are served by this (parent)
+process on WORKER_METRICS_PORT, alongside the depth of the task queue
+which is used as the autoscaling signal for the workers.
+
+This is called from the command line via poetry scripts.
+"""
+import asyncio
+import os
+import shutil
+import sys
+from tempfile import gettempdir
+
+import aio_pika
+from taskiq.cli.worker.args import WorkerArgs
+from taskiq.cli.worker.run import run_worker
+
+from .settings import settings
+
+
+def worker_args(argv: list[str]) -> WorkerArgs:
+    """ Translate the worker settings to taskiq arguments
+    """
+    args = [
+        f"{__package__}.broker:broker",
+        "--workers", str(settings.worker.processes),
+        "--max-async-tasks", str(settings.worker.concurrency),
+        "--max-prefetch", str(settings.worker.prefetch),
+        "--wait-tasks-timeout", str(settings.worker.drain_timeout),
+        "--shutdown-timeout", str(settings.worker.shutdown_timeout),
+    ]
+
+    if settings.worker.max_tasks_per_child:
+        args += [
+            "--max-tasks-per-child",
+            str(settings.worker.max_tasks_per_child),
+        ]
+
+    return WorkerArgs.from_cli(args + argv)
+
+
+async def queue_depth() -> int:
+    """ Number of tasks waiting in the queue to be picked up
+    """
+    connection = await aio_pika.connect(str(settings.amqp.dsn))
+
+    async with connection:
+        channel = await connection.channel()
+        queue = await channel.declare_queue(
+            settings.amqp.queue_name,
+            passive=True,
+        )
+        return queue.declaration_result.message_count
+
+
+class QueueDepthCollector:
+    """ Reports the depth of the task queue when metrics are scraped
+
+    Only the parent process of each worker pod reports it, but every
+    pod reports the same depth of the one queue. Aggregate the series
+    across pods with max (e.g max(labs_task_queue_depth) in the rules
+    of prometheus-adapter), summing them counts the queue once per pod.
+    """
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        gauge = GaugeMetricFamily(
+            "labs_task_queue_depth",
+            "Tasks waiting in the queue, the same in every pod (use max)",
+        )
+
+        try:
+            gauge.add_metric([], asyncio.run(
+                asyncio.wait_for(queue_depth(), timeout=5)
+            ))
+        except Exception:
+            # No sample is better than a wrong one for autoscaling
+            pass
+
+        yield gauge
+
+
+def start_metrics_server():
+    """ Serve the metrics of all the worker processes
+
+    This must be called before prometheus_client is imported so
+    the worker processes record their metrics in multiprocess mode.
+    """
+    metrics_path = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(gettempdir(), f"{__package__}_worker_metrics"),
+    )
+
+    # Files left behind by a previous run would be counted again
+    shutil.rmtree(metrics_path, ignore_errors=True)
+    os.makedirs(metrics_path)
+
+    from prometheus_client import CollectorRegistry, start_http_server
+    from prometheus_client.multiprocess import MultiProcessCollector
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    registry.register(QueueDepthCollector())
+
+    start_http_server(settings.worker.metrics_port, registry=registry)
+
+
+def run():
+    """ Run the worker processes until they are stopped
+    """
+    start_metrics_server()
+
+    status = run_worker(worker_args(sys.argv[1:]))
+
+    if status is not None:
+        sys.exit(status)
+
+
+if __name__ == "__main__":
+    run()
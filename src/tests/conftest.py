@@ -27,3 +27,34 @@ def anyio_backend():
     https://taskiq-python.github.io/guide/testing-taskiq.html#async-tests
     """
     return 'asyncio'
+
+
+@pytest.fixture
+def query_budget():
+    """ Fail the test if a block runs more SQL statements than allowed
+
+    Usage:
+        def test_get_user(test_client, query_budget):
+            with query_budget(2):
+                test_client.get(f"/users/{id}")
+
+    The statements that were run are listed when the budget is
+    exceeded, see middleware/queries.py.
+    """
+    from contextlib import contextmanager
+
+    from labs.db import engine
+    from labs.middleware.queries import profile_queries, record_queries
+
+    @contextmanager
+    def budget(max_queries: int, engine=engine):
+        record_queries(engine)
+
+        with profile_queries(process_wide=True) as profile:
+            yield profile
+
+        assert profile.count <= max_queries, (
+            f"Query budget of {max_queries} exceeded, {profile.report()}"
+        )
+
+    return budget
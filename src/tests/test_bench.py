@@ -0,0 +1,65 @@
+""" Results of the load test harness
+
+"""
+import pytest
+
+from benchmarks.load import parser
+from benchmarks.results import Recorder, compare, percentile, regressions
+
+
+def test_percentiles_are_nearest_rank():
+    ordered = [float(value) for value in range(1, 101)]
+
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 95) == 95
+    assert percentile(ordered, 99) == 99
+    assert percentile([0.5], 99) == 0.5
+    assert percentile([], 50) == 0
+
+
+def test_summary_by_endpoint():
+    recorder = Recorder()
+
+    for latency in (0.01, 0.02, 0.03, 0.04):
+        recorder.record("GET /me", latency, ok=True)
+    recorder.record("POST /token", 0.2, ok=False)
+
+    summary = recorder.summary(duration=2.0)
+
+    assert summary["GET /me"]["requests"] == 4
+    assert summary["GET /me"]["throughput"] == 2.0
+    assert summary["GET /me"]["p50"] == 0.02
+    assert summary["GET /me"]["max"] == 0.04
+    assert summary["POST /token"]["errors"] == 1
+
+
+def results(throughput: float, p99: float) -> dict:
+    return {"endpoints": {"GET /me": {
+        "throughput": throughput,
+        "p50": 0.01,
+        "p95": 0.02,
+        "p99": p99,
+    }}}
+
+
+def test_regressions_beyond_the_tolerance():
+    changes = compare(results(1000, 0.05), results(950, 0.08))
+
+    assert [
+        (change.metric, round(change.ratio, 2))
+        for change in regressions(changes, tolerance=0.1)
+    ] == [("p99", 0.6)]
+
+
+def test_improvements_are_not_regressions():
+    changes = compare(results(1000, 0.05), results(2000, 0.01))
+
+    assert regressions(changes, tolerance=0.0) == []
+
+
+def test_scenario_weights_are_validated():
+    args = parser().parse_args(["run", "--scenario", "me=20"])
+    assert args.weights == [("me", 20)]
+
+    with pytest.raises(SystemExit):
+        parser().parse_args(["run", "--scenario", "unknown=1"])
@@ -0,0 +1,52 @@
+""" Serialising responses
+
+"""
+import json
+import uuid
+from datetime import datetime, timezone
+
+from pydantic import TypeAdapter
+
+from labs.dto import UserResponse, user_rows
+
+
+def user_row(**values) -> tuple:
+    now = datetime.now(timezone.utc)
+    row = dict(
+        created_at=now,
+        updated_at=now,
+        id=uuid.uuid4(),
+        email="ada@example.com",
+        mobile_number=None,
+        verified=True,
+        first_name="Ada",
+        last_name="Lovelace",
+    ) | values
+    return tuple(row[column] for column in user_rows.columns)
+
+
+def test_rows_serialise_as_the_model_does():
+    rows = [user_row(), user_row(mobile_number="+61400000000", last_name=None)]
+    adapter = TypeAdapter(list[UserResponse])
+
+    expected = adapter.dump_json(
+        adapter.validate_python([
+            dict(zip(user_rows.columns, row)) for row in rows
+        ]),
+        by_alias=True,
+    )
+
+    assert user_rows.dump_json(rows) == expected
+    assert json.loads(user_rows.dump_json(rows))[1]["mobileNumber"] == \
+        "+61400000000"
+
+
+def test_users_page_is_documented(test_client):
+    schema = test_client.get("/openapi.json").json()
+    response = schema["paths"]["/users"]["get"]["responses"]["200"]
+
+    response_schema = response["content"]["application/json"]["schema"]
+
+    assert response_schema["type"] == "array"
+    assert response_schema["items"] == \
+        {"$ref": "#/components/schemas/UserResponse"}
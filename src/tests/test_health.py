@@ -0,0 +1,64 @@
+""" Liveness and readiness checks
+
+"""
+import asyncio
+
+import pytest
+
+from labs.dto.ext import HealthCheckResponse
+from labs.health import HealthCheck
+
+
+def test_liveness(test_client):
+    response = test_client.get("/ext/health/live")
+
+    assert response.status_code == 200
+    assert response.json()["alive"] is True
+
+
+def test_timestamp_is_taken_per_response():
+    assert HealthCheckResponse().timestamp < HealthCheckResponse().timestamp
+
+
+@pytest.mark.anyio
+async def test_probes_fail_on_errors_and_timeouts():
+    async def ok():
+        pass
+
+    async def error():
+        raise ConnectionError("refused")
+
+    async def hangs():
+        await asyncio.sleep(10)
+
+    health = HealthCheck(
+        {"ok": ok, "error": error, "hangs": hangs},
+        timeout=0.05,
+    )
+
+    results = await asyncio.wait_for(health.check(), 1)
+
+    assert results["ok"].ok
+    assert results["error"].error == "ConnectionError: refused"
+    assert not results["hangs"].ok
+    assert results["hangs"].latency < 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_checks_share_cached_results():
+    calls = 0
+
+    async def probe():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+
+    health = HealthCheck({"probe": probe}, cache_ttl=60)
+
+    await asyncio.gather(*(health.check() for _ in range(10)))
+    await health.check()
+    assert calls == 1
+
+    health.cache_ttl = 0
+    await health.check()
+    assert calls == 2
@@ -0,0 +1,185 @@
+""" Deduplicating tasks queued with an idempotency key
+
+"""
+import pytest
+from taskiq import TaskiqMessage
+from taskiq.exceptions import SendTaskError
+
+from labs.broker import AppBroker
+from labs.middleware.idempotency import DUPLICATE_LABEL,\
+    IDEMPOTENCY_KEY_LABEL, IdempotencyMiddleware, is_duplicate
+
+
+class Redis:
+    """ The commands used by the middleware, expires keys on demand
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.expire_before_get = False
+        self.sets = []
+
+    async def set(self, key, value, nx=False, ex=None):
+        self.sets.append((key, value, nx, ex))
+
+        if nx and key in self.values:
+            return None
+
+        self.values[key] = value
+        return True
+
+    async def get(self, key):
+        if self.expire_before_get:
+            self.expire_before_get = False
+            self.values.pop(key, None)
+
+        return self.values.get(key)
+
+    async def eval(self, script, numkeys, key, task_id):
+        """ The release script, deletes the key if held by the task """
+        if self.values.get(key) == task_id:
+            del self.values[key]
+            return 1
+
+        return 0
+
+
+@pytest.fixture
+def middleware():
+    middleware = IdempotencyMiddleware("redis://localhost")
+    middleware.redis = Redis()
+    return middleware
+
+
+def message(task_id, idempotency_key=None, task_name="labs.send_email"):
+    labels = {}
+
+    if idempotency_key:
+        labels[IDEMPOTENCY_KEY_LABEL] = idempotency_key
+
+    return TaskiqMessage(
+        task_id=task_id,
+        task_name=task_name,
+        labels=labels,
+        args=[],
+        kwargs={},
+    )
+
+
+@pytest.mark.anyio
+async def test_messages_without_a_key_are_sent(middleware):
+    sent = await middleware.pre_send(message("a"))
+
+    assert sent.task_id == "a"
+    assert not is_duplicate(sent.labels)
+    assert middleware.redis.values == {}
+
+
+@pytest.mark.anyio
+async def test_first_message_claims_the_key(middleware):
+    sent = await middleware.pre_send(message("a", "user:verify"))
+
+    assert sent.task_id == "a"
+    assert not is_duplicate(sent.labels)
+    assert middleware.redis.values == {
+        "taskiq:idempotency:labs.send_email:user:verify": "a",
+    }
+    # Claimed only if no one has, for the window
+    assert middleware.redis.sets == [
+        ("taskiq:idempotency:labs.send_email:user:verify", "a", True, 300),
+    ]
+
+
+@pytest.mark.anyio
+async def test_duplicates_point_at_the_original_task(middleware):
+    await middleware.pre_send(message("a", "user:verify"))
+
+    duplicate = await middleware.pre_send(message("b", "user:verify"))
+
+    assert duplicate.task_id == "a"
+    assert duplicate.labels[DUPLICATE_LABEL] is True
+    assert is_duplicate(duplicate.labels)
+
+
+@pytest.mark.anyio
+async def test_retries_keep_their_task_id(middleware):
+    await middleware.pre_send(message("a", "user:verify"))
+
+    retry = await middleware.pre_send(message("a", "user:verify"))
+
+    assert retry.task_id == "a"
+    assert not is_duplicate(retry.labels)
+
+
+@pytest.mark.anyio
+async def test_keys_are_scoped_by_task(middleware):
+    await middleware.pre_send(message("a", "user:verify"))
+
+    other = await middleware.pre_send(
+        message("b", "user:verify", task_name="labs.send_sms")
+    )
+
+    assert other.task_id == "b"
+    assert not is_duplicate(other.labels)
+
+
+@pytest.mark.anyio
+async def test_key_expiring_before_it_is_read_is_claimed_again(middleware):
+    await middleware.pre_send(message("a", "user:verify"))
+    middleware.redis.expire_before_get = True
+
+    sent = await middleware.pre_send(message("b", "user:verify"))
+
+    assert sent.task_id == "b"
+    assert not is_duplicate(sent.labels)
+    assert middleware.redis.values[
+        "taskiq:idempotency:labs.send_email:user:verify"
+    ] == "b"
+
+
+@pytest.mark.anyio
+async def test_release_only_frees_the_key_of_the_task(middleware):
+    await middleware.pre_send(message("a", "user:verify"))
+
+    await middleware.release(message("b", "user:verify"))
+    assert middleware.redis.values
+
+    await middleware.release(message("a", "user:verify"))
+    assert middleware.redis.values == {}
+
+
+class PublisherPool:
+    """ Fails to publish the first message """
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        if not self.published:
+            self.published.append(None)
+            raise ConnectionError("Channel closed")
+
+        self.published.append(message.headers["task_id"])
+
+
+@pytest.mark.anyio
+async def test_failed_publish_can_be_sent_again(middleware):
+    broker = AppBroker("amqp://localhost")
+    broker.add_middlewares(middleware)
+    broker.publisher_pool = PublisherPool()
+
+    @broker.task(task_name="labs.send_email")
+    async def send_email():
+        pass
+
+    kicker = send_email.kicker().with_labels(idempotency_key="user:verify")
+
+    with pytest.raises(SendTaskError):
+        await kicker.with_task_id("a").kiq()
+
+    assert middleware.redis.values == {}
+
+    # Sent again by the caller, rather than dropped as a duplicate
+    await kicker.with_task_id("b").kiq()
+
+    assert broker.publisher_pool.published == [None, "b"]
@@ -0,0 +1,72 @@
+""" Rendering of image derivatives
+
+"""
+import io
+import uuid
+
+import pytest
+from PIL import Image
+
+from labs.imaging import render, render_derivatives, shutdown_image_executor
+from labs.models.s3 import derivative_s3_key
+
+
+@pytest.fixture
+def photo(tmp_path):
+    """ A landscape JPEG recorded as rotated by the camera
+    """
+    path = tmp_path / "photo.jpg"
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation, rotate 90 degrees clockwise
+
+    Image.new("RGB", (1600, 1200), "teal").save(path, exif=exif)
+    return str(path)
+
+
+def test_derivatives_are_rendered_largest_first(photo):
+    derivatives = render_derivatives(photo, [128, 512, 1024])
+
+    assert [d.name for d in derivatives] == ["1024", "512", "128"]
+
+    for derivative in derivatives:
+        image = Image.open(io.BytesIO(derivative.data))
+        assert image.format == "WEBP"
+        # Rotated according to the orientation, so portrait
+        assert image.size == (derivative.width, derivative.height)
+        assert max(image.size) == int(derivative.name)
+        assert image.height > image.width
+
+
+def test_images_are_never_enlarged(photo):
+    derivatives = render_derivatives(photo, [512, 4096])
+
+    assert [d.name for d in derivatives] == ["512"]
+
+
+def test_images_above_the_pixel_limit_are_rejected(photo):
+    with pytest.raises(ValueError):
+        render_derivatives(photo, [128], max_pixels=1000)
+
+
+@pytest.mark.anyio
+async def test_derivatives_are_rendered_in_the_process_pool(photo):
+    try:
+        derivatives = await render(photo, [128], processes=1)
+    finally:
+        shutdown_image_executor()
+
+    assert [d.name for d in derivatives] == ["128"]
+
+
+def test_derivative_keys_follow_the_original_record():
+    original_id = uuid.uuid4()
+
+    assert derivative_s3_key(original_id, "512").startswith("derived/")
+    assert derivative_s3_key(original_id, "512").endswith(
+        f"/{original_id}/512.webp"
+    )
+
+    # Records sharing an object have derivatives of their own
+    assert derivative_s3_key(uuid.uuid4(), "512") != \
+        derivative_s3_key(original_id, "512")
@@ -0,0 +1,50 @@
+""" Metrics of requests served by the API
+
+"""
+from prometheus_client import REGISTRY
+
+from labs.middleware.prometheus import UNMATCHED
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_labelled_by_route_template(test_client):
+    labels = dict(method="GET", route="/upload/{id}/download", status="401")
+    before = _sample("labs_http_request_duration_seconds_count", **labels)
+
+    test_client.get("/upload/0e7c1c4a-6a7e-4a57-9b0e-1d1f2f1b2b43/download")
+
+    assert _sample("labs_http_request_duration_seconds_count", **labels) == before + 1
+
+
+def test_unmatched_requests_share_a_label(test_client):
+    labels = dict(method="GET", route=UNMATCHED, status="404")
+    before = _sample("labs_http_request_duration_seconds_count", **labels)
+
+    test_client.get("/no/such/path/1")
+    test_client.get("/no/such/path/2")
+
+    assert _sample("labs_http_request_duration_seconds_count", **labels) == before + 2
+
+
+def test_response_sizes_are_recorded(test_client):
+    labels = dict(method="GET", route="/ext/echo")
+    before = _sample("labs_http_response_size_bytes_sum", **labels)
+
+    response = test_client.get("/ext/echo")
+
+    assert _sample("labs_http_response_size_bytes_sum", **labels) == \
+        before + len(response.content)
+
+
+def test_metrics_are_served(test_client):
+    test_client.get("/ext/echo")
+
+    response = test_client.get("/metrics/")
+
+    assert response.status_code == 200
+    assert "labs_http_request_duration_seconds_bucket" in response.text
+    assert "labs_db_pool_size" in response.text
+
@@ -0,0 +1,156 @@
+""" Relaying the transactional outbox to the broker
+
+"""
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from labs import outbox
+from labs.models import OutboxMessage
+from labs.outbox import record_attempts, retry_delay
+from labs.settings import settings
+
+
+class Stop(BaseException):
+    """ Ends the relay, which carries on through any Exception """
+
+
+class Connection:
+    async def add_listener(self, channel, callback):
+        pass
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def outbox_settings(monkeypatch):
+    for name, value in dict(
+        batch_size=100,
+        poll_interval=0.05,
+        max_attempts=3,
+        retry_backoff=0.01,
+        max_retry_backoff=0.04,
+    ).items():
+        monkeypatch.setattr(settings.outbox, name, value)
+
+    return settings.outbox
+
+
+@pytest.fixture
+def relay(monkeypatch, outbox_settings):
+    """ Runs the relay with relay_pending returning or raising results
+    """
+    async def connect(dsn):
+        return Connection()
+
+    async def nothing():
+        pass
+
+    monkeypatch.setattr(outbox.asyncpg, "connect", connect)
+    monkeypatch.setattr(outbox.broker, "startup", nothing)
+    monkeypatch.setattr(outbox.broker, "shutdown", nothing)
+
+    async def run(results: list) -> list[float]:
+        called_at = []
+
+        async def relay_pending():
+            called_at.append(time.monotonic())
+            result = results.pop(0)
+
+            if isinstance(result, BaseException):
+                raise result
+
+            return result
+
+        monkeypatch.setattr(outbox, "relay_pending", relay_pending)
+
+        with pytest.raises(Stop):
+            await outbox.run_relay()
+
+        return called_at
+
+    return run
+
+
+def message(attempts: int = 0) -> OutboxMessage:
+    return OutboxMessage(
+        id=uuid.uuid4(),
+        task_name="labs.send_email",
+        attempts=attempts,
+    )
+
+
+def test_retry_delay_doubles_up_to_the_max(outbox_settings):
+    assert [retry_delay(attempts) for attempts in range(1, 6)] == \
+        [0.01, 0.02, 0.04, 0.04, 0.04]
+
+
+def test_failed_messages_are_retried_later(outbox_settings):
+    sent, failed = message(), message(attempts=1)
+
+    sent_ids = record_attempts(
+        [sent, failed],
+        [None, ConnectionError("Broker unavailable")],
+    )
+
+    assert sent_ids == [sent.id]
+    assert sent.attempts == 0
+    assert sent.next_attempt_at is None
+    assert failed.attempts == 2
+    assert failed.next_attempt_at > datetime.now(timezone.utc)
+
+
+def test_messages_out_of_attempts_are_logged_as_errors(
+    outbox_settings,
+    caplog,
+):
+    exhausted = message(attempts=2)
+
+    with caplog.at_level(logging.WARNING, logger=outbox.__name__):
+        record_attempts([exhausted], [ConnectionError("Broker unavailable")])
+
+    assert exhausted.attempts == outbox_settings.max_attempts
+    assert [record.levelno for record in caplog.records] == [logging.ERROR]
+    assert "Giving up" in caplog.records[0].getMessage()
+
+
+@pytest.mark.anyio
+async def test_relay_drains_full_batches(relay):
+    called_at = await relay([100, 100, 20, Stop()])
+
+    # The outbox was drained at once, then the relay waited for more
+    assert called_at[2] - called_at[0] < 0.04
+    assert called_at[3] - called_at[2] >= 0.04
+
+
+@pytest.mark.anyio
+async def test_relay_waits_after_a_batch_with_failures(relay):
+    # 60 of a batch of 100 were sent
+    called_at = await relay([60, Stop()])
+
+    assert called_at[1] - called_at[0] >= 0.04
+
+
+@pytest.mark.anyio
+async def test_relay_backs_off_while_the_database_is_unavailable(
+    relay,
+    caplog,
+):
+    with caplog.at_level(logging.ERROR, logger=outbox.__name__):
+        called_at = await relay([
+            OSError("Connection refused"),
+            OSError("Connection refused"),
+            100,
+            0,
+            Stop(),
+        ])
+
+    assert len(caplog.records) == 2
+    assert called_at[1] - called_at[0] >= 0.01
+    assert called_at[2] - called_at[1] >= 0.02
+    # Recovered and drained at once
+    assert called_at[3] - called_at[2] < 0.04
@@ -0,0 +1,130 @@
+""" Offline presigning and the URL cache
+
+"""
+import base64
+import hashlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from minio.credentials import Credentials
+from minio.helpers import BaseURL
+from minio.signer import presign_v4
+
+from labs.utils.presign import Presigner, URLCache, checksum_headers
+
+DATE = datetime(2026, 10, 19, 9, 30, tzinfo=timezone.utc)
+
+
+def _presigner(**kwargs):
+    return Presigner(
+        "localhost:9000",
+        "access",
+        "secret",
+        "ap-south-1",
+        secure=False,
+        **kwargs,
+    )
+
+
+def test_presign_matches_minio_signer():
+    presigner = _presigner()
+    query_params = {
+        "response-content-disposition": 'attachment; filename="a b.pdf"'
+    }
+
+    url = BaseURL("http://localhost:9000", "ap-south-1").build(
+        method="GET",
+        region="ap-south-1",
+        bucket_name="labs",
+        object_name="f00d.pdf",
+        query_params=dict(query_params),
+    )
+    expected = urlunsplit(presign_v4(
+        method="GET",
+        url=url,
+        region="ap-south-1",
+        credentials=Credentials("access", "secret"),
+        date=DATE,
+        expires=300,
+    ))
+
+    assert presigner.presign(
+        "GET",
+        "labs",
+        "f00d.pdf",
+        300,
+        query_params=dict(query_params),
+        date=DATE,
+    ) == expected
+
+
+def test_signing_key_is_derived_once_per_day():
+    presigner = _presigner()
+
+    key = presigner.signing_key("20261019", "ap-south-1")
+    assert presigner.signing_key("20261019", "ap-south-1") is key
+
+    presigner.signing_key("20261020", "ap-south-1")
+    assert list(presigner._signing_keys) == [("20261020", "ap-south-1")]
+
+
+def test_presigned_urls_are_cached_per_disposition():
+    presigner = _presigner()
+    expires = timedelta(seconds=300)
+
+    first = presigner.presigned_get_object("labs", "key", expires, "inline")
+    assert presigner.presigned_get_object("labs", "key", expires, "inline") == first
+
+    other = presigner.presigned_get_object("labs", "key", expires, "attachment")
+    assert other != first
+    assert len(presigner.cache) == 2
+
+
+def test_short_lived_urls_are_not_cached():
+    presigner = _presigner(cache_margin=60)
+
+    presigner.presigned_put_object("labs", "key", timedelta(seconds=30))
+
+    assert len(presigner.cache) == 0
+
+
+def test_put_urls_with_a_checksum_sign_it_and_are_not_cached():
+    presigner = _presigner()
+    expires = timedelta(seconds=300)
+    digest = hashlib.sha256(b"labs").hexdigest()
+
+    url = presigner.presigned_put_object("labs", "key", expires, sha256=digest)
+    query = parse_qs(urlsplit(url).query)
+
+    assert query["X-Amz-SignedHeaders"] == ["host;x-amz-checksum-sha256"]
+    assert checksum_headers(digest) == {
+        "x-amz-checksum-sha256":
+            base64.b64encode(hashlib.sha256(b"labs").digest()).decode(),
+    }
+    assert len(presigner.cache) == 0
+
+    # The signature covers the checksum
+    other = hashlib.sha256(b"other").hexdigest()
+    assert presigner.presign(
+        "PUT", "labs", "key", 300, date=DATE,
+        headers=checksum_headers(digest),
+    ) != presigner.presign(
+        "PUT", "labs", "key", 300, date=DATE,
+        headers=checksum_headers(other),
+    )
+
+
+def test_url_cache_expires_and_evicts():
+    cache = URLCache(max_size=2)
+
+    cache.set("expired", "url", ttl=0)
+    assert cache.get("expired") is None
+
+    cache.set("a", "a", ttl=60)
+    cache.set("b", "b", ttl=60)
+    cache.get("a")
+    cache.set("c", "c", ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
@@ -0,0 +1,102 @@
+""" CPU and memory profiles
+
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from labs.profiler import ProfilerBusyError, SamplingProfiler, profile_cpu,\
+    profile_heap
+
+
+def spin_in_thread(stopped: threading.Event):
+    while not stopped.is_set():
+        sum(range(1000))
+
+
+def profile_spinning_thread(seconds: float = 0.1) -> SamplingProfiler:
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=spin_in_thread,
+        args=(stopped,),
+        name="spinner",
+    )
+    thread.start()
+
+    profiler = SamplingProfiler(interval=0.002)
+    profiler.start()
+    stopped.wait(seconds)
+    profiler.stop()
+
+    stopped.set()
+    thread.join()
+    return profiler
+
+
+def test_collapsed_stacks_start_with_the_thread():
+    profiler = profile_spinning_thread()
+
+    lines = [
+        line for line in profiler.collapsed().splitlines()
+        if line.startswith("spinner;")
+    ]
+
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "spin_in_thread (test_profiler.py:" in stack
+    assert int(count) > 0
+
+
+def test_speedscope_has_a_profile_per_thread():
+    profiler = profile_spinning_thread()
+
+    speedscope = profiler.speedscope()
+    profiles = {profile["name"]: profile for profile in speedscope["profiles"]}
+    frames = speedscope["shared"]["frames"]
+
+    assert "sampling-profiler" not in profiles
+    spinner = profiles["spinner"]
+    assert len(spinner["samples"]) == len(spinner["weights"])
+    assert any(
+        frames[index]["name"] == "spin_in_thread"
+        for sample in spinner["samples"]
+        for index in sample
+    )
+
+
+@pytest.mark.anyio
+async def test_one_cpu_profile_at_a_time():
+    running = asyncio.ensure_future(profile_cpu(0.1))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ProfilerBusyError):
+        await profile_cpu(0.1)
+
+    content, media_type = await running
+    assert media_type == "application/json"
+    assert json.loads(content)["profiles"]
+
+
+@pytest.mark.anyio
+async def test_heap_profile_finds_the_allocating_line():
+    retained = []
+
+    async def allocate():
+        await asyncio.sleep(0.02)
+        retained.extend(bytearray(1024) for _ in range(1000))
+
+    allocating = asyncio.ensure_future(allocate())
+    allocations = await profile_heap(0.1, limit=5)
+    await allocating
+
+    top = allocations[0]
+    assert top["file"] == __file__
+    assert top["size_diff"] >= 1024 * 1000
+
+
+def test_profiles_are_for_administrators(test_client):
+    response = test_client.get("/admin/profile/cpu", params={"seconds": 1})
+
+    assert response.status_code == 401
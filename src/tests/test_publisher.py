@@ -0,0 +1,124 @@
+""" Publishing messages through the pool of channels
+
+"""
+import asyncio
+
+import pytest
+from aio_pika import Message
+
+from labs.publisher import PublisherPool
+
+
+class Exchange:
+    """ Confirms messages after a delay, or fails those routed to fail
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(self.delay)
+
+        if routing_key == "fail":
+            raise ConnectionError("Channel closed")
+
+        self.published.append(routing_key)
+
+
+class Channel:
+    def __init__(self, exchange: Exchange):
+        self.exchange = exchange
+        self.closed = False
+
+    async def get_exchange(self, name, ensure=True):
+        return self.exchange
+
+    async def close(self):
+        self.closed = True
+
+
+class Connection:
+    def __init__(self, exchange: Exchange):
+        self.exchange = exchange
+        self.channels = []
+
+    async def channel(self, publisher_confirms=True):
+        self.channels.append(Channel(self.exchange))
+        return self.channels[-1]
+
+
+def pool(exchange: Exchange, **kwargs) -> PublisherPool:
+    kwargs = dict(
+        channels=2,
+        batch_size=10,
+        buffer_size=100,
+        await_confirm=True,
+        confirm_timeout=1,
+        drain_timeout=1,
+    ) | kwargs
+
+    return PublisherPool(Connection(exchange), "labs", **kwargs)
+
+
+@pytest.mark.anyio
+async def test_publish_awaits_confirms():
+    exchange = Exchange()
+    publisher = pool(exchange)
+    await publisher.start()
+
+    await asyncio.gather(*(
+        publisher.publish(Message(b"{}"), f"task.{index}")
+        for index in range(25)
+    ))
+    await publisher.stop()
+
+    assert sorted(exchange.published) == \
+        sorted(f"task.{index}" for index in range(25))
+    assert all(channel.closed for channel in publisher.connection.channels)
+    assert not publisher.is_running
+
+
+@pytest.mark.anyio
+async def test_publish_failures_are_raised_to_the_caller():
+    publisher = pool(Exchange())
+    await publisher.start()
+
+    with pytest.raises(ConnectionError):
+        await publisher.publish(Message(b"{}"), "fail")
+
+    # The failure doesn't stop the channel
+    await publisher.publish(Message(b"{}"), "task")
+    await publisher.stop()
+
+
+@pytest.mark.anyio
+async def test_publish_without_confirms_returns_once_buffered():
+    exchange = Exchange(delay=0.05)
+    publisher = pool(exchange, await_confirm=False)
+    await publisher.start()
+
+    await publisher.publish(Message(b"{}"), "task")
+    assert exchange.published == []
+
+    # Stopping publishes what is buffered
+    await publisher.stop()
+    assert exchange.published == ["task"]
+
+
+@pytest.mark.anyio
+async def test_stop_is_bounded_by_the_drain_timeout():
+    publisher = pool(Exchange(delay=60), confirm_timeout=60, drain_timeout=0.1)
+    await publisher.start()
+
+    waiting = [
+        asyncio.create_task(publisher.publish(Message(b"{}"), "task"))
+        for _ in range(30)
+    ]
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(publisher.stop(), timeout=5)
+
+    # Callers are told their messages were not published
+    results = await asyncio.gather(*waiting, return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
@@ -0,0 +1,78 @@
+""" Profiling of SQL statements per request
+
+Runs against SQLite so it does not need the database.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from labs.middleware.queries import QueryProfilerMiddleware, profile_queries,\
+    record_queries
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    record_queries(engine)
+    return engine
+
+
+def _run(engine, *statements):
+    with engine.connect() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def test_statements_are_counted_in_their_context(engine):
+    with profile_queries() as outer:
+        _run(engine, "SELECT 1")
+
+        with profile_queries() as inner:
+            _run(engine, "SELECT 2", "SELECT 3")
+
+    assert outer.count == 1
+    assert inner.count == 2
+    assert inner.duration > 0
+
+
+def test_repeated_statements_are_flagged(engine):
+    with profile_queries(repeat_threshold=3) as profile:
+        _run(engine, *["SELECT 1"] * 3, "SELECT 2")
+
+    assert profile.repeated == {"SELECT 1": 3}
+    assert "3x SELECT 1" in profile.report()
+
+
+def test_failed_statements_are_not_counted(engine):
+    with profile_queries() as profile:
+        with pytest.raises(Exception):
+            _run(engine, "SELECT * FROM missing")
+        _run(engine, "SELECT 1")
+
+    assert profile.count == 1
+
+
+def test_responses_carry_the_profile(engine):
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, repeat_threshold=2)
+
+    @app.get("/items")
+    def list_items():
+        _run(engine, "SELECT 1", "SELECT 1")
+        return []
+
+    response = TestClient(app).get("/items")
+
+    assert response.headers["X-DB-Query-Count"] == "2"
+    assert float(response.headers["X-DB-Query-Time"]) >= 0
+    assert response.headers["X-DB-Repeated-Queries"] == "1"
+
+
+def test_query_budget(engine, query_budget):
+    with query_budget(2, engine=engine):
+        _run(engine, "SELECT 1", "SELECT 2")
+
+    with pytest.raises(AssertionError, match="budget of 1 exceeded"):
+        with query_budget(1, engine=engine):
+            _run(engine, "SELECT 1", "SELECT 2")
@@ -0,0 +1,52 @@
+""" Routing of objects to buckets and sharded keys
+
+"""
+import pytest
+
+from labs.utils.routing import StorageRouter
+
+
+@pytest.fixture
+def storage_router():
+    return StorageRouter(
+        "labs",
+        buckets={"ugc": "labs-ugc", "media": "labs-media"},
+        shard_chars=2,
+    )
+
+
+def test_bucket_by_purpose(storage_router):
+    assert storage_router.bucket() == "labs"
+    assert storage_router.bucket("media") == "labs-media"
+    assert storage_router.bucket_names == {"labs", "labs-ugc", "labs-media"}
+
+    with pytest.raises(KeyError):
+        storage_router.bucket("unknown")
+
+
+def test_keys_are_sharded(storage_router):
+    shard, name = storage_router.key("photo.jpg").split("/")
+
+    assert len(shard) == 2
+    assert name.endswith(".jpg")
+    assert storage_router.shard(name) == shard
+
+
+def test_keys_keep_prefix(storage_router):
+    prefix, shard, name = storage_router.key("a.txt", prefix="/files/").split("/")
+
+    assert prefix == "files"
+    assert storage_router.shard(name) == shard
+
+
+def test_shards_are_spread_evenly(storage_router):
+    shards = {storage_router.key().split("/")[0] for _ in range(4096)}
+
+    # All 256 shards are used with overwhelming probability
+    assert len(shards) > 250
+
+
+def test_sharding_can_be_disabled():
+    storage_router = StorageRouter("labs", shard_chars=0)
+
+    assert "/" not in storage_router.key("a.txt")
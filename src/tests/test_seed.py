@@ -0,0 +1,85 @@
+""" Synthetic data for performance testing
+
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from labs.seed import FILE_COLUMNS, USER_COLUMNS, file_records, make_plan,\
+    run, user_id, user_records
+
+
+@pytest.fixture(scope="module")
+def plan():
+    # Hashing is skipped, the seeder hashes once per run
+    return make_plan(1000, seed=7, years=3, password_hash="hashed")
+
+
+def test_users_are_reproducible(plan):
+    assert user_records(plan, 100, 10) == user_records(plan, 100, 10)
+    assert user_records(plan, 0, 1) != user_records(plan, 1, 1)
+
+
+def test_users_are_unique_and_in_sign_up_order(plan):
+    users = user_records(plan, 0, 500) + user_records(plan, 500, 500)
+    column = {name: index for index, name in enumerate(USER_COLUMNS)}
+
+    assert all(len(user) == len(USER_COLUMNS) for user in users)
+    assert len({user[column["email"]] for user in users}) == len(users)
+    assert [user[column["id"]] for user in users[:3]] == \
+        [user_id(plan, index) for index in range(3)]
+
+    created = [user[column["created_at"]] for user in users]
+    assert created == sorted(created)
+    assert created[-1].timestamp() - created[0].timestamp() > 2.9 * 365 * 86400
+    assert all(
+        user[column["updated_at"]] >= user[column["created_at"]]
+        for user in users
+    )
+
+
+def test_files_belong_to_seeded_users(plan):
+    column = {name: index for index, name in enumerate(FILE_COLUMNS)}
+    users = {
+        user[0]: user[USER_COLUMNS.index("created_at")]
+        for user in user_records(plan, 0, plan.users)
+    }
+    files = file_records(plan, 0, 2000)
+
+    assert all(len(file) == len(FILE_COLUMNS) for file in files)
+
+    for file in files:
+        owner = file[column["created_by_user_id"]]
+        assert owner in users
+        assert file[column["created_at"]] >= users[owner]
+        assert file[column["file_size"]] > 0
+        assert file[column["s3_key"]].endswith(
+            file[column["file_name"]].rsplit(".", 1)[1]
+        )
+        assert file[column["deleted"]] == \
+            (file[column["deleted_at"]] is not None)
+
+
+def test_files_were_verified(plan):
+    column = {name: index for index, name in enumerate(FILE_COLUMNS)}
+    files = file_records(plan, 0, 2000)
+    upload_window = timedelta(seconds=plan.upload_window)
+
+    assert all(file[column["verified_at"]] for file in files)
+    assert any(not file[column["is_valid"]] for file in files)
+
+    for file in files:
+        if file[column["is_valid"]]:
+            assert file[column["upload_state"]] == "completed"
+        else:
+            # Found missing by the sweep, collected by the GC
+            assert file[column["upload_state"]] == "pending"
+            assert file[column["verified_at"]] >= min(
+                file[column["created_at"]] + upload_window,
+                datetime.fromtimestamp(plan.end, timezone.utc),
+            )
+
+
+def test_files_need_users():
+    with pytest.raises(SystemExit):
+        run(["--users", "0", "--files", "10"])
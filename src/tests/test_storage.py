@@ -0,0 +1,208 @@
+""" Verification of objects in the store
+
+The integration tests require the MinIO container (see docker-compose)
+and are skipped if the bucket is not reachable.
+"""
+import hashlib
+import io
+from datetime import timedelta
+from uuid import uuid4
+
+import httpx
+import pytest
+from minio.datatypes import Object
+
+from labs.settings import settings
+from labs.utils import minio_client, async_storage
+from labs.utils.s3 import AsyncStorage, part_layout
+from labs.utils.storage import object_matches_claim, stat_objects,\
+    remove_objects
+
+
+def _stat(size, content_type):
+    return Object(
+        settings.storage.bucket_name,
+        "key",
+        size=size,
+        content_type=content_type,
+    )
+
+
+def test_object_matches_claim():
+    assert object_matches_claim(_stat(10, "image/png"), 10, "image/png")
+    assert object_matches_claim(_stat(10, "Text/Plain; charset=utf-8"), 10, "text/plain")
+
+
+def test_object_does_not_match_claim():
+    assert not object_matches_claim(None, 10, "image/png")
+    assert not object_matches_claim(_stat(11, "image/png"), 10, "image/png")
+    assert not object_matches_claim(_stat(10, "image/jpeg"), 10, "image/png")
+
+
+def test_async_presigned_urls_match_minio():
+    """ Both clients sign the same way, so the URLs are interchangeable
+    """
+    bucket_name = settings.storage.bucket_name
+    s3_key = uuid4().hex + ".txt"
+    expires = timedelta(minutes=5)
+    response_headers = {
+        "response-content-disposition": 'attachment; filename="a b.txt"'
+    }
+
+    # Signatures carry the time in seconds, retry if the clock ticked
+    for _ in range(3):
+        minio_url = minio_client.presigned_get_object(
+            bucket_name,
+            s3_key,
+            expires=expires,
+            response_headers=dict(response_headers),
+        )
+        async_url = async_storage.presigned_get_object(
+            bucket_name,
+            s3_key,
+            expires=expires,
+            response_headers=dict(response_headers),
+        )
+        if minio_url == async_url:
+            break
+
+    assert minio_url == async_url
+
+
+@pytest.fixture
+def uploaded_object():
+    try:
+        minio_client.bucket_exists(settings.storage.bucket_name)
+    except Exception:
+        pytest.skip("object store is not available")
+
+    s3_key = uuid4().hex + ".txt"
+    content = b"labs"
+
+    minio_client.put_object(
+        settings.storage.bucket_name,
+        s3_key,
+        io.BytesIO(content),
+        len(content),
+        content_type="text/plain",
+    )
+
+    yield s3_key, len(content)
+
+    minio_client.remove_object(settings.storage.bucket_name, s3_key)
+
+
+@pytest.mark.anyio
+async def test_stat_objects(uploaded_object):
+    s3_key, size = uploaded_object
+    bucket_name = settings.storage.bucket_name
+
+    present, missing = await stat_objects(
+        minio_client,
+        [(bucket_name, s3_key), (bucket_name, uuid4().hex)],
+    )
+
+    assert object_matches_claim(present, size, "text/plain")
+    assert missing is None
+
+
+@pytest.mark.anyio
+async def test_async_stat_object(uploaded_object):
+    s3_key, size = uploaded_object
+    bucket_name = settings.storage.bucket_name
+
+    present = await async_storage.stat_object_or_none(bucket_name, s3_key)
+    missing = await async_storage.stat_object_or_none(bucket_name, uuid4().hex)
+
+    assert object_matches_claim(present, size, "text/plain")
+    assert missing is None
+
+    await async_storage.close()
+
+
+def test_part_layout():
+    mib = 1024 * 1024
+
+    assert part_layout(1, 16 * mib) == (16 * mib, 1)
+    assert part_layout(0, 16 * mib) == (16 * mib, 1)
+    assert part_layout(33 * mib, 16 * mib) == (16 * mib, 3)
+
+    # Parts are never smaller than the store allows
+    assert part_layout(12 * mib, 1 * mib) == (5 * mib, 3)
+
+    # Or more than 10,000 of them
+    part_size, part_count = part_layout(500 * 1024 * mib, 16 * mib)
+    assert part_count <= 10000
+    assert part_size % mib == 0
+    assert part_size * part_count >= 500 * 1024 * mib
+
+
+@pytest.mark.anyio
+async def test_list_parts_follows_pages():
+    """ The store returns at most 1000 parts a page
+    """
+    pages = {
+        None: (1, 2, "true"),
+        "2": (3, 3, "false"),
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        first, last, truncated = pages[
+            request.url.params.get("part-number-marker")
+        ]
+        parts = "".join(
+            f"<Part><PartNumber>{n}</PartNumber><ETag>\"e{n}\"</ETag>"
+            f"<Size>5</Size></Part>"
+            for n in range(first, last + 1)
+        )
+        return httpx.Response(200, content=(
+            '<ListPartsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<IsTruncated>{truncated}</IsTruncated>"
+            f"<NextPartNumberMarker>{last}</NextPartNumberMarker>"
+            f"{parts}</ListPartsResult>"
+        ).encode())
+
+    storage = AsyncStorage("localhost:9000", "access", "secret", "ap-south-1")
+    storage._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    parts = await storage.list_parts("labs", "key", "upload")
+
+    assert [(part.part_number, part.etag) for part in parts] == [
+        (1, "e1"), (2, "e2"), (3, "e3"),
+    ]
+
+    await storage.close()
+
+
+@pytest.mark.anyio
+async def test_object_sha256_streams_content():
+    content = b"labs" * 1024
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"].startswith("AWS4-HMAC-SHA256")
+        return httpx.Response(200, content=content)
+
+    storage = AsyncStorage("localhost:9000", "access", "secret", "ap-south-1")
+    storage._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    digest = await storage.object_sha256("labs", "key", chunk_size=100)
+
+    assert digest == hashlib.sha256(content).hexdigest()
+
+    await storage.close()
+
+
+@pytest.mark.anyio
+async def test_remove_objects(uploaded_object):
+    s3_key, _ = uploaded_object
+    bucket_name = settings.storage.bucket_name
+
+    # Objects that are already gone count as removed
+    failed = await remove_objects(
+        minio_client,
+        bucket_name,
+        [s3_key, uuid4().hex],
+    )
+
+    assert failed == set()
+    assert (await stat_objects(minio_client, [(bucket_name, s3_key)])) == [None]
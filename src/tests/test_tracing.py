@@ -0,0 +1,140 @@
+""" Tracing across the API, tasks, the database and the store
+
+Spans are recorded by an in memory exporter, the tracer provider can
+only be set once per process so it's shared by the tests.
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import\
+    InMemorySpanExporter
+from opentelemetry.trace import SpanKind, StatusCode
+from sqlalchemy import create_engine, text
+from taskiq import InMemoryBroker
+
+from labs.email import EmailSenderFactory
+from labs.middleware import TracingMiddleware
+from labs.tracing import configure_tracing, inject_trace_context,\
+    instrument_app, instrument_engine, tracer
+from labs.utils.s3 import AsyncStorage
+
+
+@pytest.fixture(scope="session")
+def exporter():
+    exporter = InMemorySpanExporter()
+    configure_tracing("labs-test", exporter=exporter)
+    return exporter
+
+
+@pytest.fixture
+def spans(exporter):
+    exporter.clear()
+    yield exporter.get_finished_spans
+    exporter.clear()
+
+
+def _named(spans, name):
+    return next(span for span in spans() if span.name == name)
+
+
+@pytest.mark.anyio
+async def test_tasks_continue_the_trace_of_the_sender(spans):
+    broker = InMemoryBroker().with_middlewares(TracingMiddleware())
+
+    @broker.task
+    async def traced_task() -> None:
+        with tracer.start_as_current_span("inside"):
+            pass
+
+    await broker.startup()
+
+    with tracer.start_as_current_span("request") as request:
+        task = await traced_task.kiq()
+
+    await task.wait_result(timeout=2)
+    await broker.shutdown()
+
+    run = _named(spans, f"run {traced_task.task_name}")
+    inside = _named(spans, "inside")
+
+    assert run.kind == SpanKind.CONSUMER
+    assert run.context.trace_id == request.get_span_context().trace_id
+    assert run.parent.span_id == request.get_span_context().span_id
+    assert inside.parent.span_id == run.context.span_id
+
+
+def test_labels_keep_the_context_they_carry(spans):
+    labels = {"traceparent": "00-" + "1" * 32 + "-" + "2" * 16 + "-01"}
+
+    with tracer.start_as_current_span("relay"):
+        assert inject_trace_context(dict(labels)) == labels
+        assert "traceparent" in inject_trace_context({})
+
+
+@pytest.mark.anyio
+async def test_store_requests_are_traced(spans):
+    storage = AsyncStorage("localhost:9000", "access", "secret", "ap-south-1")
+    storage._client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200))
+    )
+
+    with tracer.start_as_current_span("task") as task:
+        await storage.head_bucket("labs")
+
+    await storage.close()
+
+    request = _named(spans, "s3 HEAD")
+    assert request.kind == SpanKind.CLIENT
+    assert request.parent.span_id == task.get_span_context().span_id
+    assert request.attributes["aws.s3.bucket"] == "labs"
+    assert request.attributes["http.response.status_code"] == 200
+
+
+def test_statements_are_traced(spans):
+    # The instrumentation is set up once, it's moved from the engine of
+    # the app (which needs Postgres) to one that runs anywhere
+    SQLAlchemyInstrumentor().uninstrument()
+
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    statement = _named(spans, "SELECT")
+    assert statement.attributes["db.statement"] == "SELECT 1"
+
+
+def test_routes_are_traced(spans):
+    app = FastAPI()
+
+    @app.get("/items/{id}")
+    async def get_item(id: int):
+        return {"id": id}
+
+    @app.get("/ext/health/live")
+    async def live():
+        return {}
+
+    instrument_app(app)
+    client = TestClient(app)
+
+    client.get("/items/1")
+    client.get("/ext/health/live")
+
+    server = _named(spans, "GET /items/{id}")
+    assert server.kind == SpanKind.SERVER
+    assert not any("/ext/health" in span.name for span in spans())
+
+
+def test_smtp_sends_are_traced(spans):
+    sender = EmailSenderFactory(host="127.0.0.1", port=1)
+    sender.sender = "labs@example.com"
+
+    with pytest.raises(OSError):
+        sender.send(subject="Hello", receivers=["user@example.com"])
+
+    send = _named(spans, "smtp send")
+    assert send.status.status_code == StatusCode.ERROR
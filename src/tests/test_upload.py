@@ -0,0 +1,199 @@
+""" Requesting links to upload files
+
+"""
+import hashlib
+import uuid
+from contextlib import AsyncExitStack
+from types import SimpleNamespace
+
+import anyio
+import httpx
+import pytest
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+
+from labs.dto import FileUploadRequest
+from labs.models import S3Blob
+from labs.models.s3 import blob_s3_key, generate_s3_key
+from labs.routers.upload import _create_upload_urls
+from labs.routers.upload.download import DownloadResponse, single_range
+from labs.routers.upload.multipart import storage_errors
+from labs.settings import settings
+from labs.utils.s3 import StorageError
+
+
+def test_generate_s3_key_keeps_extension():
+    assert generate_s3_key("album/photo.JPG").endswith(".JPG")
+    assert "." not in generate_s3_key("README")
+    assert "." not in generate_s3_key(None)
+    assert generate_s3_key("a.txt") != generate_s3_key("a.txt")
+
+
+def test_batch_upload_requires_authentication(test_client):
+    response = test_client.post(
+        "/upload/batch",
+        json=[{"fileName": "a.txt", "fileSize": 4, "mimeType": "text/plain"}],
+    )
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_upload_request_sha256_must_be_a_hex_digest():
+    claim = {"fileName": "a.txt", "fileSize": 4, "mimeType": "text/plain"}
+
+    assert FileUploadRequest(**claim).sha256 is None
+    assert FileUploadRequest(**claim, sha256="A" * 64).sha256 == "A" * 64
+
+    with pytest.raises(ValidationError):
+        FileUploadRequest(**claim, sha256="not-a-digest")
+
+
+def test_blob_key_is_derived_from_owner_and_digest():
+    digest = hashlib.sha256(b"labs").hexdigest()
+    owner, other = uuid.uuid4(), uuid.uuid4()
+
+    assert blob_s3_key(digest, owner).startswith(f"sha256/{owner}/")
+    assert blob_s3_key(digest, owner).endswith(f"/{digest}")
+    assert blob_s3_key(digest, owner) == blob_s3_key(digest, owner)
+
+    # Users never share blobs
+    assert blob_s3_key(digest, owner) != blob_s3_key(digest, other)
+
+
+class Session:
+    """ Keeps the parameters of the statements executed
+    """
+
+    def __init__(self):
+        self.executed = []
+
+    async def execute(self, statement):
+        self.executed.append(
+            statement.compile(dialect=postgresql.dialect()).params
+        )
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.anyio
+async def test_uploads_of_the_same_content_keep_their_ids(monkeypatch):
+    digest = hashlib.sha256(b"labs").hexdigest()
+    user = SimpleNamespace(id=uuid.uuid4())
+    blob = SimpleNamespace(
+        id=uuid.uuid4(),
+        sha256=digest,
+        s3_key=blob_s3_key(digest, user.id),
+        is_valid=False,
+    )
+
+    async def acquire_many(session, bucket_name, user_id, claims):
+        return {digest: blob}
+
+    monkeypatch.setattr(settings.storage, "content_addressed", True)
+    monkeypatch.setattr(S3Blob, "acquire_many", acquire_many)
+    session = Session()
+
+    responses = await _create_upload_urls(session, user, [
+        FileUploadRequest(
+            file_name=file_name,
+            file_size=4,
+            mime_type="text/plain",
+            sha256=digest,
+        )
+        for file_name in ("a.txt", "b.txt")
+    ])
+
+    # Both records share the key of the blob, each is told its own id
+    [params] = session.executed
+    assert params["s3_key_m0"] == params["s3_key_m1"] == blob.s3_key
+    assert [response.id for response in responses] == \
+        [params["id_m0"], params["id_m1"]]
+    assert [params["file_name_m0"], params["file_name_m1"]] == \
+        ["a.txt", "b.txt"]
+    assert responses[0].id != responses[1].id
+
+
+def test_single_range():
+    assert single_range(None) is None
+    assert single_range("bytes=0-99") == "bytes=0-99"
+    assert single_range("bytes=100-") == "bytes=100-"
+    assert single_range("bytes=-500") == "bytes=-500"
+
+    # Anything else is ignored and the whole file is served
+    assert single_range("bytes=0-1,5-9") is None
+    assert single_range("bytes=9-1") is None
+    assert single_range("items=0-1") is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("fail_on", ["http.response.start", "http.response.body"])
+async def test_download_is_released_if_the_response_fails(fail_on):
+    released = []
+    stack = AsyncExitStack()
+    stack.callback(released.append, True)
+
+    async def body():
+        yield b"chunk"
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        if message["type"] == fail_on:
+            raise OSError("Client went away")
+
+    response = DownloadResponse(body(), stack)
+
+    with pytest.raises(Exception):
+        await response({"type": "http"}, receive, send)
+
+    assert released == [True]
+
+
+@pytest.mark.anyio
+async def test_download_is_released_once_sent():
+    released = []
+    stack = AsyncExitStack()
+    stack.callback(released.append, True)
+    sent = []
+
+    async def body():
+        yield b"chunk"
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        sent.append(message.get("body"))
+
+    await DownloadResponse(body(), stack)({"type": "http"}, receive, send)
+
+    assert b"chunk" in sent
+    assert released == [True]
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (StorageError(400, "InvalidPart", "Part 2 is missing"), 400),
+    (StorageError(503, "SlowDown"), 503),
+    (StorageError(500, "InternalError"), 503),
+    (StorageError(403, "AccessDenied"), 503),
+    (httpx.ConnectError("refused"), 503),
+    (ConnectionResetError(), 503),
+])
+def test_storage_errors(error, status_code):
+    with pytest.raises(HTTPException) as raised:
+        with storage_errors("Unable to complete the upload"):
+            raise error
+
+    assert raised.value.status_code == status_code
+
+
+def test_storage_errors_ignore():
+    with storage_errors("Unable to abort", ignore=("NoSuchUpload",)):
+        raise StorageError(404, "NoSuchUpload")
+
+    with pytest.raises(HTTPException):
+        with storage_errors("Unable to abort", ignore=("NoSuchUpload",)):
+            raise StorageError(500, "InternalError")
@@ -0,0 +1,50 @@
+""" Event loop watchdog
+
+"""
+import asyncio
+import logging
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from labs.watchdog import LoopWatchdog
+
+
+def hash_without_yielding():
+    time.sleep(0.3)
+
+
+@pytest.mark.anyio
+async def test_blocking_calls_are_sampled(caplog):
+    stalls = REGISTRY.get_sample_value("labs_event_loop_stalls_total") or 0
+    watchdog = LoopWatchdog(interval=0.02, threshold=0.1)
+
+    with caplog.at_level(logging.WARNING, logger="labs.watchdog"):
+        watchdog.start()
+        await asyncio.sleep(0.05)
+
+        hash_without_yielding()
+
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+
+    assert len(caplog.records) == 1
+    assert "hash_without_yielding" in caplog.records[0].getMessage()
+    assert REGISTRY.get_sample_value("labs_event_loop_stalls_total") == \
+        stalls + 1
+    assert not watchdog.is_running
+
+
+@pytest.mark.anyio
+async def test_lag_is_recorded_while_idle(caplog):
+    count = REGISTRY.get_sample_value("labs_event_loop_lag_seconds_count") or 0
+    watchdog = LoopWatchdog(interval=0.01, threshold=0.1)
+
+    with caplog.at_level(logging.WARNING, logger="labs.watchdog"):
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        await watchdog.stop()
+
+    assert not caplog.records
+    assert REGISTRY.get_sample_value("labs_event_loop_lag_seconds_count") > count
@@ -0,0 +1,103 @@
+""" Running and recycling worker processes
+
+"""
+import signal
+
+import pytest
+from taskiq import TaskiqMessage, TaskiqResult
+
+from labs import worker
+from labs.middleware import recycle
+from labs.middleware.recycle import RecycleMiddleware, resident_memory_mb
+from labs.settings import settings
+
+
+@pytest.fixture
+def worker_settings(monkeypatch):
+    for name, value in dict(
+        processes=3,
+        concurrency=20,
+        prefetch=5,
+        drain_timeout=45,
+        shutdown_timeout=8,
+        max_tasks_per_child=None,
+    ).items():
+        monkeypatch.setattr(settings.worker, name, value)
+
+    return settings.worker
+
+
+def test_worker_args_follow_settings(worker_settings):
+    args = worker.worker_args([])
+
+    assert args.broker == "labs.broker:broker"
+    assert args.workers == 3
+    assert args.max_async_tasks == 20
+    assert args.max_prefetch == 5
+    assert args.wait_tasks_timeout == 45
+    assert args.shutdown_timeout == 8
+    assert args.max_tasks_per_child is None
+
+
+def test_worker_args_recycle_after_tasks(worker_settings):
+    worker_settings.max_tasks_per_child = 1000
+
+    assert worker.worker_args([]).max_tasks_per_child == 1000
+
+
+def test_worker_args_take_precedence(worker_settings):
+    args = worker.worker_args(["--workers", "1", "--max-prefetch", "0"])
+
+    assert args.workers == 1
+    assert args.max_prefetch == 0
+    assert args.max_async_tasks == 20
+
+
+def test_resident_memory():
+    assert resident_memory_mb() > 1
+
+
+@pytest.fixture
+def kills(monkeypatch):
+    kills = []
+    monkeypatch.setattr(
+        recycle.os,
+        "kill",
+        lambda pid, sig: kills.append((pid, sig)),
+    )
+    return kills
+
+
+def finish(middleware: RecycleMiddleware) -> None:
+    middleware.post_execute(
+        TaskiqMessage(
+            task_id="a",
+            task_name="labs.task",
+            labels={},
+            args=[],
+            kwargs={},
+        ),
+        TaskiqResult(is_err=False, return_value=None, execution_time=0.1),
+    )
+
+
+def test_recycle_under_the_limit(monkeypatch, kills):
+    monkeypatch.setattr(recycle, "resident_memory_mb", lambda: 100)
+    middleware = RecycleMiddleware(max_rss_mb=512)
+
+    finish(middleware)
+
+    assert kills == []
+    assert not middleware.recycling
+
+
+def test_recycle_over_the_limit_once(monkeypatch, kills):
+    monkeypatch.setattr(recycle, "resident_memory_mb", lambda: 600)
+    middleware = RecycleMiddleware(max_rss_mb=512)
+
+    finish(middleware)
+    finish(middleware)
+
+    # Tasks still draining finish without signalling again
+    assert [sig for _, sig in kills] == [signal.SIGTERM]
+    assert middleware.recycling